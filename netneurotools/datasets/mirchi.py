@@ -9,6 +9,7 @@ from urllib.request import HTTPError, urlopen
 import numpy as np
 
 from .utils import _get_data_dir
+from ..stats import OnlineCorrelation
 
 
 TIMESERIES = ("https://s3.amazonaws.com/openneuro/ds000031/ds000031_R1.0.2"
@@ -83,23 +84,26 @@ def _get_fc(data_dir=None, resume=True, verbose=1):
         Functional connections (lower triangle)
     """
 
-    # download time series data for all sessions
-    ts = []
+    # stream time series data for each session, accumulating correlations as
+    # chunks of time points are downloaded
+    fc = []
     for ses in SESSIONS:
         if verbose > 0:
             print('Fetching time series for session {}'.format(ses))
         out = urlopen(TIMESERIES.format(ses))
-        if out.status == 200:
-            ts.append(np.loadtxt(out.readlines()))
-        else:
+        if out.status != 200:
             raise HTTPError('Failed to fetch time series data: session {}'
                             .format(ses))
+        acc = OnlineCorrelation()
+        for lines in iter(lambda: out.readlines(2 ** 20), []):
+            acc.update(np.loadtxt(lines, ndmin=2))
 
-    # get upper triangle of correlation matrix for each session
-    fc = [np.corrcoef(ses.T)[np.tril_indices(len(ses.T), k=-1)] for ses in ts]
+        # get lower triangle of correlation matrix for each session
+        corr = acc.corrcoef()
+        fc.append(corr[np.tril_indices(len(corr), k=-1)])
 
     # return stacked sessions
-    return np.row_stack(fc)
+    return np.vstack(fc)
 
 
 def _get_panas(data_dir=None, resume=True, verbose=1):
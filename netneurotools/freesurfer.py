@@ -16,7 +16,7 @@ from scipy.spatial.distance import cdist
 from .datasets import fetch_fsaverage
 from .stats import gen_spinsamples
 from .surface import make_surf_graph
-from .utils import check_fs_subjid, run
+from .utils import _Checkpoint, _float_dtype, check_fs_subjid, run
 
 FSIGNORE = [
     'unknown', 'corpuscallosum', 'Background+FreeSurfer_Defined_Medial_Wall'
@@ -271,7 +271,8 @@ def parcels_to_vertices(data, *, lhannot, rhannot, drop=None):
         drop = FSIGNORE
     drop = _decode_list(drop)
 
-    data = np.vstack(data).astype(float)
+    data = np.vstack(data)
+    data = data.astype(_float_dtype(data.dtype), copy=False)
 
     # check this so we're not unduly surprised by anything...
     n_vert = expected = 0
@@ -430,7 +431,7 @@ def _get_fsaverage_coords(version='fsaverage', surface='sphere'):
 
 
 def _get_fsaverage_spins(version='fsaverage', spins=None, n_rotate=1000,
-                         **kwargs):
+                         checkpoint=None, **kwargs):
     """
     Generates spatial permutation resamples for fsaverage `version`
 
@@ -452,6 +453,9 @@ def _get_fsaverage_spins(version='fsaverage', spins=None, n_rotate=1000,
         Whether to return cost array (specified as Euclidean distance) for each
         coordinate for each rotation. Currently this option is not supported if
         pre-computed `spins` are provided. Default: True
+    checkpoint : str or os.PathLike, optional
+        Filepath where progress generating spins should be periodically saved.
+        Default: None
     kwargs : key-value pairs
         Keyword arguments passed to `netneurotools.stats.gen_spinsamples`
 
@@ -464,7 +468,7 @@ def _get_fsaverage_spins(version='fsaverage', spins=None, n_rotate=1000,
     if spins is None:
         coords, hemiid = _get_fsaverage_coords(version, 'sphere')
         spins = gen_spinsamples(coords, hemiid, n_rotate=n_rotate,
-                                **kwargs)
+                                checkpoint=checkpoint, **kwargs)
         if kwargs.get('return_cost'):
             return spins
 
@@ -480,7 +484,8 @@ def _get_fsaverage_spins(version='fsaverage', spins=None, n_rotate=1000,
 
 
 def spin_data(data, *, lhannot, rhannot, version='fsaverage', n_rotate=1000,
-              spins=None, drop=None, verbose=False, **kwargs):
+              spins=None, drop=None, verbose=False, checkpoint=None,
+              **kwargs):
     """
     Projects parcellated `data` to surface, rotates, and re-parcellates
 
@@ -516,13 +521,20 @@ def spin_data(data, *, lhannot, rhannot, version='fsaverage', n_rotate=1000,
         are assumed to not be present. Default: None
     verbose : bool, optional
         Whether to print occasional status messages. Default: False
+    checkpoint : str or os.PathLike, optional
+        Filepath where progress should be periodically saved. If the function
+        is interrupted, calling it again with the same inputs and `checkpoint`
+        will resume from the last save and yield results identical to those of
+        an uninterrupted call. While spins are being generated progress is
+        saved to `checkpoint` + '.spins'. Checkpoints are removed once the
+        function finishes. Default: None
     kwargs : key-value pairs
         Keyword arguments passed to `netneurotools.stats.gen_spinsamples`
 
     Returns
     -------
     rotated : (N, `n_rotate`) numpy.ndarray
-        Rotated `data
+        Rotated `data`, with the floating point precision of `data`
     cost : (N, `n_rotate`,) numpy.ndarray
         Cost (specified as Euclidean distance) of re-assigning each coordinate
         for every rotation in `spinsamples`. Only provided if `return_cost` is
@@ -536,10 +548,28 @@ def spin_data(data, *, lhannot, rhannot, version='fsaverage', n_rotate=1000,
     vertices = parcels_to_vertices(data, lhannot=lhannot, rhannot=rhannot,
                                    drop=drop)
 
-    # get spins + cost (if requested)
-    spins, cost = _get_fsaverage_spins(version=version, spins=spins,
-                                       n_rotate=n_rotate,
-                                       verbose=verbose, **kwargs)
+    # resume from the last checkpoint, if any; rotated data keep the floating
+    # point precision of `data`
+    spun = np.zeros(data.shape + (n_rotate,), dtype=vertices.dtype)
+    done, state = 0, None
+    if checkpoint is not None:
+        checkpoint = _Checkpoint(checkpoint, 'spin_data', data, lhannot,
+                                 rhannot, version, n_rotate, spins, drop,
+                                 kwargs)
+        state = checkpoint.load()
+    if state is not None:
+        spins, cost = state['spins'], state.get('cost')
+        done = int(state['done'])
+        spun[..., :done] = state['spun']
+    else:
+        # get spins + cost (if requested), saving progress to a separate file
+        spin_checkpoint = None
+        if checkpoint is not None:
+            spin_checkpoint = checkpoint.path + '.spins'
+        spins, cost = _get_fsaverage_spins(version=version, spins=spins,
+                                           n_rotate=n_rotate, verbose=verbose,
+                                           checkpoint=spin_checkpoint,
+                                           **kwargs)
     if len(vertices) != len(spins):
         raise ValueError('Provided annotation files have a different '
                          'number of vertices than the specified fsaverage '
@@ -547,14 +577,23 @@ def spin_data(data, *, lhannot, rhannot, version='fsaverage', n_rotate=1000,
                          'FSAVERAGE:  {} vertices'
                          .format(len(vertices), len(spins)))
 
-    spun = np.zeros(data.shape + (n_rotate,))
-    for n in range(n_rotate):
+    msg = ''
+    for n in range(done, n_rotate):
         if verbose:
             msg = f'Reducing vertices to parcels: {n:>5}/{n_rotate}'
             print(msg, end='\b' * len(msg), flush=True)
         spun[..., n] = vertices_to_parcels(vertices[spins[:, n]],
                                            lhannot=lhannot, rhannot=rhannot,
                                            drop=drop)
+        if checkpoint is not None:
+            # always save once the (expensive) spins have been generated.
+            # these (and `cost`) are never modified so are only written once
+            checkpoint.save(force=n == done, done=n + 1,
+                            columns=dict(spins=spins, cost=cost,
+                                         spun=spun[..., :n + 1]))
+
+    if checkpoint is not None:
+        checkpoint.remove()
 
     if verbose:
         print(' ' * len(msg) + '\b' * len(msg), end='', flush=True)
@@ -566,7 +605,8 @@ def spin_data(data, *, lhannot, rhannot, version='fsaverage', n_rotate=1000,
 
 
 def spin_parcels(*, lhannot, rhannot, version='fsaverage', n_rotate=1000,
-                 spins=None, drop=None, verbose=False, **kwargs):
+                 spins=None, drop=None, verbose=False, checkpoint=None,
+                 **kwargs):
     """
     Rotates parcels in `{lh,rh}annot` and re-assigns based on maximum overlap
 
@@ -601,6 +641,13 @@ def spin_parcels(*, lhannot, rhannot, version='fsaverage', n_rotate=1000,
     return_cost : bool, optional
         Whether to return cost array (specified as Euclidean distance) for each
         coordinate for each rotation. Default: True
+    checkpoint : str or os.PathLike, optional
+        Filepath where progress should be periodically saved. If the function
+        is interrupted, calling it again with the same inputs and `checkpoint`
+        will resume from the last save and yield results identical to those of
+        an uninterrupted call. While spins are being generated progress is
+        saved to `checkpoint` + '.spins'. Checkpoints are removed once the
+        function finishes. Default: None
     kwargs : key-value pairs
         Keyword arguments passed to `netneurotools.stats.gen_spinsamples`
 
@@ -646,10 +693,26 @@ def spin_parcels(*, lhannot, rhannot, version='fsaverage', n_rotate=1000,
     labels = np.unique(vertices)
     mask = labels > -1
 
-    # get spins + cost (if requested)
-    spins, cost = _get_fsaverage_spins(version=version, spins=spins,
-                                       n_rotate=n_rotate, verbose=verbose,
-                                       **kwargs)
+    # resume from the last checkpoint, if any
+    regions = np.zeros((len(labels[mask]), n_rotate), dtype='int32')
+    done, state = 0, None
+    if checkpoint is not None:
+        checkpoint = _Checkpoint(checkpoint, 'spin_parcels', lhannot, rhannot,
+                                 version, n_rotate, spins, drop, kwargs)
+        state = checkpoint.load()
+    if state is not None:
+        spins, cost = state['spins'], state.get('cost')
+        done = int(state['done'])
+        regions[:, :done] = state['regions']
+    else:
+        # get spins + cost (if requested), saving progress to a separate file
+        spin_checkpoint = None
+        if checkpoint is not None:
+            spin_checkpoint = checkpoint.path + '.spins'
+        spins, cost = _get_fsaverage_spins(version=version, spins=spins,
+                                           n_rotate=n_rotate, verbose=verbose,
+                                           checkpoint=spin_checkpoint,
+                                           **kwargs)
     if len(vertices) != len(spins):
         raise ValueError('Provided annotation files have a different '
                          'number of vertices than the specified fsaverage '
@@ -658,13 +721,21 @@ def spin_parcels(*, lhannot, rhannot, version='fsaverage', n_rotate=1000,
                          .format(len(vertices), len(spins)))
 
     # spin and assign regions based on max overlap
-    regions = np.zeros((len(labels[mask]), n_rotate), dtype='int32')
-    for n in range(n_rotate):
+    for n in range(done, n_rotate):
         if verbose:
             msg = f'Calculating parcel overlap: {n:>5}/{n_rotate}'
             print(msg, end='\b' * len(msg), flush=True)
         regions[:, n] = labeled_comprehension(vertices[spins[:, n]], vertices,
                                               labels, overlap, int, -1)[mask]
+        if checkpoint is not None:
+            # always save once the (expensive) spins have been generated.
+            # these (and `cost`) are never modified so are only written once
+            checkpoint.save(force=n == done, done=n + 1,
+                            columns=dict(spins=spins, cost=cost,
+                                         regions=regions[:, :n + 1]))
+
+    if checkpoint is not None:
+        checkpoint.remove()
 
     if kwargs.get('return_cost'):
         return regions, cost
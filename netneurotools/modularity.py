@@ -3,10 +3,11 @@
 Functions for working with network modularity
 """
 
+import functools
+
 import bct
 import numpy as np
-from sklearn.utils.validation import check_random_state
-from . import cluster
+from . import cluster, utils
 
 try:
     from numba import njit, prange
@@ -234,7 +235,39 @@ def get_modularity(adjacency, comm, gamma=1):
     return comm_q
 
 
-def get_modularity_z(adjacency, comm, gamma=1, n_perm=10000, seed=None):
+def _permuted_modularity(adjacency, comm, gamma, rs, start, stop):
+    """
+    Returns modularity of communities for permutations `start` to `stop`
+    """
+
+    simu_qs = np.empty(shape=(np.unique(comm).size, stop - start))
+    for perm in range(stop - start):
+        simu_qs[:, perm] = get_modularity(adjacency,
+                                          rs.permutation(comm),
+                                          gamma)
+
+    return simu_qs
+
+
+def _null_modularity(adjacency, comm, gamma=1, n_perm=10000, seed=None,
+                     n_jobs=None):
+    """
+    Generates null distribution of modularity by permuting `comm`
+
+    Returns
+    -------
+    simu_qs : (G, n_perm) numpy.ndarray
+        Modularity of each community for every permutation
+    """
+
+    func = functools.partial(_permuted_modularity, adjacency, comm, gamma)
+
+    return np.column_stack(utils._parallel_permutations(func, n_perm, seed,
+                                                        n_jobs))
+
+
+def get_modularity_z(adjacency, comm, gamma=1, n_perm=10000, seed=None,
+                     n_jobs=None):
     """
     Calculates average z-score of community assignments by permutation
 
@@ -251,6 +284,12 @@ def get_modularity_z(adjacency, comm, gamma=1, n_perm=10000, seed=None):
         Number of permutations. Default: 10000
     seed : {int, np.random.RandomState instance, None}, optional
         Seed for random number generation. Default: None
+    n_jobs : int, optional
+        Number of processes used to compute permutations in parallel. If
+        specified, permutations are generated in chunks from independent
+        random streams spawned from `seed`, such that results do not depend on
+        `n_jobs` (but differ from those obtained when `n_jobs` is None).
+        Default: None
 
     Returns
     -------
@@ -263,14 +302,8 @@ def get_modularity_z(adjacency, comm, gamma=1, n_perm=10000, seed=None):
     netneurotools.modularity.get_modularity_sig
     """
 
-    rs = check_random_state(seed)
-
     real_qs = get_modularity(adjacency, comm, gamma)
-    simu_qs = np.empty(shape=(np.unique(comm).size, n_perm))
-    for perm in range(n_perm):
-        simu_qs[:, perm] = get_modularity(adjacency,
-                                          rs.permutation(comm),
-                                          gamma)
+    simu_qs = _null_modularity(adjacency, comm, gamma, n_perm, seed, n_jobs)
 
     # avoid instances where dist.std(1) == 0
     std = simu_qs.std(axis=1)
@@ -281,7 +314,7 @@ def get_modularity_z(adjacency, comm, gamma=1, n_perm=10000, seed=None):
 
 
 def get_modularity_sig(adjacency, comm, gamma=1, n_perm=10000, alpha=0.01,
-                       seed=None):
+                       seed=None, n_jobs=None):
     """
     Calculates signifiance of community assignments in `comm` by permutation
 
@@ -299,6 +332,12 @@ def get_modularity_sig(adjacency, comm, gamma=1, n_perm=10000, alpha=0.01,
         Alpha level to assess signifiance. Default: 0.01
     seed : {int, np.random.RandomState instance, None}, optional
         Seed for random number generation. Default: None
+    n_jobs : int, optional
+        Number of processes used to compute permutations in parallel. If
+        specified, permutations are generated in chunks from independent
+        random streams spawned from `seed`, such that results do not depend on
+        `n_jobs` (but differ from those obtained when `n_jobs` is None).
+        Default: None
 
     Returns
     -------
@@ -311,14 +350,8 @@ def get_modularity_sig(adjacency, comm, gamma=1, n_perm=10000, alpha=0.01,
     netneurotools.modularity.get_modularity_sig
     """
 
-    rs = check_random_state(seed)
-
     real_qs = get_modularity(adjacency, comm, gamma)
-    simu_qs = np.empty(shape=(np.unique(comm).size, n_perm))
-    for perm in range(n_perm):
-        simu_qs[:, perm] = get_modularity(adjacency,
-                                          rs.permutation(comm),
-                                          gamma)
+    simu_qs = _null_modularity(adjacency, comm, gamma, n_perm, seed, n_jobs)
 
     q_sig = real_qs > np.percentile(simu_qs, 100 * (1 - alpha), axis=1)
 
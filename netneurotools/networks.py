@@ -42,7 +42,8 @@ def func_consensus(data, n_boot=1000, ci=95, seed=None):
     Returns
     -------
     consensus : (N, N) numpy.ndarray
-        Thresholded, group-level correlation matrix
+        Thresholded, group-level correlation matrix, with the floating point
+        precision of `data`
 
     References
     ----------
@@ -57,6 +58,13 @@ def func_consensus(data, n_boot=1000, ci=95, seed=None):
     if ci > 100 or ci < 0:
         raise ValueError("`ci` must be between 0 and 100.")
 
+    # correlations are computed in double precision but returned (and stored)
+    # with the floating point precision of `data`
+    if isinstance(data, list):
+        dtype = utils._float_dtype(*[np.asarray(sub).dtype for sub in data])
+    else:
+        dtype = utils._float_dtype(data.dtype)
+
     # group-average functional connectivity matrix desired instead of bootstrap
     if n_boot == 0 or n_boot is None:
         if isinstance(data, list):
@@ -64,7 +72,7 @@ def func_consensus(data, n_boot=1000, ci=95, seed=None):
         else:
             corrs = [np.corrcoef(data[..., sub]) for sub in
                      range(data.shape[-1])]
-        return np.nanmean(corrs, axis=0)
+        return np.nanmean(corrs, axis=0).astype(dtype, copy=False)
 
     if isinstance(data, list):
         collapsed_data = np.hstack(data)
@@ -73,11 +81,11 @@ def func_consensus(data, n_boot=1000, ci=95, seed=None):
         collapsed_data = data.reshape((len(data), -1), order='F')
         nsample = data.shape[1]
 
-    consensus = np.corrcoef(collapsed_data)
+    consensus = np.corrcoef(collapsed_data).astype(dtype, copy=False)
 
     # only keep the upper triangle for the bootstraps to save on memory usage
     triu_inds = np.triu_indices_from(consensus, k=1)
-    bootstrapped_corrmat = np.zeros((len(triu_inds[0]), n_boot))
+    bootstrapped_corrmat = np.zeros((len(triu_inds[0]), n_boot), dtype=dtype)
 
     # generate `n_boot` bootstrap correlation matrices by sampling `t` time
     # points from the concatenated time series
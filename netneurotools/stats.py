@@ -3,15 +3,51 @@
 Functions for performing statistical preprocessing and analyses
 """
 
+import functools
+import hashlib
+import heapq
 import warnings
 
+from joblib import Parallel, delayed, effective_n_jobs
 import numpy as np
-from scipy import optimize, spatial, special, stats as sstats
+from scipy import optimize, sparse, spatial, special, stats as sstats
+from scipy.sparse import csgraph
 from scipy.stats.stats import _chk2_asarray
 from sklearn.utils.validation import check_random_state
 
 from . import utils
 
+try:
+    from numba import njit
+    use_numba = True
+except ImportError:
+    use_numba = False
+
+# default memory budget (in bytes) for arrays generated by batched permutations
+_MAX_MEMORY = 2 ** 28
+# maximum number of sign flips enumerated to compute exact p-values
+_MAX_EXACT_FLIPS = 2 ** 30
+# maximum batch size for sequential (i.e., early-stopping) permutation tests
+_SEQUENTIAL_BATCH = 100
+# fraction of the null distribution used for tail approximations
+_TAIL_FRACTION = 0.1
+# fraction of exceedances dropped each time a tail approximation is rejected
+_TAIL_STEP = 0.1
+# minimum number of exceedances to which a tail approximation is fit
+_TAIL_MIN_EXCEED = 10
+# critical values (alpha = 0.05) of the Anderson-Darling statistic for the
+# generalized Pareto distribution by shape (Choulakian & Stephens, 2001)
+_GPD_ANDERSON_CRITICAL = (
+    [-0.9, -0.5, -0.2, -0.1, 0, 0.1, 0.2, 0.3, 0.4, 0.5],
+    [0.771, 0.830, 0.903, 0.935, 0.974, 1.020, 1.074, 1.140, 1.221, 1.321]
+)
+# number of histogram bins used to approximate medians
+_MEDIAN_BINS = 1024
+# initial number of nearest neighbors considered by sparse Hungarian spins
+_SPIN_NEIGHBORS = 16
+# number of levels to which distances are quantized for sparse Hungarian spins
+_SPIN_RESOLUTION = 2 ** 30
+
 
 def residualize(X, Y, Xc=None, Yc=None, normalize=True, add_intercept=True):
     """
@@ -45,40 +81,184 @@ def residualize(X, Y, Xc=None, Yc=None, normalize=True, add_intercept=True):
     -----
     If both `Xc` and `Yc` are provided, these are used to calculate betas which
     are then applied to `X` and `Y`.
+
+    To residualize many different `Y` against the same `Xc` (or to apply the
+    same fit to many chunks of `X` and `Y`) use :class:`Residualizer`, which
+    need only factorize `Xc` once.
     """
 
     if ((Yc is None and Xc is not None) or (Yc is not None and Xc is None)):
         raise ValueError('If processing against a comparative group, you must '
                          'provide both `Xc` and `Yc`.')
 
-    X, Y = np.asarray(X), np.asarray(Y)
-
     if Yc is None:
-        Xc, Yc = X.copy(), Y.copy()
-    else:
-        Xc, Yc = np.asarray(Xc), np.asarray(Yc)
+        Xc, Yc = X, Y
+
+    res = Residualizer(normalize=normalize, add_intercept=add_intercept)
+
+    return res.fit(Xc, Yc).transform(X, Y)
+
+
+class Residualizer:
+    """
+    Residualizes dependent variables against a coefficient matrix
+
+    Fitting factorizes the coefficient matrix (via its pseudoinverse) and uses
+    it to estimate betas for the provided dependent variables. The
+    factorization is cached, so re-fitting with the same coefficient matrix
+    but different dependent variables (e.g., another block of features) costs
+    only a single matrix product. The estimated betas (and normalization
+    statistics) can then be applied to any number of (e.g., streamed) chunks
+    of subjects with :meth:`transform`.
+
+    Parameters
+    ----------
+    normalize : bool, optional
+        Whether to normalize (i.e., z-score) residuals. Will use residuals of
+        the data provided to :meth:`fit` for generating mean and variance.
+        Default: True
+    add_intercept : bool, optional
+        Whether to add intercept to the coefficient matrix. The intercept will
+        not be removed, just used in beta estimation. Default: True
+
+    Attributes
+    ----------
+    betas : (R[+1], F) numpy.ndarray
+        Estimated betas. If `add_intercept` is True the last row holds the
+        betas of the intercept.
+    mean, std : (F,) numpy.ndarray
+        Mean and standard deviation of the residuals of the data provided to
+        :meth:`fit`. Only estimated if `normalize` is True.
+
+    See Also
+    --------
+    residualize
+
+    Examples
+    --------
+    >>> from netneurotools import stats
+
+    >>> rs = np.random.RandomState(1234)
+    >>> X, Y = rs.normal(size=(100, 3)), rs.normal(size=(100, 1000))
+
+    Residualize blocks of features against the same confounds:
+
+    >>> res = stats.Residualizer()
+    >>> Yr = np.column_stack([res.fit_transform(X, block)
+    ...                       for block in np.split(Y, 10, axis=1)])
+    >>> np.allclose(Yr, stats.residualize(X, Y))
+    True
+    """
+
+    def __init__(self, normalize=True, add_intercept=True):
+        self.normalize, self.add_intercept = normalize, add_intercept
+        self.betas = self.mean = self.std = None
+        self._X = self._pinv = None
+
+    def _design(self, X):
+        """ Returns coefficient matrix `X` (with intercept, if requested) """
+
+        X = np.asarray(X)
+        return utils.add_constant(X) if self.add_intercept else X
+
+    def _residuals(self, X, Y):
+        """ Returns (non-normalized) residuals of `Y` given design `X` """
+
+        # the intercept is only used in beta estimation, so it is not removed
+        if self.add_intercept:
+            return Y - (X[:, :-1] @ self.betas[:-1])
+        return Y - (X @ self.betas)
+
+    def _fit(self, X, Y):
+        """ Fits betas of `Y` on design `X` and returns residuals of `Y` """
+
+        # same cutoff for small singular values as `np.linalg.lstsq`
+        if (self._X is None or self._X.shape != X.shape
+                or not np.array_equal(self._X, X)):
+            rcond = np.finfo(float).eps * max(X.shape)
+            # keep a copy, since the caller may modify `X` in place
+            self._X, self._pinv = X.copy(), np.linalg.pinv(X, rcond=rcond)
 
-    # add intercept to regressors if requested and calculate fit
-    if add_intercept:
-        X, Xc = utils.add_constant(X), utils.add_constant(Xc)
-    betas, *rest = np.linalg.lstsq(Xc, Yc, rcond=None)
+        self.betas = self._pinv @ Y
+        Yr = self._residuals(X, Y)
+        if self.normalize:
+            self.mean, self.std = Yr.mean(axis=0), Yr.std(axis=0)
 
-    # remove intercept from regressors and betas for calculation of residuals
-    if add_intercept:
-        betas = betas[:-1]
-        X, Xc = X[:, :-1], Xc[:, :-1]
+        return Yr
 
-    # calculate residuals
-    Yr = Y - (X @ betas)
-    Ycr = Yc - (Xc @ betas)
+    def fit(self, X, Y):
+        """
+        Estimates betas of regression equation `Y ~ X`
 
-    if normalize:
-        Yr = sstats.zmap(Yr, compare=Ycr)
+        Parameters
+        ----------
+        X : (M[, R]) array_like
+            Coefficient matrix of `R` variables for `M` subjects
+        Y : (M[, F]) array_like
+            Dependent variable matrix of `F` variables for `M` subjects
 
-    return Yr
+        Returns
+        -------
+        self : Residualizer
+            Fitted residualizer
+        """
 
+        self._fit(self._design(X), np.asarray(Y))
 
-def get_mad_outliers(data, thresh=3.5):
+        return self
+
+    def transform(self, X, Y):
+        """
+        Returns residuals of `Y` given `X` using previously estimated betas
+
+        Parameters
+        ----------
+        X : (N[, R]) array_like
+            Coefficient matrix of `R` variables for `N` subjects
+        Y : (N[, F]) array_like
+            Dependent variable matrix of `F` variables for `N` subjects
+
+        Returns
+        -------
+        Yr : (N, F) numpy.ndarray
+            Residuals of `Y ~ X`
+        """
+
+        if self.betas is None:
+            raise ValueError('Residualizer must be fit before calling '
+                             '`transform`.')
+
+        Yr = self._residuals(self._design(X), np.asarray(Y))
+        if self.normalize:
+            Yr = (Yr - self.mean) / self.std
+
+        return Yr
+
+    def fit_transform(self, X, Y):
+        """
+        Estimates betas of `Y ~ X` and returns residuals of `Y`
+
+        Parameters
+        ----------
+        X : (N[, R]) array_like
+            Coefficient matrix of `R` variables for `N` subjects
+        Y : (N[, F]) array_like
+            Dependent variable matrix of `F` variables for `N` subjects
+
+        Returns
+        -------
+        Yr : (N, F) numpy.ndarray
+            Residuals of `Y ~ X`
+        """
+
+        Yr = self._fit(self._design(X), np.asarray(Y))
+        if self.normalize:
+            Yr = (Yr - self.mean) / self.std
+
+        return Yr
+
+
+def get_mad_outliers(data, thresh=3.5, chunk_size=None, approx_median=False):
     """
     Determines which samples in `data` are outliers
 
@@ -93,6 +273,17 @@ def get_mad_outliers(data, thresh=3.5):
         Modified z-score. Observations with a modified z-score (based on the
         median absolute deviation) greater than this value will be classified
         as outliers. Default: 3.5
+    chunk_size : int, optional
+        If specified, features are processed in blocks of `chunk_size` columns
+        at a time such that only one block of `data` is held in memory. In
+        this case `data` is only ever sliced (not converted to an array), so
+        it may be, e.g., a :obj:`numpy.memmap` array or (two-dimensional) HDF5
+        dataset. Default: None
+    approx_median : bool, optional
+        Whether to approximate the median of each feature from a histogram of
+        its values instead of computing it exactly. This is faster for data
+        with missing (NaN) values, and is accurate to within 1/1024 of the
+        range of each feature. Default: False
 
     Returns
     -------
@@ -103,6 +294,10 @@ def get_mad_outliers(data, thresh=3.5):
     -----
     Taken directly from https://stackoverflow.com/a/22357811
 
+    The (squared) distance of every sample from the median of all features is
+    accumulated block by block when `chunk_size` is specified, so that results
+    do not depend on `chunk_size`.
+
     References
     ----------
     Boris Iglewicz and David Hoaglin (1993), "Volume 16: How to Detect and
@@ -128,15 +323,28 @@ def get_mad_outliers(data, thresh=3.5):
     array([False, False,  True])
     """
 
-    data = np.asarray(data)
+    # only coerce inputs that cannot be sliced (e.g., lists) to arrays
+    data = data if hasattr(data, 'shape') else np.asarray(data)
 
     if data.ndim == 1:
-        data = np.vstack(data)
+        data = data.reshape(-1, 1)
     if data.ndim > 2:
         data = data.reshape(len(data), -1)
 
-    median = np.nanmedian(data, axis=0)
-    diff = np.nansum((data - median)**2, axis=-1)
+    if chunk_size is None:
+        chunk_size = max(data.shape[-1], 1)
+    elif chunk_size < 1:
+        raise ValueError('Provided `chunk_size` must be a positive integer, '
+                         'not {}'.format(chunk_size))
+
+    diff = np.zeros(len(data))
+    for start in range(0, data.shape[-1], chunk_size):
+        block = np.asarray(data[:, start:start + chunk_size])
+        if approx_median:
+            median = _approx_nanmedian(block)
+        else:
+            median = np.nanmedian(block, axis=0)
+        diff += np.nansum((block - median)**2, axis=-1)
     diff = np.sqrt(diff)
     med_abs_deviation = np.median(diff)
 
@@ -145,7 +353,759 @@ def get_mad_outliers(data, thresh=3.5):
     return modified_z_score > thresh
 
 
-def permtest_1samp(a, popmean, axis=0, n_perm=1000, seed=0):
+def _approx_nanmedian(data, n_bins=_MEDIAN_BINS):
+    """
+    Approximates medians of columns in `data`, ignoring NaNs
+
+    Values of each column are counted in `n_bins` equal-width bins spanning
+    their range, and the (one or two) middle values are linearly interpolated
+    within the bins that contain them. Approximations are thus within (max -
+    min) / `n_bins` of the true median.
+
+    Parameters
+    ----------
+    data : (N, M) numpy.ndarray
+        Data array where `N` is samples and `M` is features
+    n_bins : int, optional
+        Number of bins used for each feature. Default: 1024
+
+    Returns
+    -------
+    median : (M,) numpy.ndarray
+        Approximate median of each feature
+    """
+
+    n_feat = data.shape[-1]
+    valid = np.logical_not(np.isnan(data))
+    low = np.where(valid, data, np.inf).min(axis=0, initial=np.inf)
+    high = np.where(valid, data, -np.inf).max(axis=0, initial=-np.inf)
+    width = np.where(high > low, (high - low) / n_bins, 1)
+
+    # invalid values are counted in an extra (ignored) bin
+    with np.errstate(invalid='ignore'):
+        bins = np.minimum(np.floor((data - low) / width), n_bins - 1)
+    bins = np.where(valid, bins, n_bins).astype(int)
+    bins += np.arange(n_feat) * (n_bins + 1)
+    counts = np.bincount(bins.ravel(), minlength=n_feat * (n_bins + 1))
+    counts = counts.reshape(n_feat, n_bins + 1)[:, :-1]
+
+    # the value with a given (zero-based) rank lies in the first bin in which
+    # more values than its rank are counted
+    n_valid = valid.sum(axis=0)
+    cumulative = np.cumsum(counts, axis=-1)
+    feat = np.arange(n_feat)
+
+    def order_statistic(rank):
+        idx = np.argmax(cumulative > rank[:, None], axis=-1)
+        below = cumulative[feat, idx] - counts[feat, idx]
+        return low + width * (idx + (rank - below + 0.5) / counts[feat, idx])
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        median = (order_statistic((n_valid - 1) // 2)
+                  + order_statistic(n_valid // 2)) / 2
+        median = np.where(high > low, median, low)
+
+    return np.where(n_valid > 0, median, np.nan)
+
+
+def _get_batch_size(n_perm, perm_nbytes, batch_size=None, max_memory=None):
+    """
+    Determines how many permutations should be computed simultaneously
+
+    Parameters
+    ----------
+    n_perm : int
+        Total number of permutations to assess
+    perm_nbytes : int
+        Approximate number of bytes required to compute a single permutation
+    batch_size : int, optional
+        Requested number of permutations per batch. If specified, this takes
+        precedence over `max_memory`. Default: None
+    max_memory : int, optional
+        Maximum number of bytes that a single batch of permutations should
+        use. If not specified, uses 256 MiB. Default: None
+
+    Returns
+    -------
+    batch_size : int
+        Number of permutations per batch, in the range [1, max(n_perm, 1)]
+    """
+
+    if batch_size is None:
+        if max_memory is None:
+            max_memory = _MAX_MEMORY
+        batch_size = int(max_memory // max(perm_nbytes, 1))
+    elif batch_size < 1:
+        raise ValueError('Provided `batch_size` must be a positive integer, '
+                         'not {}'.format(batch_size))
+
+    return int(min(max(batch_size, 1), max(n_perm, 1)))
+
+
+def _check_correction(correction):
+    """
+    Confirms that `correction` is a valid multiple comparisons correction
+    """
+
+    corrections = [None, 'maxT']
+    if correction not in corrections:
+        raise ValueError('Provided correction "{}" invalid. Must be one of {}.'
+                         .format(correction, corrections))
+
+    return correction
+
+
+def _gpd_sf(y, shape, scale):
+    """
+    Survival function of the generalized Pareto distribution
+
+    Uses the parameterization of Hosking & Wallis (1987), where `shape` is the
+    negative of the shape parameter used by :obj:`scipy.stats.genpareto`
+    """
+
+    shape = np.asarray(shape, dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        sf = np.clip(1 - shape * y / scale, 0, None) ** (1 / shape)
+        return np.where(shape == 0, np.exp(-y / scale), sf)
+
+
+def _gpd_fit(exceed):
+    """
+    Fits a generalized Pareto distribution to `exceed`
+
+    Uses probability weighted moments (Hosking & Wallis, 1987), where `exceed`
+    is sorted along the first axis
+
+    Returns
+    -------
+    shape, scale, mean : numpy.ndarray
+        Fitted shape and scale parameters of each column of `exceed` and its
+        mean (i.e., the scale of an exponential distribution fit to it)
+    """
+
+    n_exceed = len(exceed)
+    ranks = np.arange(1, n_exceed + 1)[:, np.newaxis]
+    a0 = exceed.mean(axis=0)
+    a1 = np.mean((1 - (ranks - 0.35) / n_exceed) * exceed, axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        shape = a0 / (a0 - 2 * a1) - 2
+        scale = 2 * a0 * a1 / (a0 - 2 * a1)
+
+    return shape, scale, a0
+
+
+def _gpd_anderson(exceed, shape, scale):
+    """
+    Anderson-Darling statistic of the fit of `shape` and `scale` to `exceed`
+
+    `exceed` is sorted along the first axis
+    """
+
+    n_exceed = len(exceed)
+    weights = 2 * np.arange(1, n_exceed + 1)[:, np.newaxis] - 1
+    cdf = 1 - _gpd_sf(exceed, shape, scale)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        logs = np.log(cdf) + np.log(1 - cdf[::-1])
+        return -n_exceed - np.mean(weights * logs, axis=0)
+
+
+def _gpd_tail_pvals(pvals, tail, abs_true, n_perm):
+    """
+    Refines `pvals` by fitting a generalized Pareto distribution to `tail`
+
+    Parameters
+    ----------
+    pvals : (F,) numpy.ndarray
+        Non-parametric p-values
+    tail : (T, F) numpy.ndarray
+        Largest (absolute) statistics of the null distribution of each feature.
+        If this has only one column the same null distribution is used for
+        all features
+    abs_true : (F,) numpy.ndarray
+        Absolute value of the original (i.e., non-permuted) statistics
+    n_perm : int
+        Number of permutations used to generate the null distribution
+
+    Returns
+    -------
+    pvals : (F,) numpy.ndarray
+        P-values, extrapolated from the fitted tail where possible
+    tail_fit : (F,) numpy.ndarray
+        Boolean array indicating which p-values were extrapolated
+    """
+
+    tail = np.sort(tail, axis=0)
+    # column of `tail` holding the null distribution of each feature
+    cols = np.arange(len(abs_true)) if tail.shape[1] > 1 \
+        else np.zeros(len(abs_true), dtype=int)
+    tail_fit = np.zeros(len(abs_true), dtype=bool)
+    pvals = np.array(pvals, dtype=float)
+
+    # the threshold starts at the smallest statistic of the tail and is moved
+    # up until the Anderson-Darling test no longer rejects the fit (Winkler et
+    # al., 2016); features whose fit is always rejected retain their p-value
+    pending = np.ones(len(abs_true), dtype=bool)
+    n_exceed = len(tail) - 1
+    while n_exceed >= _TAIL_MIN_EXCEED and np.any(pending):
+        idx = np.flatnonzero(pending)
+        use, inv = np.unique(cols[idx], return_inverse=True)
+        thresh = tail[-n_exceed - 1, use]
+        exceed = tail[-n_exceed:, use] - thresh
+        shape, scale, mean = _gpd_fit(exceed)
+        astat = _gpd_anderson(exceed, shape, scale)
+        with np.errstate(invalid='ignore'):
+            accept = astat < np.interp(shape, *_GPD_ANDERSON_CRITICAL)
+        thresh, shape, scale, mean, accept = (
+            thresh[inv], shape[inv], scale[inv], mean[inv], accept[inv]
+        )
+
+        # features below the threshold keep their (accurate) p-value
+        pending[idx[abs_true[idx] <= thresh]] = False
+        accept = np.logical_and(accept, abs_true[idx] > thresh)
+
+        # a positive shape implies a bounded tail, which is very sensitive to
+        # the estimated shape and can yield p-values orders of magnitude too
+        # small beyond the permuted statistics; fall back to a (conservative)
+        # exponential tail for these
+        sf = np.where(shape > 0, _gpd_sf(abs_true[idx] - thresh, 0, mean),
+                      _gpd_sf(abs_true[idx] - thresh, shape, scale))
+
+        fit = idx[accept]
+        pvals[fit] = (n_exceed / n_perm) * sf[accept]
+        tail_fit[fit], pending[fit] = True, False
+        n_exceed = int(n_exceed * (1 - _TAIL_STEP))
+
+    return pvals, tail_fit
+
+
+def _update_tail(tail, null, size):
+    """
+    Returns the `size` largest values along the first axis of `tail` + `null`
+    """
+
+    if tail is not None:
+        null = np.vstack([tail, null])
+    if len(null) > size:
+        null = np.partition(null, len(null) - size, axis=0)[-size:]
+
+    return null
+
+
+def _tie_threshold(abs_true):
+    """
+    Returns value permuted statistics must reach to count as exceeding them
+
+    Permuted statistics that reproduce `abs_true` are generally computed
+    differently than the original statistics and so may differ from them by
+    floating point error. A small tolerance ensures these are still counted as
+    exceeding the original statistics.
+    """
+
+    dtype = abs_true.dtype if np.issubdtype(abs_true.dtype, np.floating) \
+        else float
+
+    return abs_true - np.abs(abs_true) * 100 * np.finfo(dtype).eps
+
+
+def _snap_corr(corr):
+    """
+    Sets correlations that are zero up to floating point error to zero
+
+    Since correlations are bounded, a correlation this close to zero is zero
+    and any permuted correlation should count as exceeding it (which
+    :func:`_tie_threshold` alone can't ensure)
+    """
+
+    dtype = corr.dtype if np.issubdtype(corr.dtype, np.floating) else float
+
+    return corr * (np.abs(corr) >= 100 * np.finfo(dtype).eps)
+
+
+def _permutation_chunk(permute, abs_true, batch_size, tail_size, correction,
+                       rs, start, stop, checkpoint=None):
+    """
+    Summarizes the null distribution of permutations `start` through `stop`
+
+    Parameters
+    ----------
+    permute, abs_true, batch_size, correction
+        See :func:`_permutation_pvals`
+    tail_size : int or None
+        Number of largest permuted statistics to retain for each feature. If
+        None, the tail of the null distribution is not retained
+    rs : np.random.RandomState
+        Random state used to generate permutations
+    start, stop : int
+        Indices of the first and (one past the) last permutation
+    checkpoint : netneurotools.utils._Checkpoint, optional
+        Checkpoint used to save (and resume) progress after each batch of
+        permutations. Default: None
+
+    Returns
+    -------
+    exceed : (F,) numpy.ndarray
+        Number of permuted statistics exceeding `abs_true` for each feature
+    maxnull : (stop - start,) numpy.ndarray or None
+        Maximum absolute statistic for each permutation if `correction` is
+        'maxT'
+    tail : (T, F) numpy.ndarray or None
+        Largest permuted statistics for each feature if `tail_size` is not None
+    """
+
+    exceed = np.zeros(abs_true.shape, dtype=int)
+    maxnull = np.zeros(stop - start) if correction == 'maxT' else None
+    thresh = _tie_threshold(abs_true)
+    tail, done = None, start
+
+    state = None if checkpoint is None else checkpoint.load()
+    if state is not None:
+        done, exceed = int(state['done']), state['exceed']
+        tail = state.get('tail')
+        if maxnull is not None:
+            maxnull[:done - start] = state['maxnull']
+        utils._set_random_state(rs, state)
+
+    for begin in range(done, stop, batch_size):
+        size = min(batch_size, stop - begin)
+        null = np.abs(permute(rs, begin, size, None))
+        if maxnull is not None:
+            maxnull[begin - start:begin - start + size] = \
+                np.fmax.reduce(null, axis=1)
+        else:
+            exceed += np.sum(null >= thresh, axis=0)
+            if tail_size is not None:
+                tail = _update_tail(tail, null, tail_size)
+        if checkpoint is not None:
+            checkpoint.save(done=begin + size, exceed=exceed, tail=tail,
+                            maxnull=(None if maxnull is None
+                                     else maxnull[:begin + size - start]),
+                            **utils._get_random_state(rs))
+
+    if checkpoint is not None:
+        checkpoint.remove()
+
+    return exceed, maxnull, tail
+
+
+def _tail_size(n_perm):
+    """
+    Returns number of permuted statistics retained for tail approximations
+    """
+
+    return int(np.ceil(n_perm * _TAIL_FRACTION)) + 1
+
+
+def _merge_null(results, n_feat, tail_size=None, correction=None):
+    """
+    Combines summaries of the null distribution from different chunks
+
+    Parameters
+    ----------
+    results : list of tuple
+        Outputs of :func:`_permutation_chunk`
+    n_feat : int
+        Number of features
+    tail_size, correction
+        See :func:`_permutation_chunk`
+
+    Returns
+    -------
+    exceed, maxnull, tail
+        Combined summaries
+    """
+
+    exceed = sum((res[0] for res in results), np.zeros(n_feat, dtype=int))
+    maxnull, tail = None, None
+    if correction == 'maxT':
+        maxnull = np.concatenate([np.zeros(0)] + [res[1] for res in results])
+    if tail_size is not None:
+        for res in results:
+            tail = _update_tail(tail, res[2], tail_size)
+
+    return exceed, maxnull, tail
+
+
+def _permutation_null(permute, abs_true, n_perm, perm_nbytes, seed=None,
+                      batch_size=None, max_memory=None, tail_approx=False,
+                      correction=None, n_jobs=None, chunks=None,
+                      checkpoint=None):
+    """
+    Summarizes the null distribution of (a subset of) `n_perm` permutations
+
+    Parameters
+    ----------
+    permute, abs_true, n_perm, perm_nbytes, seed, batch_size, max_memory
+        See :func:`_permutation_pvals`
+    tail_approx, correction, n_jobs, checkpoint
+        See :func:`_permutation_pvals`
+    chunks : array_like, optional
+        Indices of the chunks of permutations to run. If specified, chunks
+        are run with independent random streams even if `n_jobs` is None.
+        Default: None
+
+    Returns
+    -------
+    exceed : (F,) numpy.ndarray
+        Number of permuted statistics exceeding `abs_true` for each feature
+    maxnull : numpy.ndarray or None
+        Maximum absolute statistic for each permutation if `correction` is
+        'maxT'
+    tail : (T, F) numpy.ndarray or None
+        Largest permuted statistics for each feature if `tail_approx` is True
+        and `correction` is None
+    """
+
+    batch_size = _get_batch_size(n_perm, perm_nbytes, batch_size, max_memory)
+    if checkpoint is not None:
+        checkpoint.extend(batch_size)
+    tail_size = _tail_size(n_perm)
+    if not tail_approx or _check_correction(correction) is not None:
+        tail_size = None
+
+    chunk = functools.partial(_permutation_chunk, permute, abs_true,
+                              batch_size, tail_size, correction)
+    if n_jobs is None and chunks is None:
+        # a single random stream, so progress can be saved after every batch
+        return chunk(check_random_state(seed), 0, n_perm,
+                     checkpoint=checkpoint)
+
+    if chunks is None:
+        chunks = range(len(utils._chunk_bounds(n_perm)) - 1)
+    if checkpoint is None:
+        results = utils._parallel_permutations(chunk, n_perm, seed, n_jobs,
+                                               chunks)
+        return _merge_null(results, abs_true.size, tail_size, correction)
+
+    # otherwise, run chunks in waves and save progress after each wave. the
+    # waves must all spawn their streams from the same seed
+    if isinstance(seed, np.random.RandomState):
+        seed = seed.randint(np.iinfo(np.int32).max)
+    null, done = None, np.zeros(0, dtype=int)
+    state = checkpoint.load()
+    if state is not None:
+        null = (state['exceed'], state.get('maxnull'), state.get('tail'))
+        done = state['chunks']
+    todo = np.setdiff1d(chunks, done)
+    wave = 4 * effective_n_jobs(1 if n_jobs is None else n_jobs)
+    for n in range(0, len(todo), wave):
+        results = utils._parallel_permutations(chunk, n_perm, seed, n_jobs,
+                                               todo[n:n + wave])
+        if null is not None:
+            results.insert(0, null)
+        null = _merge_null(results, abs_true.size, tail_size, correction)
+        done = np.union1d(done, todo[n:n + wave])
+        checkpoint.save(chunks=done, exceed=null[0], maxnull=null[1],
+                        tail=null[2])
+    checkpoint.remove()
+
+    if null is None:
+        return _merge_null([], abs_true.size, tail_size, correction)
+
+    return null
+
+
+def _null_pvals(abs_true, n_perm, exceed, maxnull=None, tail=None,
+                tail_approx=False, correction=None):
+    """
+    Computes p-values from a summary of the null distribution
+
+    Parameters
+    ----------
+    abs_true : (F,) numpy.ndarray
+        Absolute value of the original (i.e., non-permuted) statistics
+    n_perm : int
+        Number of permutations used to generate the null distribution
+    exceed, maxnull, tail
+        See :func:`_permutation_null`
+    tail_approx, correction
+        See :func:`_permutation_pvals`
+
+    Returns
+    -------
+    pvals : (F,) numpy.ndarray
+        Non-parametric p-values
+    tail_fit : (F,) numpy.ndarray or None
+        Boolean array indicating which p-values were extrapolated from the
+        tail of the null distribution. None if `tail_approx` is False
+    """
+
+    if correction == 'maxT':
+        maxnull = np.sort(maxnull)
+        exceed = n_perm - np.searchsorted(maxnull, _tie_threshold(abs_true),
+                                          side='left')
+        tail = maxnull[-_tail_size(n_perm):, np.newaxis]
+
+    pvals = (exceed + 1) / (n_perm + 1)  # + 1 accounts for true statistic
+    if tail_approx:
+        return _gpd_tail_pvals(pvals, tail, abs_true, n_perm)
+
+    return pvals, None
+
+
+def _permutation_pvals(permute, abs_true, n_perm, perm_nbytes, seed=None,
+                       batch_size=None, max_memory=None, n_exceed=None,
+                       tail_approx=False, correction=None, n_jobs=None,
+                       checkpoint=None):
+    """
+    Counts how often permuted statistics exceed `abs_true` to get p-values
+
+    Parameters
+    ----------
+    permute : callable
+        Function accepting arguments `(rs, start, size, active)` and returning
+        a (size, F) array of statistics for permutations `start` through
+        `start + size` generated from the random state `rs`. If `active` is
+        not None it is an array of feature indices and only statistics for
+        those features should be returned (i.e., the array should be (size,
+        A)).
+    abs_true : (F,) numpy.ndarray
+        Absolute value of the original (i.e., non-permuted) statistics
+    n_perm : int
+        Number of permutations to assess
+    perm_nbytes : int
+        Approximate number of bytes required to compute a single permutation
+    seed : {int, np.random.RandomState instance, None}, optional
+        Seed for random number generation. Default: None
+    batch_size : int, optional
+        Number of permutations to compute simultaneously. Default: None
+    max_memory : int, optional
+        Approximate maximum number of bytes to use for each batch of
+        permutations. Ignored if `batch_size` is specified. Default: None
+    n_exceed : int, optional
+        If specified, permutations for a feature are stopped as soon as this
+        many permuted statistics exceed the original statistic (i.e., the
+        sequential procedure of Besag & Clifford, 1991). Default: None
+    tail_approx : bool, optional
+        Whether to refine p-values in the tail of the null distribution by
+        fitting a generalized Pareto distribution. Cannot be combined with
+        `n_exceed`. Default: False
+    correction : {None, 'maxT'}, optional
+        If 'maxT', only the maximum absolute statistic across features is
+        retained for each permutation and p-values are corrected for the
+        family-wise error rate. Cannot be combined with `n_exceed`.
+        Default: None
+    n_jobs : int, optional
+        Number of processes used to compute permutations. Cannot be combined
+        with `n_exceed`. Default: None
+    checkpoint : netneurotools.utils._Checkpoint, optional
+        Checkpoint used to periodically save (and resume) progress. Default:
+        None
+
+    Returns
+    -------
+    pvals : (F,) numpy.ndarray
+        Non-parametric p-values
+    tail_fit : (F,) numpy.ndarray or None
+        Boolean array indicating which p-values were extrapolated from the
+        tail of the null distribution. None if `tail_approx` is False
+    """
+
+    if _check_correction(correction) == 'maxT' and n_exceed is not None:
+        raise ValueError('Cannot use `n_exceed` with `correction`.')
+
+    if n_exceed is None:
+        null = _permutation_null(permute, abs_true, n_perm, perm_nbytes,
+                                 seed=seed, batch_size=batch_size,
+                                 max_memory=max_memory,
+                                 tail_approx=tail_approx,
+                                 correction=correction, n_jobs=n_jobs,
+                                 checkpoint=checkpoint)
+        return _null_pvals(abs_true, n_perm, *null, tail_approx=tail_approx,
+                           correction=correction)
+
+    if tail_approx:
+        raise ValueError('Cannot use `tail_approx` with `n_exceed`.')
+
+    if n_jobs is not None:
+        raise ValueError('Cannot use `n_jobs` with `n_exceed`.')
+
+    if n_exceed < 1:
+        raise ValueError('Provided `n_exceed` must be a positive integer, not '
+                         '{}'.format(n_exceed))
+
+    # features can only stop between batches, so keep batches small-ish
+    auto = batch_size is None
+    batch_size = _get_batch_size(n_perm, perm_nbytes, batch_size, max_memory)
+    if auto:
+        batch_size = min(batch_size, _SEQUENTIAL_BATCH)
+    # features stop (and so change which random numbers are drawn) between
+    # batches, so progress can only be resumed with the same batches
+    if checkpoint is not None:
+        checkpoint.extend(batch_size)
+
+    rs = check_random_state(seed)
+    exceed = np.zeros(abs_true.shape, dtype=int)
+    n_done = np.full(abs_true.shape, n_perm)
+    active = np.arange(abs_true.size)
+    thresh = _tie_threshold(abs_true)
+    begin = 0
+
+    state = None if checkpoint is None else checkpoint.load()
+    if state is not None:
+        begin, exceed = int(state['done']), state['exceed']
+        n_done, active = state['n_done'], state['active']
+        utils._set_random_state(rs, state)
+
+    for start in range(begin, n_perm, batch_size):
+        if len(active) == 0:
+            break
+        size = min(batch_size, n_perm - start)
+        hits = np.abs(permute(rs, start, size, active)) >= thresh[active]
+        cumhits = exceed[active] + np.cumsum(hits, axis=0)
+        # features reaching `n_exceed` stop at the permutation where they did
+        done = cumhits[-1] >= n_exceed
+        n_done[active[done]] = start + 1 + np.argmax(cumhits[:, done]
+                                                     >= n_exceed, axis=0)
+        exceed[active] = np.minimum(cumhits[-1], n_exceed)
+        active = active[~done]
+        if checkpoint is not None:
+            checkpoint.save(done=start + size, exceed=exceed, n_done=n_done,
+                            active=active, **utils._get_random_state(rs))
+
+    if checkpoint is not None:
+        checkpoint.remove()
+
+    pvals = np.where(exceed >= n_exceed, n_exceed / n_done,
+                     (exceed + 1) / (n_perm + 1))
+
+    return pvals, None
+
+
+def _permtest_output(stat, pvals, tail_fit=None, tail_approx=False):
+    """
+    Reshapes `pvals` (and `tail_fit`) to match `stat` for permutation tests
+
+    Parameters
+    ----------
+    stat : float or numpy.ndarray
+        Original (i.e., non-permuted) statistics
+    pvals : (F,) numpy.ndarray
+        Non-parametric p-values for the flattened `stat`
+    tail_fit : (F,) numpy.ndarray, optional
+        Boolean array indicating which p-values were extrapolated from the
+        tail of the null distribution. Default: None
+    tail_approx : bool, optional
+        Whether `tail_fit` should be returned. Default: False
+
+    Returns
+    -------
+    stat, pvals[, tail_fit]
+        Inputs reshaped to match `stat`
+    """
+
+    shape = np.shape(stat)
+    pvals = np.reshape(pvals, shape) / 1
+    if not tail_approx:
+        return stat, pvals
+
+    if tail_fit is None:
+        tail_fit = np.zeros(shape, dtype=bool)
+
+    return stat, pvals, np.reshape(tail_fit, shape)[()]
+
+
+def _use_exact(n_perm, n_obs):
+    """
+    Determines whether all sign flips of `n_obs` samples should be enumerated
+
+    Parameters
+    ----------
+    n_perm : int or 'exact'
+        Number of permutations requested
+    n_obs : int
+        Number of samples along the axis being permuted
+
+    Returns
+    -------
+    exact : bool
+        Whether exact enumeration should be used instead of random sampling
+    """
+
+    n_flips = 2 ** (n_obs - 1)
+    if isinstance(n_perm, str):
+        if n_perm != 'exact':
+            raise ValueError('Provided `n_perm` must be an integer or '
+                             '"exact", not "{}"'.format(n_perm))
+        if n_flips > _MAX_EXACT_FLIPS:
+            raise ValueError('Cannot enumerate all {} sign flips of {} '
+                             'samples (at most {} can be); please specify an '
+                             'integer `n_perm` instead.'
+                             .format(n_flips, n_obs, _MAX_EXACT_FLIPS))
+        return True
+
+    return n_flips <= _MAX_EXACT_FLIPS and 2 * n_flips <= n_perm
+
+
+def _warn_exact(**kwargs):
+    """
+    Warns if any of `kwargs` were specified, as they have no effect when all
+    sign flips are enumerated
+    """
+
+    ignored = [k for k, v in kwargs.items()
+               if v is not None and v is not False]
+    if ignored:
+        warnings.warn('All sign flips are enumerated, so {} will be ignored.'
+                      .format(', '.join('`{}`'.format(k) for k in ignored)))
+
+
+def _exact_signflip_pvals(data, abs_true, batch_size=None, max_memory=None,
+                          correction=None):
+    """
+    Computes exact two-tailed p-values by enumerating all sign flips of `data`
+
+    Parameters
+    ----------
+    data : (N, F) numpy.ndarray
+        Samples to be sign-flipped, where `N` is samples and `F` is features
+    abs_true : (F,) numpy.ndarray
+        Absolute value of the mean of `data` along the first axis
+    batch_size : int, optional
+        Number of sign flips to assess simultaneously. Default: None
+    max_memory : int, optional
+        Approximate maximum number of bytes to use for each batch of sign
+        flips. Ignored if `batch_size` is specified. Default: None
+    correction : {None, 'maxT'}, optional
+        If 'maxT', each sign flip is compared to the original statistics via
+        its maximum absolute statistic across features. Default: None
+
+    Returns
+    -------
+    pvals : (F,) numpy.ndarray
+        Exact p-values
+    """
+
+    correction = _check_correction(correction)
+    n_obs, n_feat = data.shape
+
+    # flipping every sign yields the same absolute mean, so we need only
+    # enumerate half of the flips (i.e., those where the first sign is fixed)
+    n_flips = 2 ** (n_obs - 1)
+    shifts = np.arange(n_obs - 1, dtype='int64')
+
+    thresh = _tie_threshold(abs_true)
+
+    batch_size = _get_batch_size(n_flips, (n_obs + n_feat) * 8, batch_size,
+                                 max_memory)
+    # the un-flipped data is always counted (as with the random permutations)
+    permutations = np.ones(n_feat)
+    for start in range(1, n_flips, batch_size):
+        flips = np.arange(start, min(start + batch_size, n_flips),
+                          dtype='int64')
+        signs = np.ones((len(flips), n_obs))
+        signs[:, 1:] -= 2 * ((flips[:, None] >> shifts) & 1)
+        means = np.abs(signs @ data) / n_obs
+        if correction == 'maxT':
+            means = np.fmax.reduce(means, axis=1)[:, np.newaxis]
+        permutations += np.sum(means >= thresh, axis=0)
+
+    return permutations / n_flips
+
+
+def permtest_1samp(a, popmean, axis=0, n_perm=1000, seed=0, batch_size=None,
+                   max_memory=None, n_exceed=None, tail_approx=False,
+                   correction=None, n_jobs=None, shard=None,
+                   checkpoint=None, shared_flips=False):
     """
     Non-parametric equivalent of :py:func:`scipy.stats.ttest_1samp`
 
@@ -162,13 +1122,66 @@ def permtest_1samp(a, popmean, axis=0, n_perm=1000, seed=0):
     axis : int or None, optional
         Axis along which to compute test. If None, compute over the whole array
         of `a`. Default: 0
-    n_perm : int, optional
+    n_perm : int or 'exact', optional
         Number of permutations to assess. Unless `a` is very small along `axis`
         this will approximate a randomization test via Monte Carlo simulations.
-        Default: 1000
+        If 'exact', or if `a` is small enough along `axis` that all possible
+        sign flips number fewer than `n_perm`, every sign flip will be
+        enumerated and exact p-values will be returned. At most 2**30 sign
+        flips (i.e., 31 samples) can be enumerated. Default: 1000
     seed : {int, np.random.RandomState instance, None}, optional
         Seed for random number generation. Set to None for "randomness".
         Default: 0
+    batch_size : int, optional
+        Number of permutations to compute simultaneously. Larger values are
+        faster but require more memory. If not specified this is determined
+        from `max_memory`. Default: None
+    max_memory : int, optional
+        Approximate maximum number of bytes to use for each batch of
+        permutations. Ignored if `batch_size` is specified. If neither is
+        specified batches will use at most 256 MiB. Default: None
+    n_exceed : int, optional
+        If specified, permutations for each feature are stopped as soon as this
+        many permuted statistics exceed the original statistic, following the
+        sequential procedure of Besag & Clifford (1991). Features that are
+        clearly not significant thus require many fewer permutations.
+        Default: None
+    tail_approx : bool, optional
+        Whether to approximate small p-values by fitting a generalized Pareto
+        distribution to the upper tail of the permutation null distribution,
+        as in Winkler et al. (2016). This permits accurate p-values far smaller
+        than 1 / (`n_perm` + 1). Cannot be combined with `n_exceed`.
+        Default: False
+    correction : {None, 'maxT'}, optional
+        If 'maxT', p-values are corrected for the family-wise error rate across
+        all features by comparing each statistic to the null distribution of
+        the maximum absolute statistic. This requires only O(features +
+        `n_perm`) memory. If `tail_approx` is True the tail of this maximum
+        null distribution is approximated instead. Cannot be combined with
+        `n_exceed`. Default: None
+    n_jobs : int, optional
+        Number of processes used to compute permutations in parallel. Set to
+        -1 to use all available cores. Cannot be combined with `n_exceed`.
+        Default: None
+    shard : (2,) tuple of int, optional
+        If specified as `(index, n_shards)`, only the `index`-th of `n_shards`
+        equally-sized subsets of the permutations is run and a
+        :class:`PermutationResult` is returned instead of p-values. Merging
+        the results from all shards yields p-values identical to those from a
+        single run with `n_jobs` specified. All shards must be run with the
+        same integer `seed`. Cannot be combined with `n_exceed`. Default: None
+    checkpoint : str or os.PathLike, optional
+        Filepath where progress should be periodically saved. If the function
+        is interrupted, calling it again with the same inputs and `checkpoint`
+        will resume from the last save and yield results identical to those of
+        an uninterrupted call. The checkpoint is removed once all permutations
+        have been run. Default: None
+    shared_flips : bool, optional
+        Whether to apply the same sign flips to all features rather than
+        independent flips to every element of `a`. Each batch of permutations
+        is then computed as a single matrix product, which is much faster
+        when `a` has many features, but p-values will differ from those
+        obtained when this is False for the same `seed`. Default: False
 
     Returns
     -------
@@ -176,6 +1189,12 @@ def permtest_1samp(a, popmean, axis=0, n_perm=1000, seed=0):
         Difference from `popmean`
     pvalue : float or numpy.ndarray
         Non-parametric p-value
+    tail_fit : bool or numpy.ndarray
+        Whether each p-value was extrapolated from the fitted tail of the null
+        distribution. Only returned if `tail_approx` is True.
+    result : PermutationResult
+        Partial results of the permutation test. Only returned (instead of all
+        of the above) if `shard` is specified.
 
     Notes
     -----
@@ -183,7 +1202,50 @@ def permtest_1samp(a, popmean, axis=0, n_perm=1000, seed=0):
     parallel is not currently supported.
 
     The lowest p-value that can be returned by this function is equal to 1 /
-    (`n_perm` + 1).
+    (`n_perm` + 1). When all sign flips are enumerated the lowest p-value is
+    instead equal to 1 / 2**(N - 1), where `N` is the length of `a` along
+    `axis`; note that the same flips are applied to all features in this case.
+    Since enumeration is exact, `n_exceed`, `tail_approx`, `n_jobs` and
+    `checkpoint` have no effect when all sign flips are enumerated (a warning
+    is raised if any of them is specified).
+
+    Sign flips are drawn in blocks of `batch_size` permutations, which consumes
+    the random state in exactly the same manner as drawing them one at a time;
+    as such, results are identical for a given `seed` regardless of the
+    provided `batch_size` or `max_memory`.
+
+    If `n_jobs` is specified, permutations are split into chunks of 100 that
+    are each generated from an independent random stream spawned from `seed`
+    (via :obj:`numpy.random.SeedSequence`) and run across `n_jobs` processes.
+    Results are then identical for a given `seed` regardless of `n_jobs`,
+    though they will differ from those obtained when `n_jobs` is None.
+
+    If `n_exceed` is specified then the p-value of a feature whose
+    permutations stopped after `L` permutations is `n_exceed` / `L`; for all
+    other features it is computed as normal.
+
+    If `tail_approx` is True the largest 10% of the permuted statistics are
+    retained for each feature and a generalized Pareto distribution is fit to
+    them. Whenever the fit is rejected by an Anderson-Darling test (at alpha =
+    0.05) the smallest 10% of the retained values are discarded (i.e., the
+    threshold is moved up) and the distribution is fit again. P-values are
+    extrapolated from the accepted fit for features whose statistic exceeds
+    its threshold; all other p-values are computed as normal. If the fit
+    implies a bounded tail an exponential tail is used instead, since
+    extrapolating a bounded tail can yield p-values that are far too small.
+
+    If `correction='maxT'` the same sign flips are applied to all features
+    (as when `shared_flips` is True) so that the dependence between features
+    is preserved in the null distribution.
+
+    References
+    ----------
+    Besag, J., & Clifford, P. (1991). Sequential Monte Carlo p-values.
+    Biometrika, 78(2), 301-304.
+
+    Winkler, A. M., Ridgway, G. R., Douaud, G., Nichols, T. E., & Smith, S.
+    M. (2016). Faster permutation inference in brain imaging. NeuroImage,
+    141, 502-516.
 
     Examples
     --------
@@ -209,10 +1271,9 @@ def permtest_1samp(a, popmean, axis=0, n_perm=1000, seed=0):
     """
 
     a, popmean, axis = _chk2_asarray(a, popmean, axis)
-    rs = check_random_state(seed)
 
     if a.size == 0:
-        return np.nan, np.nan
+        return _permtest_output(np.nan, np.nan, tail_approx=tail_approx)
 
     # ensure popmean will broadcast to `a` correctly
     if popmean.ndim != a.ndim:
@@ -223,212 +1284,1688 @@ def permtest_1samp(a, popmean, axis=0, n_perm=1000, seed=0):
     true_mean = zeroed.mean(axis=axis) / 1
     abs_mean = np.abs(true_mean)
 
-    # this for loop is not _the fastest_ but is memory efficient
-    # the broadcasting alt. would mean storing zeroed.size * n_perm in memory
-    permutations = np.ones(true_mean.shape)
-    for perm in range(n_perm):
-        flipped = zeroed * rs.choice([-1, 1], size=zeroed.shape)  # sign flip
-        permutations += np.abs(flipped.mean(axis=axis)) >= abs_mean
+    axis = axis % zeroed.ndim
+    if _use_exact(n_perm, zeroed.shape[axis]):
+        if shard is not None:
+            raise ValueError('Cannot use `shard` when enumerating all sign '
+                             'flips.')
+        _warn_exact(n_exceed=n_exceed, tail_approx=tail_approx, n_jobs=n_jobs,
+                    checkpoint=checkpoint)
+        data = np.moveaxis(zeroed, axis, 0)
+        pvals = _exact_signflip_pvals(data.reshape(len(data), -1),
+                                      abs_mean.reshape(-1),
+                                      batch_size=batch_size,
+                                      max_memory=max_memory,
+                                      correction=correction)
+        return _permtest_output(true_mean, pvals, tail_approx=tail_approx)
+
+    # the fully broadcast alternative would mean storing zeroed.size * n_perm
+    # in memory, so compute permutations in batches (sign flips + products)
+    data = np.moveaxis(zeroed, axis, 0).reshape(zeroed.shape[axis], -1)
+
+    # max-statistic correction requires the same flips for all features
+    shared_flips = shared_flips or correction == 'maxT'
+
+    def permute(rs, start, size, active):
+        if shared_flips:
+            signs = rs.choice([-1, 1], size=(size, len(data)))
+            subset = data if active is None else data[:, active]
+            return (signs @ subset) / len(data)
+        if active is None:
+            flipped = zeroed * rs.choice([-1, 1], size=(size,) + zeroed.shape)
+            return flipped.mean(axis=axis + 1).reshape(size, -1)
+        subset = data[:, active]
+        flipped = subset * rs.choice([-1, 1], size=(size,) + subset.shape)
+        return flipped.mean(axis=1)
+
+    if checkpoint is not None:
+        checkpoint = utils._Checkpoint(checkpoint, 'permtest_1samp', a,
+                                       popmean, axis, n_perm, seed, n_exceed,
+                                       tail_approx, correction,
+                                       n_jobs is None, shard, shared_flips)
+
+    # shared flips only require the signs and permuted means of each batch
+    if shared_flips:
+        perm_nbytes = (data.shape[0] + data.shape[1]) * 8
+    else:
+        perm_nbytes = zeroed.size * 16
+
+    if shard is not None:
+        return _permutation_shard(permute, true_mean, n_perm, perm_nbytes,
+                                  shard, seed=seed, batch_size=batch_size,
+                                  max_memory=max_memory, n_exceed=n_exceed,
+                                  tail_approx=tail_approx,
+                                  correction=correction, n_jobs=n_jobs,
+                                  checkpoint=checkpoint)
+
+    pvals, tail_fit = _permutation_pvals(permute, abs_mean.reshape(-1), n_perm,
+                                         perm_nbytes, seed=seed,
+                                         batch_size=batch_size,
+                                         max_memory=max_memory,
+                                         n_exceed=n_exceed,
+                                         tail_approx=tail_approx,
+                                         correction=correction,
+                                         n_jobs=n_jobs,
+                                         checkpoint=checkpoint)
+
+    return _permtest_output(true_mean, pvals, tail_fit, tail_approx)
+
+
+def permtest_rel(a, b, axis=0, n_perm=1000, seed=0, batch_size=None,
+                 max_memory=None, n_exceed=None, tail_approx=False,
+                 correction=None, n_jobs=None, shard=None, checkpoint=None):
+    """
+    Non-parametric equivalent of :py:func:`scipy.stats.ttest_rel`
+
+    Generates two-tailed p-value for hypothesis of whether related samples `a`
+    and `b` differ using permutation tests
+
+    Parameters
+    ----------
+    a, b : array_like
+        Sample observations. These arrays must have the same shape.
+    axis : int or None, optional
+        Axis along which to compute test. If None, compute over whole arrays
+        of `a` and `b`. Default: 0
+    n_perm : int or 'exact', optional
+        Number of permutations to assess. Unless `a` and `b` are very small
+        along `axis` this will approximate a randomization test via Monte
+        Carlo simulations. If 'exact', or if `a` and `b` are small enough along
+        `axis` that all possible exchanges of pairs number fewer than `n_perm`,
+        every exchange will be enumerated and exact p-values will be returned.
+        At most 2**30 exchanges (i.e., 31 pairs) can be enumerated.
+        Default: 1000
+    seed : {int, np.random.RandomState instance, None}, optional
+        Seed for random number generation. Set to None for "randomness".
+        Default: 0
+    batch_size : int, optional
+        Number of permutations to compute simultaneously. Larger values are
+        faster but require more memory. If not specified this is determined
+        from `max_memory`. Default: None
+    max_memory : int, optional
+        Approximate maximum number of bytes to use for each batch of
+        permutations. Ignored if `batch_size` is specified. If neither is
+        specified batches will use at most 256 MiB. Default: None
+    n_exceed : int, optional
+        If specified, permutations for each feature are stopped as soon as this
+        many permuted statistics exceed the original statistic, following the
+        sequential procedure of Besag & Clifford (1991). Features that are
+        clearly not significant thus require many fewer permutations.
+        Default: None
+    tail_approx : bool, optional
+        Whether to approximate small p-values by fitting a generalized Pareto
+        distribution to the upper tail of the permutation null distribution,
+        as in Winkler et al. (2016). This permits accurate p-values far smaller
+        than 1 / (`n_perm` + 1). Cannot be combined with `n_exceed`.
+        Default: False
+    correction : {None, 'maxT'}, optional
+        If 'maxT', p-values are corrected for the family-wise error rate across
+        all features by comparing each statistic to the null distribution of
+        the maximum absolute statistic. This requires only O(features +
+        `n_perm`) memory. If `tail_approx` is True the tail of this maximum
+        null distribution is approximated instead. Cannot be combined with
+        `n_exceed`. Default: None
+    n_jobs : int, optional
+        Number of processes used to compute permutations in parallel. Set to
+        -1 to use all available cores. Cannot be combined with `n_exceed`.
+        Default: None
+    shard : (2,) tuple of int, optional
+        If specified as `(index, n_shards)`, only the `index`-th of `n_shards`
+        equally-sized subsets of the permutations is run and a
+        :class:`PermutationResult` is returned instead of p-values. Merging
+        the results from all shards yields p-values identical to those from a
+        single run with `n_jobs` specified. All shards must be run with the
+        same integer `seed`. Cannot be combined with `n_exceed`. Default: None
+    checkpoint : str or os.PathLike, optional
+        Filepath where progress should be periodically saved. If the function
+        is interrupted, calling it again with the same inputs and `checkpoint`
+        will resume from the last save and yield results identical to those of
+        an uninterrupted call. The checkpoint is removed once all permutations
+        have been run. Default: None
+
+    Returns
+    -------
+    stat : float or numpy.ndarray
+        Average difference between `a` and `b`
+    pvalue : float or numpy.ndarray
+        Non-parametric p-value
+    tail_fit : bool or numpy.ndarray
+        Whether each p-value was extrapolated from the fitted tail of the null
+        distribution. Only returned if `tail_approx` is True.
+    result : PermutationResult
+        Partial results of the permutation test. Only returned (instead of all
+        of the above) if `shard` is specified.
+
+    Notes
+    -----
+    The lowest p-value that can be returned by this function is equal to 1 /
+    (`n_perm` + 1). When all exchanges are enumerated the lowest p-value is
+    instead equal to 1 / 2**(N - 1), where `N` is the length of `a` along
+    `axis`. Since enumeration is exact, `n_exceed`, `tail_approx`, `n_jobs`
+    and `checkpoint` have no effect when all exchanges are enumerated (a
+    warning is raised if any of them is specified).
+
+    Exchanging `a` and `b` within a pair is equivalent to flipping the sign of
+    their difference, so permutations are computed by sign-flipping `b - a`.
+    Results are identical for a given `seed` regardless of the provided
+    `batch_size` or `max_memory`.
+
+    If `n_jobs` is specified, permutations are split into chunks of 100 that
+    are each generated from an independent random stream spawned from `seed`
+    (via :obj:`numpy.random.SeedSequence`) and run across `n_jobs` processes.
+    Results are then identical for a given `seed` regardless of `n_jobs`,
+    though they will differ from those obtained when `n_jobs` is None.
+
+    If `n_exceed` is specified then the p-value of a feature whose
+    permutations stopped after `L` permutations is `n_exceed` / `L`; for all
+    other features it is computed as normal.
+
+    If `tail_approx` is True the largest 10% of the permuted statistics are
+    retained for each feature and a generalized Pareto distribution is fit to
+    them. Whenever the fit is rejected by an Anderson-Darling test (at alpha =
+    0.05) the smallest 10% of the retained values are discarded (i.e., the
+    threshold is moved up) and the distribution is fit again. P-values are
+    extrapolated from the accepted fit for features whose statistic exceeds
+    its threshold; all other p-values are computed as normal. If the fit
+    implies a bounded tail an exponential tail is used instead, since
+    extrapolating a bounded tail can yield p-values that are far too small.
+
+    If `correction='maxT'` the same exchanges are applied to all features so
+    that the dependence between features is preserved in the null
+    distribution.
+
+    References
+    ----------
+    Besag, J., & Clifford, P. (1991). Sequential Monte Carlo p-values.
+    Biometrika, 78(2), 301-304.
+
+    Winkler, A. M., Ridgway, G. R., Douaud, G., Nichols, T. E., & Smith, S.
+    M. (2016). Faster permutation inference in brain imaging. NeuroImage,
+    141, 502-516.
+
+    Examples
+    --------
+    >>> from netneurotools import stats
+
+    >>> np.random.seed(12345678)  # set random seed for reproducible results
+    >>> rvs1 = np.random.normal(loc=5, scale=10, size=500)
+    >>> rvs2 = (np.random.normal(loc=5, scale=10, size=500)
+    ...         + np.random.normal(scale=0.2, size=500))
+    >>> stats.permtest_rel(rvs1, rvs2)  # doctest: +SKIP
+    (-0.16506275161572695, 0.8021978021978022)
+
+    >>> rvs3 = (np.random.normal(loc=8, scale=10, size=500)
+    ...         + np.random.normal(scale=0.2, size=500))
+    >>> stats.permtest_rel(rvs1, rvs3)  # doctest: +SKIP
+    (2.40533726097883, 0.000999000999000999)
+    """
+
+    a, b, axis = _chk2_asarray(a, b, axis)
+
+    if a.shape[axis] != b.shape[axis]:
+        raise ValueError('Provided arrays do not have same length along axis')
+
+    if a.size == 0 or b.size == 0:
+        return _permtest_output(np.nan, np.nan, tail_approx=tail_approx)
+
+    # exchanging `a` and `b` is equivalent to sign-flipping their difference,
+    # so we only ever need to hold the paired differences in memory
+    diff = np.moveaxis(b - a, axis, 0)
+    true_diff = diff.mean(axis=0) / 1
+    abs_true = np.abs(true_diff)
+
+    if _use_exact(n_perm, len(diff)):
+        if shard is not None:
+            raise ValueError('Cannot use `shard` when enumerating all '
+                             'exchanges.')
+        _warn_exact(n_exceed=n_exceed, tail_approx=tail_approx, n_jobs=n_jobs,
+                    checkpoint=checkpoint)
+        pvals = _exact_signflip_pvals(diff.reshape(len(diff), -1),
+                                      abs_true.reshape(-1),
+                                      batch_size=batch_size,
+                                      max_memory=max_memory,
+                                      correction=correction)
+        return _permtest_output(true_diff, pvals, tail_approx=tail_approx)
+
+    # pairs are exchanged jointly across the last dimension of `diff`
+    # (i.e., features) but independently for every other dimension
+    flip_shape = diff.shape[:-1] if diff.ndim > 1 else diff.shape
+    data = diff.reshape(len(diff), -1)
+
+    def permute(rs, start, size, active):
+        # a pair is exchanged when the first of two random draws is larger
+        if correction == 'maxT':
+            # max-statistic correction requires the same exchanges for all
+            # features
+            swap = rs.random_sample((size, 2, len(data)))
+            signs = np.where(swap[:, 0] > swap[:, 1], -1.0, 1.0)
+            return (signs @ data) / len(data)
+        if active is None:
+            swap = rs.random_sample((size, 2) + flip_shape)
+            signs = np.where(swap[:, 0] > swap[:, 1], -1.0, 1.0)
+            if diff.ndim > 1:
+                signs = signs[..., np.newaxis]
+            return (signs * diff).mean(axis=1).reshape(size, -1)
+        swap = rs.random_sample((size, 2, len(data)))
+        signs = np.where(swap[:, 0] > swap[:, 1], -1.0, 1.0)
+        return (signs[..., np.newaxis] * data[:, active]).mean(axis=1)
+
+    perm_nbytes = diff.size * 16 + np.prod(flip_shape) * 24
+    if checkpoint is not None:
+        checkpoint = utils._Checkpoint(checkpoint, 'permtest_rel', a, b,
+                                       axis, n_perm, seed, n_exceed,
+                                       tail_approx, correction,
+                                       n_jobs is None, shard)
+
+    if shard is not None:
+        return _permutation_shard(permute, true_diff, n_perm, perm_nbytes,
+                                  shard, seed=seed, batch_size=batch_size,
+                                  max_memory=max_memory, n_exceed=n_exceed,
+                                  tail_approx=tail_approx,
+                                  correction=correction, n_jobs=n_jobs,
+                                  checkpoint=checkpoint)
+
+    pvals, tail_fit = _permutation_pvals(permute, abs_true.reshape(-1), n_perm,
+                                         perm_nbytes, seed=seed,
+                                         batch_size=batch_size,
+                                         max_memory=max_memory,
+                                         n_exceed=n_exceed,
+                                         tail_approx=tail_approx,
+                                         correction=correction,
+                                         n_jobs=n_jobs,
+                                         checkpoint=checkpoint)
+
+    return _permtest_output(true_diff, pvals, tail_fit, tail_approx)
+
+
+def _center(x):
+    """
+    Mean-centers columns of `x`
+
+    Means are accumulated in (at least) double precision but the centered
+    array retains the floating point precision of `x`
+    """
+
+    dtype = utils._float_dtype(x.dtype)
+    mean = x.mean(axis=0, dtype=np.promote_types(dtype, np.float64))
+
+    return x - mean.astype(dtype, copy=False)
+
+
+def _scale(xc, ddof=1):
+    """
+    Computes standard deviation of columns of mean-centered `xc`
+
+    Sums of squares are accumulated in (at least) double precision but the
+    standard deviations retain the floating point precision of `xc`
+    """
+
+    acc = np.promote_types(xc.dtype, np.float64)
+    var = np.sum(xc * xc, axis=0, dtype=acc) / max(len(xc) - ddof, 0)
+
+    return np.sqrt(var).astype(xc.dtype, copy=False)
+
+
+def _zscore(x, ddof=1):
+    """
+    Z-scores columns of `x`, retaining its floating point precision
+    """
+
+    xc = _center(x)
+
+    return xc / _scale(xc, ddof=ddof)
+
+
+def _resampled_pearsonr(ac, zb, idx, scale=None):
+    """
+    Computes correlations between `ac` resampled by each row of `idx` and `zb`
+
+    Parameters
+    ----------
+    ac : (N, F) numpy.ndarray
+        Mean-centered observations to be resampled
+    zb : (N, F) numpy.ndarray
+        Standardized (i.e., z-scored, with `ddof=1`) observations. Either `ac`
+        or `zb` may instead have only a single column.
+    idx : (P, N) numpy.ndarray
+        Resampling indices for `ac`, where each row is one resampling
+    scale : (F,) numpy.ndarray, optional
+        Standard deviation (with `ddof=1`) of `ac`. Only valid if every row of
+        `idx` is a true permutation; if not provided the standard deviation is
+        computed for every resampling. Default: None
+
+    Returns
+    -------
+    corr : (P, F) numpy.ndarray
+        Correlations for each resampling
+    """
+
+    n_resamp, n_obs = idx.shape
+    offsets = np.arange(n_resamp)[:, None] * n_obs
+    counts = None
+
+    # since `zb` sums to zero we need not re-center the resampled `ac`, so the
+    # products can be computed from `ac` directly. where possible we scatter
+    # `zb` onto the resampled rows so that this is a single matrix product
+    if ac.shape[-1] == 1:
+        num = ac[idx, 0] @ zb
+    elif zb.shape[-1] == 1:
+        weights = np.bincount((idx + offsets).ravel(),
+                              weights=np.tile(zb[:, 0], n_resamp),
+                              minlength=n_resamp * n_obs)
+        num = weights.reshape(n_resamp, n_obs).astype(ac.dtype) @ ac
+    else:
+        num = np.einsum('pnf,nf->pf', ac[idx], zb)
+
+    # resamplings that are not true permutations (e.g., from spins) change the
+    # variance of `ac`, so recompute it from how often each row is resampled
+    if scale is None:
+        counts = np.bincount((idx + offsets).ravel(),
+                             minlength=n_resamp * n_obs)
+        counts = counts.reshape(n_resamp, n_obs).astype(ac.dtype)
+        mean = (counts @ ac) / n_obs
+        scale = np.sqrt(((counts @ ac ** 2) - n_obs * mean ** 2)
+                        / (n_obs - 1))
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        corr = num / (scale * (n_obs - 1))
+
+    return np.clip(corr, -1, 1)
+
+
+def _resampled_spearmanr(dense, zb, idx):
+    """
+    Computes rank correlations between `dense` resampled by `idx` and `zb`
+
+    Parameters
+    ----------
+    dense : (N, F) numpy.ndarray
+        Dense ranks (i.e., integers starting at zero, where tied observations
+        share a rank) of observations to be resampled
+    zb : (N, F) numpy.ndarray
+        Standardized (i.e., z-scored, with `ddof=1`) ranks of observations.
+        Either `dense` or `zb` may instead have only a single column.
+    idx : (P, N) numpy.ndarray
+        Resampling indices for `dense`, where each row is one resampling
+
+    Returns
+    -------
+    corr : (P, F) numpy.ndarray
+        Rank correlations for each resampling
+    """
+
+    n_resamp, n_obs = idx.shape
+    n_col = dense.shape[-1]
+
+    # count how often each dense rank occurs in every resampling (and column)
+    # of `dense`; the (tie-averaged) rank of a value is then the number of
+    # resampled values smaller than it plus half the number equal to it
+    offsets = np.arange(n_resamp * n_col).reshape(n_resamp, 1, n_col) * n_obs
+    keys = dense[idx] + offsets
+    counts = np.bincount(keys.ravel(), minlength=n_resamp * n_col * n_obs)
+    counts = counts.reshape(n_resamp * n_col, n_obs)
+    ranks = np.cumsum(counts, axis=-1) - (counts - 1) / 2
+
+    # ranks always sum to the same value so they can be centered exactly
+    rc = (ranks.ravel()[keys] - (n_obs + 1) / 2).astype(zb.dtype)
+    if n_col == 1:
+        num = rc[..., 0] @ zb
+    else:
+        num = np.einsum('pnf,nf->pf', rc, zb)
+    scale = np.sqrt(np.einsum('pnf,pnf->pf', rc, rc) / (n_obs - 1))
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        corr = num / (scale * (n_obs - 1))
+
+    return np.clip(corr, -1, 1)
+
+
+def permtest_pearsonr(a, b, axis=0, n_perm=1000, resamples=None, seed=0,
+                      batch_size=None, max_memory=None, n_exceed=None,
+                      tail_approx=False, correction=None, n_jobs=None,
+                      shard=None, checkpoint=None, method='pearson'):
+    """
+    Non-parametric equivalent of :py:func:`scipy.stats.pearsonr`
+
+    Generates two-tailed p-value for hypothesis of whether samples `a` and `b`
+    are correlated using permutation tests
+
+    Parameters
+    ----------
+    a,b : (N[, M]) array_like
+        Sample observations. These arrays must have the same length and either
+        an equivalent number of columns or be broadcastable
+    axis : int or None, optional
+        Axis along which to compute test. If None, compute over whole arrays
+        of `a` and `b`. Default: 0
+    n_perm : int, optional
+        Number of permutations to assess. Unless `a` and `b` are very small
+        along `axis` this will approximate a randomization test via Monte
+        Carlo simulations. Default: 1000
+    resamples : (N, P) array_like, optional
+        Resampling array used to shuffle `a` when generating null distribution
+        of correlations. This array must have the same length as `a` and `b`
+        and should have at least the same number of columns as `n_perm` (if it
+        has more then only `n_perm` columns will be used. When not specified a
+        standard permutation is used to shuffle `a`. Default: None
+    seed : {int, np.random.RandomState instance, None}, optional
+        Seed for random number generation. Set to None for "randomness".
+        Default: 0
+    batch_size : int, optional
+        Number of permutations to compute simultaneously. Larger values are
+        faster but require more memory. If not specified this is determined
+        from `max_memory`. Default: None
+    max_memory : int, optional
+        Approximate maximum number of bytes to use for each batch of
+        permutations. Ignored if `batch_size` is specified. If neither is
+        specified batches will use at most 256 MiB. Default: None
+    n_exceed : int, optional
+        If specified, permutations for each feature are stopped as soon as this
+        many permuted statistics exceed the original statistic, following the
+        sequential procedure of Besag & Clifford (1991). Features that are
+        clearly not significant thus require many fewer permutations.
+        Default: None
+    tail_approx : bool, optional
+        Whether to approximate small p-values by fitting a generalized Pareto
+        distribution to the upper tail of the permutation null distribution,
+        as in Winkler et al. (2016). This permits accurate p-values far smaller
+        than 1 / (`n_perm` + 1). Cannot be combined with `n_exceed`.
+        Default: False
+    correction : {None, 'maxT'}, optional
+        If 'maxT', p-values are corrected for the family-wise error rate across
+        all features by comparing each statistic to the null distribution of
+        the maximum absolute statistic. This requires only O(features +
+        `n_perm`) memory. If `tail_approx` is True the tail of this maximum
+        null distribution is approximated instead. Cannot be combined with
+        `n_exceed`. Default: None
+    n_jobs : int, optional
+        Number of processes used to compute permutations in parallel. Set to
+        -1 to use all available cores. Cannot be combined with `n_exceed`.
+        Default: None
+    shard : (2,) tuple of int, optional
+        If specified as `(index, n_shards)`, only the `index`-th of `n_shards`
+        equally-sized subsets of the permutations is run and a
+        :class:`PermutationResult` is returned instead of p-values. Merging
+        the results from all shards yields p-values identical to those from a
+        single run with `n_jobs` specified. All shards must be run with the
+        same integer `seed`. Cannot be combined with `n_exceed`. Default: None
+    checkpoint : str or os.PathLike, optional
+        Filepath where progress should be periodically saved. If the function
+        is interrupted, calling it again with the same inputs and `checkpoint`
+        will resume from the last save and yield results identical to those of
+        an uninterrupted call. The checkpoint is removed once all permutations
+        have been run. Default: None
+    method : {'pearson', 'spearman'}, optional
+        Correlation to compute. If 'spearman', rank correlations (as in
+        :func:`efficient_spearmanr`) are computed instead. Default: 'pearson'
+
+    Returns
+    -------
+    corr : float or numpyndarray
+        Correlations
+    pvalue : float or numpy.ndarray
+        Non-parametric p-value
+    tail_fit : bool or numpy.ndarray
+        Whether each p-value was extrapolated from the fitted tail of the null
+        distribution. Only returned if `tail_approx` is True.
+    result : PermutationResult
+        Partial results of the permutation test. Only returned (instead of all
+        of the above) if `shard` is specified.
+
+    Notes
+    -----
+    The lowest p-value that can be returned by this function is equal to 1 /
+    (`n_perm` + 1).
+
+    Both `a` and `b` are standardized only once; permuted correlations are
+    then computed for batches of permutations (or columns of `resamples`) via
+    matrix products. If `method` is 'spearman' both arrays are likewise ranked
+    only once: permuting `a` does not change its ranks, so permuted rank
+    correlations cost the same as permuted Pearson correlations. Resamplings
+    that are not true permutations (e.g., spins) can repeat observations of
+    `a`, so the ranks of each resampling are recomputed (in linear time) from
+    how often each of the original ranks is resampled. Results are identical
+    for a given `seed` regardless of the provided `batch_size` or
+    `max_memory`. Single precision inputs are standardized, resampled, and
+    correlated in single precision (halving the memory required per
+    permutation); the returned correlations are then also single precision.
+
+    If `n_jobs` is specified, permutations are split into chunks of 100 that
+    are each generated from an independent random stream spawned from `seed`
+    (via :obj:`numpy.random.SeedSequence`) and run across `n_jobs` processes.
+    Results are then identical for a given `seed` regardless of `n_jobs`,
+    though they will differ from those obtained when `n_jobs` is None.
+
+    If `n_exceed` is specified then the p-value of a feature whose
+    permutations stopped after `L` permutations is `n_exceed` / `L`; for all
+    other features it is computed as normal.
+
+    If `tail_approx` is True the largest 10% of the permuted statistics are
+    retained for each feature and a generalized Pareto distribution is fit to
+    them. Whenever the fit is rejected by an Anderson-Darling test (at alpha =
+    0.05) the smallest 10% of the retained values are discarded (i.e., the
+    threshold is moved up) and the distribution is fit again. P-values are
+    extrapolated from the accepted fit for features whose statistic exceeds
+    its threshold; all other p-values are computed as normal. If the fit
+    implies a bounded tail an exponential tail is used instead, since
+    extrapolating a bounded tail can yield p-values that are far too small.
+
+    References
+    ----------
+    Besag, J., & Clifford, P. (1991). Sequential Monte Carlo p-values.
+    Biometrika, 78(2), 301-304.
+
+    Winkler, A. M., Ridgway, G. R., Douaud, G., Nichols, T. E., & Smith, S.
+    M. (2016). Faster permutation inference in brain imaging. NeuroImage,
+    141, 502-516.
+
+    Examples
+    --------
+    >>> from netneurotools import datasets, stats
+
+    >>> np.random.seed(12345678)  # set random seed for reproducible results
+    >>> x, y = datasets.make_correlated_xy(corr=0.1, size=100)
+    >>> stats.permtest_pearsonr(x, y)  # doctest: +SKIP
+    (0.10032564626876286, 0.3046953046953047)
+
+    >>> x, y = datasets.make_correlated_xy(corr=0.5, size=100)
+    >>> stats.permtest_pearsonr(x, y)  # doctest: +SKIP
+    (0.500040365781984, 0.000999000999000999)
+
+    Also works with multiple columns by either broadcasting the smaller array
+    to the larger:
+
+    >>> z = x + np.random.normal(loc=1, size=100)
+    >>> stats.permtest_pearsonr(x, np.column_stack([y, z]))
+    (array([0.50004037, 0.25843187]), array([0.000999  , 0.01098901]))
+
+    or by using matching columns in the two arrays (e.g., `x` and `y` vs
+    `a` and `b`):
+
+    >>> a, b = datasets.make_correlated_xy(corr=0.9, size=100)
+    >>> stats.permtest_pearsonr(np.column_stack([x, a]), np.column_stack([y, b]))
+    (array([0.50004037, 0.89927523]), array([0.000999, 0.000999]))
+    """  # noqa
+
+    a, b, axis = _chk2_asarray(a, b, axis)
+
+    if method not in ('pearson', 'spearman'):
+        raise ValueError('Provided `method` must be one of [\'pearson\', '
+                         '\'spearman\'], not {}'.format(method))
+
+    if len(a) != len(b):
+        raise ValueError('Provided arrays do not have same length')
+
+    if a.size == 0 or b.size == 0:
+        return _permtest_output(np.nan, np.nan, tail_approx=tail_approx)
+
+    if resamples is not None:
+        resamples = np.asarray(resamples)
+        if n_perm > resamples.shape[-1]:
+            raise ValueError('Number of permutations requested exceeds size '
+                             'of resampling array.')
+
+    # divide by one forces coercion to float if ndim = 0
+    if method == 'spearman':
+        true_corr = efficient_spearmanr(a, b)[0] / 1
+    else:
+        true_corr = efficient_pearsonr(a, b)[0] / 1
+    true_corr = _snap_corr(true_corr)
+    abs_true = np.abs(true_corr)
+
+    # standardize the inputs once; only the row order of `a` changes
+    a, b = a.reshape(len(a), -1), b.reshape(len(b), -1)
+    if a.shape[-1] != b.shape[-1] and 1 not in (a.shape[-1], b.shape[-1]):
+        a, b = np.broadcast_arrays(a, b)  # raises a ValueError
+    inputs, dense = (a, b), None
+    if method == 'spearman':
+        # resampled ranks are recovered from the (dense) ranks of `a`
+        if resamples is not None:
+            dense = (sstats.rankdata(a, method='dense', axis=0) - 1)
+            dense = dense.astype(int)
+        a, b = _rank(a), _rank(b)
+    # inputs keep their floating point precision (e.g., single precision data
+    # are resampled and correlated in single precision)
+    dtype = utils._float_dtype(a.dtype, b.dtype)
+    with np.errstate(invalid='ignore'):
+        ac = _center(a.astype(dtype, copy=False))
+        zb = _zscore(b.astype(dtype, copy=False), ddof=1)
+        scale = _scale(_center(ac), ddof=1) if resamples is None else None
+    n_feat = max(ac.shape[-1], zb.shape[-1])
+
+    perm_nbytes = len(a) * (8 if resamples is None else 24) + n_feat * 16
+    if ac.shape[-1] > 1 and zb.shape[-1] > 1:
+        perm_nbytes += ac.size * ac.itemsize
+    if dense is not None:
+        perm_nbytes += dense.size * 32
+
+    def permute(rs, start, size, active):
+        if resamples is None:
+            idx = np.vstack([rs.permutation(len(a))
+                             for perm in range(size)])
+        else:
+            idx = resamples[:, start:start + size].T
+        if dense is not None:
+            return _resampled_spearmanr(
+                dense if active is None or dense.shape[-1] == 1
+                else dense[:, active],
+                zb if active is None or zb.shape[-1] == 1 else zb[:, active],
+                idx
+            )
+        if active is None:
+            return _resampled_pearsonr(ac, zb, idx, scale=scale)
+        return _resampled_pearsonr(
+            ac if ac.shape[-1] == 1 else ac[:, active],
+            zb if zb.shape[-1] == 1 else zb[:, active], idx,
+            scale=None if scale is None or scale.size == 1 else scale[active]
+        )
+
+    if checkpoint is not None:
+        checkpoint = utils._Checkpoint(checkpoint, 'permtest_pearsonr',
+                                       *inputs, axis, resamples, n_perm, seed,
+                                       n_exceed, tail_approx, correction,
+                                       n_jobs is None, shard, method)
+
+    if shard is not None:
+        return _permutation_shard(permute, true_corr, n_perm, perm_nbytes,
+                                  shard, seed=seed, batch_size=batch_size,
+                                  max_memory=max_memory, n_exceed=n_exceed,
+                                  tail_approx=tail_approx,
+                                  correction=correction, n_jobs=n_jobs,
+                                  checkpoint=checkpoint)
+
+    pvals, tail_fit = _permutation_pvals(permute, abs_true.reshape(-1), n_perm,
+                                         perm_nbytes, seed=seed,
+                                         batch_size=batch_size,
+                                         max_memory=max_memory,
+                                         n_exceed=n_exceed,
+                                         tail_approx=tail_approx,
+                                         correction=correction,
+                                         n_jobs=n_jobs,
+                                         checkpoint=checkpoint)
+
+    return _permtest_output(true_corr, pvals, tail_fit, tail_approx)
+
+
+def _freedman_lane_pearsonr(ea, zb, design, pinv, idx):
+    """
+    Computes partial correlations between permuted residuals `ea` and `zb`
+
+    Parameters
+    ----------
+    ea : (N, F) numpy.ndarray
+        Residuals of the reduced model (i.e., from regressing confounds out of
+        observations) to be permuted
+    zb : (N, F) numpy.ndarray
+        Residuals of the reduced model scaled to unit norm. Either `ea` or `zb`
+        may instead have only a single column.
+    design : (N, R) numpy.ndarray
+        Coefficient matrix of confounds (including an intercept)
+    pinv : (R, N) numpy.ndarray
+        Pseudoinverse of `design`
+    idx : (P, N) numpy.ndarray
+        Permutation indices for `ea`, where each row is one permutation
+
+    Returns
+    -------
+    corr : (P, F) numpy.ndarray
+        Partial correlations for each permutation
+    """
+
+    # since `zb` is orthogonal to the confounds, correlating it with the refit
+    # residuals of the permuted `ea` requires only the permuted `ea` itself;
+    # the norm of the refit residuals is that of `ea` (which permutations do
+    # not change) minus that of its projection onto the confounds
+    perm = ea[idx]
+    if ea.shape[-1] == 1:
+        num = perm[..., 0] @ zb
+    else:
+        num = np.einsum('pnf,nf->pf', perm, zb)
+    proj = np.einsum('pkf,pkf->pf', np.einsum('nk,pnf->pkf', design, perm),
+                     np.einsum('kn,pnf->pkf', pinv, perm))
+    ss = np.sum(ea ** 2, axis=0)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        corr = num / np.sqrt(np.clip(ss - proj, 0, None))
+
+    return np.clip(corr, -1, 1)
+
+
+def permtest_partial_pearsonr(a, b, confounds, n_perm=1000, seed=0,
+                              batch_size=None, max_memory=None,
+                              n_exceed=None, tail_approx=False,
+                              correction=None, n_jobs=None, shard=None,
+                              checkpoint=None):
+    """
+    Permutation test of partial correlations between `a` and `b`
+
+    Generates two-tailed p-value for hypothesis of whether samples `a` and `b`
+    are correlated after controlling for `confounds` using the permutation
+    procedure of Freedman & Lane (1983)
+
+    Parameters
+    ----------
+    a,b : (N[, M]) array_like
+        Sample observations. These arrays must have the same length and either
+        an equivalent number of columns or be broadcastable
+    confounds : (N[, R]) array_like
+        Coefficient matrix of `R` confounding variables for `N` samples. An
+        intercept is always added.
+    n_perm : int, optional
+        Number of permutations to assess. Default: 1000
+    seed : {int, np.random.RandomState instance, None}, optional
+        Seed for random number generation. Set to None for "randomness".
+        Default: 0
+    batch_size : int, optional
+        Number of permutations to compute simultaneously. Larger values are
+        faster but require more memory. If not specified this is determined
+        from `max_memory`. Default: None
+    max_memory : int, optional
+        Approximate maximum number of bytes to use for each batch of
+        permutations. Ignored if `batch_size` is specified. If neither is
+        specified batches will use at most 256 MiB. Default: None
+    n_exceed : int, optional
+        If specified, permutations for each feature are stopped as soon as this
+        many permuted statistics exceed the original statistic, following the
+        sequential procedure of Besag & Clifford (1991). Default: None
+    tail_approx : bool, optional
+        Whether to approximate small p-values by fitting a generalized Pareto
+        distribution to the upper tail of the permutation null distribution,
+        as in Winkler et al. (2016). Cannot be combined with `n_exceed`.
+        Default: False
+    correction : {None, 'maxT'}, optional
+        If 'maxT', p-values are corrected for the family-wise error rate across
+        all features by comparing each statistic to the null distribution of
+        the maximum absolute statistic. Cannot be combined with `n_exceed`.
+        Default: None
+    n_jobs : int, optional
+        Number of processes used to compute permutations in parallel. Set to
+        -1 to use all available cores. Cannot be combined with `n_exceed`.
+        Default: None
+    shard : (2,) tuple of int, optional
+        If specified as `(index, n_shards)`, only the `index`-th of `n_shards`
+        equally-sized subsets of the permutations is run and a
+        :class:`PermutationResult` is returned instead of p-values. All shards
+        must be run with the same integer `seed`. Cannot be combined with
+        `n_exceed`. Default: None
+    checkpoint : str or os.PathLike, optional
+        Filepath where progress should be periodically saved. If the function
+        is interrupted, calling it again with the same inputs and `checkpoint`
+        will resume from the last save. Default: None
+
+    Returns
+    -------
+    corr : float or numpy.ndarray
+        Partial correlations
+    pvalue : float or numpy.ndarray
+        Non-parametric p-value
+    tail_fit : bool or numpy.ndarray
+        Whether each p-value was extrapolated from the fitted tail of the null
+        distribution. Only returned if `tail_approx` is True.
+    result : PermutationResult
+        Partial results of the permutation test. Only returned (instead of all
+        of the above) if `shard` is specified.
+
+    Notes
+    -----
+    The lowest p-value that can be returned by this function is equal to 1 /
+    (`n_perm` + 1).
+
+    The residuals of `a` from the reduced model (i.e., `a ~ confounds`) are
+    permuted and added back to the fitted values, and the model is refit to
+    generate each permuted partial correlation. Since refitting is a
+    projection onto the confounds, the pseudoinverse of `confounds` is
+    computed only once and the refit for each batch of permutations consists
+    only of matrix products.
+
+    References
+    ----------
+    Freedman, D., & Lane, D. (1983). A nonstochastic interpretation of
+    reported significance levels. Journal of Business & Economic Statistics,
+    1(4), 292-298.
+
+    Winkler, A. M., Ridgway, G. R., Webster, M. A., Smith, S. M., & Nichols,
+    T. E. (2014). Permutation inference for the general linear model.
+    NeuroImage, 92, 381-397.
+
+    Examples
+    --------
+    >>> from netneurotools import stats
+
+    >>> rs = np.random.RandomState(1234)
+    >>> age = rs.normal(size=100)
+    >>> x, y = age + rs.normal(size=100), age + rs.normal(size=100)
+
+    `x` and `y` are correlated, but only because both depend on `age`:
+
+    >>> stats.permtest_partial_pearsonr(x, y, age)  # doctest: +SKIP
+    (0.13203349918880333, 0.1958041958041958)
+    """
+
+    a, b = np.asarray(a), np.asarray(b)
+    confounds = np.asarray(confounds)
+
+    if len(a) != len(b) or len(a) != len(confounds):
+        raise ValueError('Provided arrays do not have same length')
+
+    if a.size == 0 or b.size == 0:
+        return _permtest_output(np.nan, np.nan, tail_approx=tail_approx)
+
+    a, b = a.reshape(len(a), -1), b.reshape(len(b), -1)
+    if a.shape[-1] != b.shape[-1] and 1 not in (a.shape[-1], b.shape[-1]):
+        a, b = np.broadcast_arrays(a, b)  # raises a ValueError
+
+    # fit the reduced models once; every permutation re-uses the factorized
+    # confounds (and thus the hat matrix) for its refit
+    design = utils.add_constant(confounds)
+    res = Residualizer(normalize=False, add_intercept=False)
+    ea = res.fit_transform(design, a)
+    eb = res.fit_transform(design, b)
+    pinv = res._pinv
+    with np.errstate(invalid='ignore', divide='ignore'):
+        zb = eb / np.sqrt(np.sum(eb ** 2, axis=0))
+
+    # divide by one forces coercion to float if ndim = 0
+    true_corr = _snap_corr(np.squeeze(efficient_pearsonr(ea, eb)[0]) / 1)
+    abs_true = np.abs(true_corr)
+    n_feat = max(ea.shape[-1], zb.shape[-1])
+
+    perm_nbytes = len(a) * 8 + ea.size * 8 + n_feat * 16
+
+    def permute(rs, start, size, active):
+        idx = np.vstack([rs.permutation(len(a)) for perm in range(size)])
+        if active is None:
+            return _freedman_lane_pearsonr(ea, zb, design, pinv, idx)
+        return _freedman_lane_pearsonr(
+            ea if ea.shape[-1] == 1 else ea[:, active],
+            zb if zb.shape[-1] == 1 else zb[:, active], design, pinv, idx
+        )
+
+    if checkpoint is not None:
+        checkpoint = utils._Checkpoint(checkpoint, 'permtest_partial_pearsonr',
+                                       a, b, confounds, n_perm, seed,
+                                       n_exceed, tail_approx, correction,
+                                       n_jobs is None, shard)
+
+    if shard is not None:
+        return _permutation_shard(permute, true_corr, n_perm, perm_nbytes,
+                                  shard, seed=seed, batch_size=batch_size,
+                                  max_memory=max_memory, n_exceed=n_exceed,
+                                  tail_approx=tail_approx,
+                                  correction=correction, n_jobs=n_jobs,
+                                  checkpoint=checkpoint)
+
+    pvals, tail_fit = _permutation_pvals(permute, abs_true.reshape(-1), n_perm,
+                                         perm_nbytes, seed=seed,
+                                         batch_size=batch_size,
+                                         max_memory=max_memory,
+                                         n_exceed=n_exceed,
+                                         tail_approx=tail_approx,
+                                         correction=correction,
+                                         n_jobs=n_jobs,
+                                         checkpoint=checkpoint)
+
+    return _permtest_output(true_corr, pvals, tail_fit, tail_approx)
+
+
+class PermutationResult:
+    """
+    Partial results of a permutation test that can be combined across runs
+
+    Holds a summary of the null distribution generated by one shard of a
+    permutation test (see the `shard` parameter of :func:`permtest_1samp`,
+    :func:`permtest_rel`, :func:`permtest_pearsonr`, and
+    :func:`permtest_partial_pearsonr`). Results from all
+    shards can be combined with :meth:`merge` and converted to p-values with
+    :meth:`finalize`.
+
+    Parameters
+    ----------
+    stat : float or numpy.ndarray
+        Original (i.e., non-permuted) statistics
+    n_perm : int
+        Total number of permutations across all shards
+    exceed : array_like
+        Number of permuted statistics exceeding the absolute value of `stat`
+        for each (flattened) feature
+    chunks : array_like
+        Indices of the chunks of permutations that were run. Permutations are
+        generated in chunks of 100, each with an independent random stream
+    maxnull : array_like, optional
+        Maximum absolute statistic across features for each permutation. Only
+        required if `correction` is 'maxT'. Default: None
+    tail : array_like, optional
+        Largest permuted statistics for each feature. Only required if
+        `tail_approx` is True and `correction` is None. Default: None
+    tail_approx : bool, optional
+        Whether p-values should be approximated from the tail of the null
+        distribution. Default: False
+    correction : {None, 'maxT'}, optional
+        Multiple comparisons correction applied to p-values. Default: None
+    seed : int, optional
+        Seed from which the random streams of all chunks were spawned. Results
+        can only be merged with those generated from the same seed.
+        Default: None
+
+    Examples
+    --------
+    >>> from netneurotools import datasets, stats
+
+    >>> np.random.seed(12345678)  # set random seed for reproducible results
+    >>> x, y = datasets.make_correlated_xy(corr=0.2, size=100)
+
+    Run a permutation test in two shards (e.g., on separate machines) and
+    combine the results:
+
+    >>> res1 = stats.permtest_pearsonr(x, y, shard=(0, 2))
+    >>> res2 = stats.permtest_pearsonr(x, y, shard=(1, 2))
+    >>> res1.merge(res2).finalize()  # doctest: +SKIP
+    (0.1949395718376108, 0.04895104895104895)
+    """
+
+    def __init__(self, stat, n_perm, exceed, chunks, maxnull=None, tail=None,
+                 tail_approx=False, correction=None, seed=None):
+        self.stat = stat
+        self.n_perm = int(n_perm)
+        self.exceed = np.asarray(exceed)
+        self.chunks = np.unique(np.asarray(chunks, dtype=int))
+        self.maxnull = None if maxnull is None else np.asarray(maxnull)
+        self.tail = None if tail is None else np.asarray(tail)
+        self.tail_approx = bool(tail_approx)
+        self.correction = _check_correction(correction)
+        self.seed = None if seed is None else int(seed)
+
+    @property
+    def complete(self):
+        """ Whether all chunks of permutations have been run """
+        return len(self.chunks) == len(utils._chunk_bounds(self.n_perm)) - 1
+
+    def merge(self, other):
+        """
+        Combines these results with those from another shard
+
+        Parameters
+        ----------
+        other : PermutationResult
+            Results from a different shard of the same permutation test
+
+        Returns
+        -------
+        merged : PermutationResult
+            Combined results
+        """
+
+        stat, other_stat = np.asarray(self.stat), np.asarray(other.stat)
+        same_stat = (stat.shape == other_stat.shape
+                     and np.all((stat == other_stat)
+                                | (np.isnan(stat) & np.isnan(other_stat))))
+        if (self.n_perm != other.n_perm or not same_stat
+                or self.tail_approx != other.tail_approx
+                or self.correction != other.correction):
+            raise ValueError('Cannot merge results from different permutation '
+                             'tests.')
+        if self.seed != other.seed:
+            raise ValueError('Cannot merge results generated from different '
+                             'seeds ({} and {}). All shards must be run with '
+                             'the same integer seed.'
+                             .format(self.seed, other.seed))
+        if len(np.intersect1d(self.chunks, other.chunks)) > 0:
+            raise ValueError('Cannot merge results with overlapping chunks of '
+                             'permutations.')
+
+        maxnull, tail = self.maxnull, self.tail
+        if maxnull is not None and other.maxnull is not None:
+            maxnull = np.concatenate([maxnull, other.maxnull])
+        if tail is None or other.tail is None:
+            tail = other.tail if tail is None else tail
+        else:
+            tail = _update_tail(tail, other.tail, _tail_size(self.n_perm))
+
+        return PermutationResult(self.stat, self.n_perm,
+                                 self.exceed + other.exceed,
+                                 np.union1d(self.chunks, other.chunks),
+                                 maxnull=maxnull, tail=tail,
+                                 tail_approx=self.tail_approx,
+                                 correction=self.correction, seed=self.seed)
+
+    def finalize(self):
+        """
+        Computes p-values from the combined results of all shards
+
+        Returns
+        -------
+        stat : float or numpy.ndarray
+            Original (i.e., non-permuted) statistics
+        pvalue : float or numpy.ndarray
+            Non-parametric p-values
+        tail_fit : bool or numpy.ndarray
+            Whether each p-value was extrapolated from the fitted tail of the
+            null distribution. Only returned if `tail_approx` is True.
+        """
+
+        if not self.complete:
+            n_chunks = len(utils._chunk_bounds(self.n_perm)) - 1
+            raise ValueError('Results are incomplete: only {} of {} chunks of '
+                             'permutations have been run.'
+                             .format(len(self.chunks), n_chunks))
+
+        pvals, tail_fit = _null_pvals(np.abs(self.stat).reshape(-1),
+                                      self.n_perm, self.exceed,
+                                      maxnull=self.maxnull, tail=self.tail,
+                                      tail_approx=self.tail_approx,
+                                      correction=self.correction)
+
+        return _permtest_output(self.stat, pvals, tail_fit, self.tail_approx)
+
+    def save(self, fname):
+        """
+        Saves results to `fname` as a numpy ``.npz`` file
+
+        Parameters
+        ----------
+        fname : str or os.PathLike
+            Filepath to which results should be saved
+        """
+
+        arrays = dict(stat=self.stat, n_perm=self.n_perm, exceed=self.exceed,
+                      chunks=self.chunks, tail_approx=self.tail_approx,
+                      correction=str(self.correction))
+        if self.maxnull is not None:
+            arrays['maxnull'] = self.maxnull
+        if self.tail is not None:
+            arrays['tail'] = self.tail
+        if self.seed is not None:
+            arrays['seed'] = self.seed
+
+        np.savez(fname, **arrays)
+
+    @classmethod
+    def load(cls, fname):
+        """
+        Loads results saved with :meth:`save`
+
+        Parameters
+        ----------
+        fname : str or os.PathLike
+            Filepath to saved results
+
+        Returns
+        -------
+        result : PermutationResult
+            Loaded results
+        """
+
+        with np.load(fname) as data:
+            correction = str(data['correction'])
+            return cls(data['stat'][()], data['n_perm'], data['exceed'],
+                       data['chunks'],
+                       maxnull=data['maxnull'] if 'maxnull' in data else None,
+                       tail=data['tail'] if 'tail' in data else None,
+                       tail_approx=bool(data['tail_approx']),
+                       correction=None if correction == 'None' else correction,
+                       seed=data['seed'] if 'seed' in data else None)
+
+
+def _permutation_shard(permute, stat, n_perm, perm_nbytes, shard, seed=None,
+                       batch_size=None, max_memory=None, n_exceed=None,
+                       tail_approx=False, correction=None, n_jobs=None,
+                       checkpoint=None):
+    """
+    Runs one shard of the permutations in a permutation test
+
+    Parameters
+    ----------
+    permute, n_perm, perm_nbytes, seed, batch_size, max_memory, n_exceed
+        See :func:`_permutation_pvals`
+    tail_approx, correction, n_jobs, checkpoint
+        See :func:`_permutation_pvals`
+    stat : float or numpy.ndarray
+        Original (i.e., non-permuted) statistics
+    shard : (2,) tuple of int
+        Index of the shard to run and total number of shards
+
+    Returns
+    -------
+    result : PermutationResult
+        Partial results for the shard
+    """
+
+    if n_exceed is not None:
+        raise ValueError('Cannot use `n_exceed` with `shard`.')
+
+    index, n_shards = shard
+    if n_shards < 1 or not 0 <= index < n_shards:
+        raise ValueError('Provided `shard` must be a tuple (index, n_shards) '
+                         'with 0 <= index < n_shards, not {}'.format(shard))
+
+    # every shard must spawn its streams from the same root seed, so record
+    # it in the results to make sure only matching shards are merged
+    if not isinstance(seed, (int, np.integer)):
+        seed = check_random_state(seed).randint(np.iinfo(np.int32).max)
+
+    n_chunks = len(utils._chunk_bounds(n_perm)) - 1
+    chunks = np.array_split(np.arange(n_chunks), n_shards)[index]
+    exceed, maxnull, tail = _permutation_null(
+        permute, np.abs(stat).reshape(-1), n_perm, perm_nbytes, seed=seed,
+        batch_size=batch_size, max_memory=max_memory, tail_approx=tail_approx,
+        correction=correction, n_jobs=n_jobs, chunks=chunks,
+        checkpoint=checkpoint
+    )
+
+    return PermutationResult(stat, n_perm, exceed, chunks, maxnull=maxnull,
+                             tail=tail, tail_approx=tail_approx,
+                             correction=correction, seed=seed)
+
+
+def efficient_pearsonr(a, b, ddof=1, nan_policy='propagate', chunk_size=None,
+                       pairwise=False, return_pval=True):
+    """
+    Computes correlation of matching columns in `a` and `b`
+
+    Parameters
+    ----------
+    a,b : array_like
+        Sample observations. These arrays must have the same length and either
+        an equivalent number of columns or be broadcastable (unless `pairwise`
+        is True)
+    ddof : int, optional
+        Degrees of freedom correction in the calculation of the standard
+        deviation. Default: 1
+    nan_policy : bool, optional
+        Defines how to handle when input contains nan. 'propagate' returns nan,
+        'raise' throws an error, 'omit' performs the calculations ignoring nan
+        values. Default: 'propagate'
+    chunk_size : int, optional
+        If specified, correlations are computed for blocks of `chunk_size`
+        columns at a time such that only one block of `a` and `b` is held in
+        memory. In this case `a` and `b` must be one- or two-dimensional and
+        are only ever sliced (not converted to arrays), so they may be, e.g.,
+        :obj:`numpy.memmap` arrays or HDF5 datasets. Default: None
+    pairwise : bool, optional
+        Whether to compute correlations between every column of `a` and every
+        column of `b` (instead of only between matching columns). In this case
+        `a` and `b` must be one- or two-dimensional and may have any number of
+        columns. Default: False
+    return_pval : bool, optional
+        Whether to compute and return p-values. Default: True
+
+    Returns
+    -------
+    corr : float or numpy.ndarray
+        Pearson's correlation coefficient between matching columns of inputs.
+        If `pairwise` is True, an (M, P) array with the correlation between
+        the `m`-th column of `a` and the `p`-th column of `b`.
+    pval : float or numpy.ndarray
+        Two-tailed p-values. Only returned if `return_pval` is True.
+
+    Notes
+    -----
+    If either input contains nan and nan_policy is set to 'omit', both arrays
+    will be masked to omit the nan entries.
+
+    Correlations retain the floating point precision of the inputs (e.g.,
+    single precision inputs yield single precision correlations), though means
+    and sums of products are always accumulated in double precision. P-values
+    are always double precision.
+
+    Every block of columns read when `chunk_size` is specified contains all
+    samples of those columns, so their means and standard deviations are
+    computed from the block before the (centered) correlations are; results
+    are identical to those obtained without `chunk_size`.
+
+    If `pairwise` is True the cross-correlation matrix is computed in tiles of
+    `chunk_size` columns of `a` by `chunk_size` columns of `b` via matrix
+    products, such that the only arrays as large as the output are the output
+    arrays themselves. If `chunk_size` is not specified tiles are sized to
+    keep the memory used for each at approximately 256 MiB. With
+    nan_policy='omit' every pair of columns is masked separately.
+
+    Examples
+    --------
+    >>> from netneurotools import datasets, stats
+
+    Generate some not-very-correlated and some highly-correlated data:
+
+    >>> np.random.seed(12345678)  # set random seed for reproducible results
+    >>> x1, y1 = datasets.make_correlated_xy(corr=0.1, size=100)
+    >>> x2, y2 = datasets.make_correlated_xy(corr=0.8, size=100)
+
+    Calculate both correlations simultaneously:
+
+    >>> stats.efficient_pearsonr(np.c_[x1, x2], np.c_[y1, y2])
+    (array([0.10032565, 0.79961189]), array([3.20636135e-01, 1.97429944e-23]))
+    """
+
+    if pairwise:
+        corr, pval = _pairwise_pearsonr(a, b, ddof, nan_policy, chunk_size,
+                                        return_pval)
+    elif chunk_size is not None:
+        corr, pval = _chunked_pearsonr(a, b, ddof, nan_policy, chunk_size,
+                                       return_pval)
+    else:
+        corr, pval = _paired_pearsonr(a, b, ddof, nan_policy, return_pval)
+
+    return (corr, pval) if return_pval else corr
+
+
+def _paired_pearsonr(a, b, ddof=1, nan_policy='propagate', return_pval=True):
+    """
+    Computes correlation of matching columns in `a` and `b`
+
+    See :func:`efficient_pearsonr` for a description of the parameters and
+    returned values
+    """
+
+    a, b, axis = _chk2_asarray(a, b, 0)
+    if len(a) != len(b):
+        raise ValueError('Provided arrays do not have same length')
+
+    if a.size == 0 or b.size == 0:
+        return np.nan, np.nan
+
+    if nan_policy not in ('propagate', 'raise', 'omit'):
+        raise ValueError(f'Value for nan_policy "{nan_policy}" not allowed')
+
+    a, b = a.reshape(len(a), -1), b.reshape(len(b), -1)
+    if (a.shape[1] != b.shape[1]):
+        a, b = np.broadcast_arrays(a, b)
+
+    mask = np.logical_or(np.isnan(a), np.isnan(b))
+    if nan_policy == 'raise' and np.any(mask):
+        raise ValueError('Input cannot contain NaN when nan_policy is "omit"')
+    elif nan_policy == 'omit':
+        corr, n_obs = _omit_pearsonr(a, b, mask, ddof=ddof)
+        corr = np.squeeze(np.clip(corr, -1, 1))[()]
+        if not return_pval:
+            return corr, None
+        return corr, _pearsonr_pval(corr, np.squeeze(n_obs))
+
+    # products are formed in the precision of the inputs but summed in (at
+    # least) double precision
+    dtype = utils._float_dtype(a.dtype, b.dtype)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        corr = (_zscore(a.astype(dtype, copy=False), ddof=ddof)
+                * _zscore(b.astype(dtype, copy=False), ddof=ddof))
+
+    n_obs = len(a)
+    corr = np.sum(corr, axis=0, dtype=np.promote_types(dtype, np.float64))
+    corr = (corr / (n_obs - 1)).astype(dtype, copy=False)
+    corr = np.squeeze(np.clip(corr, -1, 1))[()]
+    if not return_pval:
+        return corr, None
+
+    return corr, _pearsonr_pval(corr, n_obs)
+
+
+def _omit_pearsonr(a, b, mask, ddof=1):
+    """
+    Computes correlation of matching columns in `a` and `b`, omitting `mask`
+
+    Parameters
+    ----------
+    a, b : (N, F) numpy.ndarray
+        Sample observations
+    mask : (N, F) numpy.ndarray
+        Boolean array indicating samples to be omitted (i.e., where either `a`
+        or `b` is NaN)
+    ddof : int, optional
+        Degrees of freedom correction in the calculation of the standard
+        deviation. Default: 1
+
+    Returns
+    -------
+    corr : (F,) numpy.ndarray
+        Correlations (not yet clipped to [-1, 1])
+    n_obs : (F,) numpy.ndarray
+        Number of samples used to compute each correlation
+    """
+
+    # zero-fill omitted samples so that everything can be computed with plain
+    # reductions; centered samples are re-zeroed after subtracting the mean
+    valid = np.logical_not(mask)
+    n_obs = valid.sum(axis=0)
+    dtype = utils._float_dtype(a.dtype, b.dtype)
+    acc = np.promote_types(dtype, np.float64)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        a = np.where(valid, a, 0).astype(dtype, copy=False)
+        b = np.where(valid, b, 0).astype(dtype, copy=False)
+        a -= a.sum(axis=0, dtype=acc) / n_obs
+        b -= b.sum(axis=0, dtype=acc) / n_obs
+        a *= valid
+        b *= valid
+        ssa = np.einsum('ij,ij->j', a, a, dtype=acc)
+        ssb = np.einsum('ij,ij->j', b, b, dtype=acc)
+        corr = (np.einsum('ij,ij->j', a, b, dtype=acc) * (n_obs - ddof)
+                / np.sqrt(ssa * ssb))
+
+    # as with z-scoring masked arrays, columns whose standard deviation is
+    # undefined (or zero) contribute no samples
+    keep = (n_obs - ddof > 0) & (ssa > 0) & (ssb > 0)
+    n_obs = np.where(keep, n_obs, 0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        corr = np.where(keep, corr, 0) / (n_obs - 1)
+
+    return corr.astype(dtype, copy=False), n_obs
+
+
+def _chunked_pearsonr(a, b, ddof=1, nan_policy='propagate', chunk_size=1000,
+                      return_pval=True):
+    """
+    Computes correlation of matching columns in `a` and `b` in blocks
+
+    See :func:`efficient_pearsonr` for a description of the parameters and
+    returned values
+    """
+
+    if chunk_size < 1:
+        raise ValueError('Provided `chunk_size` must be a positive integer, '
+                         'not {}'.format(chunk_size))
+
+    # only coerce inputs that cannot be sliced (e.g., lists) to arrays
+    a = a if hasattr(a, 'shape') else np.asarray(a)
+    b = b if hasattr(b, 'shape') else np.asarray(b)
+    if a.ndim > 2 or b.ndim > 2:
+        raise ValueError('Inputs must be one- or two-dimensional when '
+                         '`chunk_size` is specified.')
+    if len(a) != len(b):
+        raise ValueError('Provided arrays do not have same length')
+
+    n_a = a.shape[1] if a.ndim == 2 else 1
+    n_b = b.shape[1] if b.ndim == 2 else 1
+    if n_a != n_b and 1 not in (n_a, n_b):
+        raise ValueError('Provided arrays do not have a broadcastable number '
+                         'of columns: {} and {}'.format(n_a, n_b))
+    if len(a) == 0 or n_a == 0 or n_b == 0:
+        return np.nan, np.nan
+
+    def read(x, n_cols, start, stop):
+        # single columns are broadcast, so read them in full
+        if x.ndim < 2:
+            return np.asarray(x[:])
+        if n_cols == 1:
+            return np.asarray(x[:, :])
+        return np.asarray(x[:, start:stop])
+
+    n_cols = max(n_a, n_b)
+    corr = np.zeros(n_cols, dtype=utils._float_dtype(a.dtype, b.dtype))
+    pval = np.zeros(n_cols) if return_pval else None
+    a_col = read(a, n_a, 0, 1) if n_a == 1 else None
+    b_col = read(b, n_b, 0, 1) if n_b == 1 else None
+    for start in range(0, n_cols, chunk_size):
+        stop = min(start + chunk_size, n_cols)
+        block_a = a_col if a_col is not None else read(a, n_a, start, stop)
+        block_b = b_col if b_col is not None else read(b, n_b, start, stop)
+        r, p = _paired_pearsonr(block_a, block_b, ddof=ddof,
+                                nan_policy=nan_policy,
+                                return_pval=return_pval)
+        corr[start:stop] = r
+        if return_pval:
+            pval[start:stop] = p
+
+    if not return_pval:
+        return np.squeeze(corr)[()], None
+
+    return np.squeeze(corr)[()], np.squeeze(pval)[()]
+
+
+def _pairwise_pearsonr(a, b, ddof=1, nan_policy='propagate', chunk_size=None,
+                       return_pval=True):
+    """
+    Computes correlations between all columns of `a` and all columns of `b`
 
-    pvals = permutations / (n_perm + 1)  # + 1 in denom accounts for true_mean
+    See :func:`efficient_pearsonr` for a description of the parameters and
+    returned values
+    """
 
-    return true_mean, pvals
+    if nan_policy not in ('propagate', 'raise', 'omit'):
+        raise ValueError(f'Value for nan_policy "{nan_policy}" not allowed')
+    if chunk_size is not None and chunk_size < 1:
+        raise ValueError('Provided `chunk_size` must be a positive integer, '
+                         'not {}'.format(chunk_size))
+
+    # only coerce inputs that cannot be sliced (e.g., lists) to arrays
+    a = a if hasattr(a, 'shape') else np.asarray(a)
+    b = b if hasattr(b, 'shape') else np.asarray(b)
+    if a.ndim > 2 or b.ndim > 2:
+        raise ValueError('Inputs must be one- or two-dimensional when '
+                         '`pairwise` is True.')
+    if len(a) != len(b):
+        raise ValueError('Provided arrays do not have same length')
 
+    n_obs = len(a)
+    n_a = a.shape[1] if a.ndim == 2 else 1
+    n_b = b.shape[1] if b.ndim == 2 else 1
+    if n_obs == 0 or n_a == 0 or n_b == 0:
+        return np.nan, np.nan
 
-def permtest_rel(a, b, axis=0, n_perm=1000, seed=0):
+    # each tile requires a handful of (N, chunk_size) and (chunk_size,
+    # chunk_size) temporary arrays, so bound both
+    if chunk_size is None:
+        chunk_size = max(1, min(_MAX_MEMORY // (128 * n_obs),
+                                int(np.sqrt(_MAX_MEMORY // 64))))
+
+    def read(x, start, stop):
+        if x.ndim < 2:
+            return np.asarray(x[:]).reshape(-1, 1)
+        return np.asarray(x[:, start:stop])
+
+    def check(x):
+        if nan_policy == 'raise' and np.any(np.isnan(x)):
+            raise ValueError('Input cannot contain NaN when nan_policy is '
+                             '"raise"')
+        return x
+
+    # as with paired correlations, sums of products (here, matrix products of
+    # the z-scores) are accumulated in (at least) double precision
+    dtype = utils._float_dtype(a.dtype, b.dtype)
+    acc = np.promote_types(dtype, np.float64)
+    corr = np.zeros((n_a, n_b), dtype=dtype)
+    if nan_policy == 'omit':
+        n_obs = np.zeros((n_a, n_b), dtype=int)
+    for a_start in range(0, n_a, chunk_size):
+        a_stop = min(a_start + chunk_size, n_a)
+        block_a = check(read(a, a_start, a_stop)).astype(dtype, copy=False)
+        if nan_policy != 'omit':
+            with np.errstate(invalid='ignore', divide='ignore'):
+                za = _zscore(block_a, ddof=ddof).astype(acc, copy=False)
+        for b_start in range(0, n_b, chunk_size):
+            b_stop = min(b_start + chunk_size, n_b)
+            block_b = check(read(b, b_start, b_stop)).astype(dtype,
+                                                             copy=False)
+            tile = (slice(a_start, a_stop), slice(b_start, b_stop))
+            if nan_policy == 'omit':
+                corr[tile], n_obs[tile] = _omit_pairwise_pearsonr(block_a,
+                                                                  block_b,
+                                                                  ddof=ddof)
+                continue
+            with np.errstate(invalid='ignore', divide='ignore'):
+                zb = _zscore(block_b, ddof=ddof).astype(acc, copy=False)
+            corr[tile] = (za.T @ zb) / (n_obs - 1)
+
+    corr = np.squeeze(np.clip(corr, -1, 1))[()]
+    if not return_pval:
+        return corr, None
+
+    return corr, _pearsonr_pval(corr, np.squeeze(n_obs))
+
+
+def _omit_pairwise_pearsonr(a, b, ddof=1):
     """
-    Non-parametric equivalent of :py:func:`scipy.stats.ttest_rel`
+    Computes correlations between all columns of `a` and `b`, omitting NaNs
 
-    Generates two-tailed p-value for hypothesis of whether related samples `a`
-    and `b` differ using permutation tests
+    Every pair of columns is masked separately (i.e., correlations are
+    computed from all samples that are not NaN in either column)
 
     Parameters
     ----------
-    a, b : array_like
-        Sample observations. These arrays must have the same shape.
-    axis : int or None, optional
-        Axis along which to compute test. If None, compute over whole arrays
-        of `a` and `b`. Default: 0
-    n_perm : int, optional
-        Number of permutations to assess. Unless `a` and `b` are very small
-        along `axis` this will approximate a randomization test via Monte
-        Carlo simulations. Default: 1000
-    seed : {int, np.random.RandomState instance, None}, optional
-        Seed for random number generation. Set to None for "randomness".
-        Default: 0
+    a : (N, M) numpy.ndarray
+        Sample observations
+    b : (N, P) numpy.ndarray
+        Sample observations
+    ddof : int, optional
+        Degrees of freedom correction in the calculation of the standard
+        deviation. Default: 1
 
     Returns
     -------
-    stat : float or numpy.ndarray
-        Average difference between `a` and `b`
-    pvalue : float or numpy.ndarray
-        Non-parametric p-value
-
-    Notes
-    -----
-    The lowest p-value that can be returned by this function is equal to 1 /
-    (`n_perm` + 1).
-
-    Examples
-    --------
-    >>> from netneurotools import stats
-
-    >>> np.random.seed(12345678)  # set random seed for reproducible results
-    >>> rvs1 = np.random.normal(loc=5, scale=10, size=500)
-    >>> rvs2 = (np.random.normal(loc=5, scale=10, size=500)
-    ...         + np.random.normal(scale=0.2, size=500))
-    >>> stats.permtest_rel(rvs1, rvs2)  # doctest: +SKIP
-    (-0.16506275161572695, 0.8021978021978022)
+    corr : (M, P) numpy.ndarray
+        Correlations (not yet clipped to [-1, 1])
+    n_obs : (M, P) numpy.ndarray
+        Number of samples used to compute each correlation
+    """
 
-    >>> rvs3 = (np.random.normal(loc=8, scale=10, size=500)
-    ...         + np.random.normal(scale=0.2, size=500))
-    >>> stats.permtest_rel(rvs1, rvs3)  # doctest: +SKIP
-    (2.40533726097883, 0.000999000999000999)
+    # sums (of squares) of each column over the samples it shares with every
+    # other column are matrix products with the masks; to limit cancellation
+    # when computing (co)variances from them everything is pre-centered and
+    # accumulated in (at least) double precision
+    dtype = np.promote_types(utils._float_dtype(a.dtype, b.dtype), np.float64)
+    va, vb = np.logical_not(np.isnan(a)), np.logical_not(np.isnan(b))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        a = np.where(va, a, 0).astype(dtype)
+        b = np.where(vb, b, 0).astype(dtype)
+        a = np.where(va, a - a.sum(axis=0) / va.sum(axis=0), 0)
+        b = np.where(vb, b - b.sum(axis=0) / vb.sum(axis=0), 0)
+        va, vb = va.astype(dtype), vb.astype(dtype)
+
+        n_obs = va.T @ vb
+        sa, sb = a.T @ vb, va.T @ b
+        ssa = (a * a).T @ vb - sa ** 2 / n_obs
+        ssb = va.T @ (b * b) - sb ** 2 / n_obs
+        corr = ((a.T @ b - sa * sb / n_obs) * (n_obs - ddof)
+                / np.sqrt(ssa * ssb))
+
+    # as with paired correlations, pairs of columns whose standard deviation
+    # is undefined (or zero) contribute no samples
+    keep = (n_obs - ddof > 0) & (ssa > 0) & (ssb > 0)
+    n_obs = np.where(keep, n_obs, 0).astype(int)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        corr = np.where(keep, corr, 0) / (n_obs - 1)
+
+    return corr, n_obs
+
+
+def _pearsonr_pval(corr, n_obs):
+    """
+    Computes two-tailed p-values for correlations `corr` from `n_obs` samples
     """
 
-    a, b, axis = _chk2_asarray(a, b, axis)
-    rs = check_random_state(seed)
+    # taken from scipy.stats; computed in double precision regardless of the
+    # precision of `corr` so that small p-values do not underflow
+    ab = (n_obs / 2) - 1
+    prob = 2 * special.btdtr(ab, ab, 0.5 * (1 - np.abs(corr, dtype=float)))
 
-    if a.shape[axis] != b.shape[axis]:
-        raise ValueError('Provided arrays do not have same length along axis')
+    return prob
 
-    if a.size == 0 or b.size == 0:
-        return np.nan, np.nan
 
-    # calculate original difference in means
-    ab = np.stack([a, b], axis=0)
-    if ab.ndim < 3:
-        ab = np.expand_dims(ab, axis=-1)
-    true_diff = np.squeeze(np.diff(ab, axis=0)).mean(axis=axis) / 1
-    abs_true = np.abs(true_diff)
+def _rank(x, mask=None):
+    """
+    Ranks columns of `x`, assigning tied observations their average rank
 
-    # idx array
-    reidx = np.meshgrid(*[range(f) for f in ab.shape], indexing='ij')
+    Parameters
+    ----------
+    x : (N, F) numpy.ndarray
+        Sample observations
+    mask : (N, F) numpy.ndarray, optional
+        Boolean array indicating observations to be omitted from the ranking.
+        If not specified, NaN observations are omitted. Default: None
 
-    permutations = np.ones(true_diff.shape)
-    for perm in range(n_perm):
-        # use this to re-index (i.e., swap along) the first axis of `ab`
-        swap = rs.random_sample(ab.shape[:-1]).argsort(axis=axis)
-        reidx[0] = np.repeat(swap[..., np.newaxis], ab.shape[-1], axis=-1)
-        # recompute difference between `a` and `b` (i.e., first axis of `ab`)
-        pdiff = np.squeeze(np.diff(ab[tuple(reidx)], axis=0)).mean(axis=axis)
-        permutations += np.abs(pdiff) >= abs_true
+    Returns
+    -------
+    ranks : (N, F) numpy.ndarray
+        Ranks of `x`, where omitted observations are NaN
+    """
 
-    pvals = permutations / (n_perm + 1)  # + 1 in denom accounts for true_diff
+    if mask is None:
+        mask = np.isnan(x)
 
-    return true_diff, pvals
+    ranks = sstats.rankdata(np.where(mask, np.inf, x), axis=0)
+    ranks = ranks.astype(utils._float_dtype(x.dtype), copy=False)
+    ranks[mask] = np.nan
 
+    return ranks
 
-def permtest_pearsonr(a, b, axis=0, n_perm=1000, resamples=None, seed=0):
-    """
-    Non-parametric equivalent of :py:func:`scipy.stats.pearsonr`
 
-    Generates two-tailed p-value for hypothesis of whether samples `a` and `b`
-    are correlated using permutation tests
+def efficient_spearmanr(a, b, nan_policy='propagate'):
+    """
+    Computes rank correlation of matching columns in `a` and `b`
 
     Parameters
     ----------
-    a,b : (N[, M]) array_like
+    a,b : array_like
         Sample observations. These arrays must have the same length and either
         an equivalent number of columns or be broadcastable
-    axis : int or None, optional
-        Axis along which to compute test. If None, compute over whole arrays
-        of `a` and `b`. Default: 0
-    n_perm : int, optional
-        Number of permutations to assess. Unless `a` and `b` are very small
-        along `axis` this will approximate a randomization test via Monte
-        Carlo simulations. Default: 1000
-    resamples : (N, P) array_like, optional
-        Resampling array used to shuffle `a` when generating null distribution
-        of correlations. This array must have the same length as `a` and `b`
-        and should have at least the same number of columns as `n_perm` (if it
-        has more then only `n_perm` columns will be used. When not specified a
-        standard permutation is used to shuffle `a`. Default: None
-    seed : {int, np.random.RandomState instance, None}, optional
-        Seed for random number generation. Set to None for "randomness".
-        Default: 0
+    nan_policy : bool, optional
+        Defines how to handle when input contains nan. 'propagate' returns nan,
+        'raise' throws an error, 'omit' performs the calculations ignoring nan
+        values. Default: 'propagate'
 
     Returns
     -------
-    corr : float or numpyndarray
-        Correlations
-    pvalue : float or numpy.ndarray
-        Non-parametric p-value
+    corr : float or numpy.ndarray
+        Spearman's rank correlation coefficient between matching columns of
+        inputs
+    pval : float or numpy.ndarray
+        Two-tailed p-values
 
     Notes
     -----
-    The lowest p-value that can be returned by this function is equal to 1 /
-    (`n_perm` + 1).
+    Every column is ranked only once (with tied observations assigned their
+    average rank) and the ranks are then correlated with
+    :func:`efficient_pearsonr`, such that results are the same as those from
+    :py:func:`scipy.stats.spearmanr` for each pair of columns.
+
+    If either input contains nan and nan_policy is set to 'omit', both arrays
+    will be masked to omit the nan entries before ranking.
 
     Examples
     --------
     >>> from netneurotools import datasets, stats
 
     >>> np.random.seed(12345678)  # set random seed for reproducible results
-    >>> x, y = datasets.make_correlated_xy(corr=0.1, size=100)
-    >>> stats.permtest_pearsonr(x, y)  # doctest: +SKIP
-    (0.10032564626876286, 0.3046953046953047)
-
-    >>> x, y = datasets.make_correlated_xy(corr=0.5, size=100)
-    >>> stats.permtest_pearsonr(x, y)  # doctest: +SKIP
-    (0.500040365781984, 0.000999000999000999)
-
-    Also works with multiple columns by either broadcasting the smaller array
-    to the larger:
-
-    >>> z = x + np.random.normal(loc=1, size=100)
-    >>> stats.permtest_pearsonr(x, np.column_stack([y, z]))
-    (array([0.50004037, 0.25843187]), array([0.000999  , 0.01098901]))
-
-    or by using matching columns in the two arrays (e.g., `x` and `y` vs
-    `a` and `b`):
+    >>> x1, y1 = datasets.make_correlated_xy(corr=0.1, size=100)
+    >>> x2, y2 = datasets.make_correlated_xy(corr=0.8, size=100)
 
-    >>> a, b = datasets.make_correlated_xy(corr=0.9, size=100)
-    >>> stats.permtest_pearsonr(np.column_stack([x, a]), np.column_stack([y, b]))
-    (array([0.50004037, 0.89927523]), array([0.000999, 0.000999]))
-    """  # noqa
+    Calculate both rank correlations simultaneously:
 
-    a, b, axis = _chk2_asarray(a, b, axis)
-    rs = check_random_state(seed)
+    >>> stats.efficient_spearmanr(np.c_[x1, x2], np.c_[y1, y2])
+    (array([0.09036904, 0.78811881]), array([3.71236241e-01, 2.24888153e-22]))
+    """
 
+    a, b, axis = _chk2_asarray(a, b, 0)
     if len(a) != len(b):
         raise ValueError('Provided arrays do not have same length')
 
     if a.size == 0 or b.size == 0:
         return np.nan, np.nan
 
-    if resamples is not None:
-        if n_perm > resamples.shape[-1]:
-            raise ValueError('Number of permutations requested exceeds size '
-                             'of resampling array.')
-
-    # divide by one forces coercion to float if ndim = 0
-    true_corr = efficient_pearsonr(a, b)[0] / 1
-    abs_true = np.abs(true_corr)
-
-    permutations = np.ones(true_corr.shape)
-    for perm in range(n_perm):
-        # permute `a` and determine whether correlations exceed original
-        if resamples is None:
-            ap = a[rs.permutation(len(a))]
-        else:
-            ap = a[resamples[:, perm]]
-        permutations += np.abs(efficient_pearsonr(ap, b)[0]) >= abs_true
+    if nan_policy not in ('propagate', 'raise', 'omit'):
+        raise ValueError(f'Value for nan_policy "{nan_policy}" not allowed')
 
-    pvals = permutations / (n_perm + 1)  # + 1 in denom accounts for true_corr
+    a, b = a.reshape(len(a), -1), b.reshape(len(b), -1)
+    if nan_policy == 'omit':
+        # samples omitted from one array must not be ranked in the other
+        if a.shape[1] != b.shape[1]:
+            a, b = np.broadcast_arrays(a, b)
+        mask = np.logical_or(np.isnan(a), np.isnan(b))
+        a, b = _rank(a, mask), _rank(b, mask)
+    else:
+        a, b = _rank(a), _rank(b)
 
-    return true_corr, pvals
+    return efficient_pearsonr(a, b, nan_policy=nan_policy)
 
 
-def efficient_pearsonr(a, b, ddof=1, nan_policy='propagate'):
+class PreparedPearson:
     """
-    Computes correlation of matching columns in `a` and `b`
+    Correlates a fixed reference array `a` with many other arrays
+
+    Standardizes `a` (and checks it for NaNs) once, so that repeated calls to
+    :meth:`correlate` only need to standardize the new operand. Results are
+    the same as those from :func:`efficient_pearsonr`.
 
     Parameters
     ----------
-    a,b : array_like
-        Sample observations. These arrays must have the same length and either
-        an equivalent number of columns or be broadcastable
+    a : (N[, M]) array_like
+        Reference sample observations
     ddof : int, optional
         Degrees of freedom correction in the calculation of the standard
         deviation. Default: 1
@@ -437,74 +2974,271 @@ def efficient_pearsonr(a, b, ddof=1, nan_policy='propagate'):
         'raise' throws an error, 'omit' performs the calculations ignoring nan
         values. Default: 'propagate'
 
-    Returns
-    -------
-    corr : float or numpy.ndarray
-        Pearson's correlation coefficient between matching columns of inputs
-    pval : float or numpy.ndarray
-        Two-tailed p-values
-
-    Notes
-    -----
-    If either input contains nan and nan_policy is set to 'omit', both arrays
-    will be masked to omit the nan entries.
+    Attributes
+    ----------
+    n_obs : int
+        Number of samples (i.e., length) of `a`
 
     Examples
     --------
     >>> from netneurotools import datasets, stats
 
-    Generate some not-very-correlated and some highly-correlated data:
-
     >>> np.random.seed(12345678)  # set random seed for reproducible results
     >>> x1, y1 = datasets.make_correlated_xy(corr=0.1, size=100)
     >>> x2, y2 = datasets.make_correlated_xy(corr=0.8, size=100)
 
-    Calculate both correlations simultaneously:
+    Prepare the reference array once and correlate it with other arrays:
 
-    >>> stats.efficient_pearsonr(np.c_[x1, x2], np.c_[y1, y2])
+    >>> prep = stats.PreparedPearson(np.c_[x1, x2])
+    >>> prep.correlate(np.c_[y1, y2])
     (array([0.10032565, 0.79961189]), array([3.20636135e-01, 1.97429944e-23]))
     """
 
-    a, b, axis = _chk2_asarray(a, b, 0)
-    if len(a) != len(b):
-        raise ValueError('Provided arrays do not have same length')
-
-    if a.size == 0 or b.size == 0:
-        return np.nan, np.nan
-
-    if nan_policy not in ('propagate', 'raise', 'omit'):
-        raise ValueError(f'Value for nan_policy "{nan_policy}" not allowed')
+    def __init__(self, a, ddof=1, nan_policy='propagate'):
+        if nan_policy not in ('propagate', 'raise', 'omit'):
+            raise ValueError(f'Value for nan_policy "{nan_policy}" not '
+                             'allowed')
+
+        self.ddof, self.nan_policy = ddof, nan_policy
+        self._a = np.atleast_1d(np.asarray(a))
+        self.n_obs = len(self._a)
+
+        a = self._a.reshape(self.n_obs, -1)
+        self._has_nan = bool(np.any(np.isnan(a)))
+        if nan_policy == 'raise' and self._has_nan:
+            raise ValueError('Input cannot contain NaN when nan_policy is '
+                             '"raise"')
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            self._za = _zscore(a, ddof=ddof)
+
+    def correlate(self, b):
+        """
+        Computes correlation of matching columns in prepared `a` and `b`
+
+        Parameters
+        ----------
+        b : array_like
+            Sample observations. Must have the same length as the prepared
+            array and either an equivalent number of columns or be
+            broadcastable
+
+        Returns
+        -------
+        corr : float or numpy.ndarray
+            Pearson's correlation coefficient between matching columns of
+            inputs
+        pval : float or numpy.ndarray
+            Two-tailed p-values
+        """
+
+        b = np.atleast_1d(np.asarray(b))
+        if len(b) != self.n_obs:
+            raise ValueError('Provided arrays do not have same length')
+
+        if self._a.size == 0 or b.size == 0:
+            return np.nan, np.nan
+
+        b = b.reshape(len(b), -1)
+        if 1 not in (b.shape[1], self._za.shape[1]):
+            np.broadcast_arrays(self._za, b)  # raises if incompatible
+
+        # NaNs can only be omitted by re-standardizing both arrays together
+        if self.nan_policy != 'propagate' and (self._has_nan
+                                               or np.any(np.isnan(b))):
+            if self.nan_policy == 'raise':
+                raise ValueError('Input cannot contain NaN when nan_policy '
+                                 'is "raise"')
+            return efficient_pearsonr(self._a, b, ddof=self.ddof,
+                                      nan_policy=self.nan_policy)
+
+        dtype = utils._float_dtype(self._za.dtype, b.dtype)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            zb = _zscore(b.astype(dtype, copy=False), ddof=self.ddof)
+            corr = np.sum(self._za * zb, axis=0,
+                          dtype=np.promote_types(dtype, np.float64))
+        corr = (corr / (self.n_obs - 1)).astype(dtype, copy=False)
+        corr = np.squeeze(np.clip(corr, -1, 1))[()]
+
+        return corr, _pearsonr_pval(corr, self.n_obs)
+
+
+class OnlineCorrelation:
+    """
+    Correlation matrix accumulated from chunks of observations
+
+    Observations (e.g., time points) are added a chunk at a time with
+    :meth:`update`. Only the number of observations, the mean of each
+    variable, and the co-moment matrix (i.e., sums of products of deviations
+    from the means) are retained, using the pairwise updates of Chan et al.
+    (1979), so the correlation matrix of all observations seen so far can be
+    obtained at any time from :meth:`corrcoef` without all observations ever
+    being held in memory. Accumulators fed with different observations (e.g.,
+    separate runs or sessions processed in parallel) can be combined with
+    :meth:`merge`.
 
-    a, b = a.reshape(len(a), -1), b.reshape(len(b), -1)
-    if (a.shape[1] != b.shape[1]):
-        a, b = np.broadcast_arrays(a, b)
+    Parameters
+    ----------
+    n_obs : int, optional
+        Number of observations accumulated. Default: 0
+    mean : (N,) array_like, optional
+        Mean of each variable across accumulated observations. Default: None
+    comoment : (N, N) array_like, optional
+        Sums of products of deviations from `mean` for every pair of variables
+        across accumulated observations. Default: None
 
-    mask = np.logical_or(np.isnan(a), np.isnan(b))
-    if nan_policy == 'raise' and np.any(mask):
-        raise ValueError('Input cannot contain NaN when nan_policy is "omit"')
-    elif nan_policy == 'omit':
-        # avoid making copies of the data, if possible
-        a = np.ma.masked_array(a, mask, copy=False, fill_value=np.nan)
-        b = np.ma.masked_array(b, mask, copy=False, fill_value=np.nan)
+    References
+    ----------
+    Chan, T. F., Golub, G. H., & LeVeque, R. J. (1979). Updating formulae and
+    a pairwise algorithm for computing sample variances. Technical Report
+    STAN-CS-79-773, Department of Computer Science, Stanford University.
 
-    with np.errstate(invalid='ignore'):
-        corr = (sstats.zscore(a, ddof=ddof, nan_policy=nan_policy)
-                * sstats.zscore(b, ddof=ddof, nan_policy=nan_policy))
+    Examples
+    --------
+    >>> from netneurotools import stats
 
-    sumfunc, n_obs = np.sum, len(a)
-    if nan_policy == 'omit':
-        corr = corr.filled(np.nan)
-        sumfunc = np.nansum
-        n_obs = np.squeeze(np.sum(np.logical_not(np.isnan(corr)), axis=0))
+    >>> rs = np.random.RandomState(1234)
+    >>> ts = rs.normal(size=(1000, 5))  # time points x nodes
 
-    corr = sumfunc(corr, axis=0) / (n_obs - 1)
-    corr = np.squeeze(np.clip(corr, -1, 1)) / 1
+    Accumulate correlations from chunks of 100 time points:
 
-    # taken from scipy.stats
-    ab = (n_obs / 2) - 1
-    prob = 2 * special.btdtr(ab, ab, 0.5 * (1 - np.abs(corr)))
+    >>> acc = stats.OnlineCorrelation()
+    >>> for chunk in np.split(ts, 10):
+    ...     acc = acc.update(chunk)
+    >>> np.allclose(acc.corrcoef(), np.corrcoef(ts.T))
+    True
+    """
 
-    return corr, prob
+    def __init__(self, n_obs=0, mean=None, comoment=None):
+        self.n_obs = int(n_obs)
+        self.mean = None if mean is None else np.array(mean, dtype=float)
+        self.comoment = (None if comoment is None
+                         else np.array(comoment, dtype=float))
+
+    def _combine(self, n_obs, mean, comoment):
+        """ Combines (in place) with summary of `n_obs` other observations """
+
+        if n_obs == 0:
+            return
+        if self.mean is not None and len(self.mean) != len(mean):
+            raise ValueError('Cannot combine observations of {} variables '
+                             'with accumulated observations of {} variables.'
+                             .format(len(mean), len(self.mean)))
+        if self.n_obs == 0:
+            self.n_obs = n_obs
+            self.mean, self.comoment = mean.copy(), comoment.copy()
+            return
+
+        n_total = self.n_obs + n_obs
+        delta = mean - self.mean
+        self.comoment += comoment
+        self.comoment += np.outer(delta, delta) * (self.n_obs / n_total
+                                                   * n_obs)
+        self.mean += delta * (n_obs / n_total)
+        self.n_obs = n_total
+
+    def update(self, x):
+        """
+        Adds observations in `x` to the accumulated correlations
+
+        Parameters
+        ----------
+        x : (T[, N]) array_like
+            Observations, where rows are observations (e.g., time points) and
+            columns are variables (e.g., nodes)
+
+        Returns
+        -------
+        self : OnlineCorrelation
+            Updated accumulator
+        """
+
+        x = np.asarray(x, dtype=float)
+        x = x.reshape(len(x), -1)
+        if len(x) > 0:
+            mean = x.mean(axis=0)
+            xc = x - mean
+            self._combine(len(x), mean, xc.T @ xc)
+
+        return self
+
+    def merge(self, other):
+        """
+        Combines these accumulated correlations with those of another
+
+        Parameters
+        ----------
+        other : OnlineCorrelation
+            Correlations accumulated from different observations of the same
+            variables
+
+        Returns
+        -------
+        merged : OnlineCorrelation
+            Correlations accumulated from the observations of both
+        """
+
+        merged = OnlineCorrelation(self.n_obs, self.mean, self.comoment)
+        if other.n_obs > 0:
+            merged._combine(other.n_obs, other.mean, other.comoment)
+
+        return merged
+
+    def corrcoef(self):
+        """
+        Computes correlation matrix of the accumulated observations
+
+        Returns
+        -------
+        corr : (N, N) numpy.ndarray
+            Correlation between every pair of variables
+        """
+
+        if self.n_obs == 0:
+            raise ValueError('No observations have been accumulated.')
+
+        std = np.sqrt(np.diag(self.comoment))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            corr = self.comoment / std[:, None] / std[None, :]
+
+        return np.clip(corr, -1, 1)
+
+    def save(self, fname):
+        """
+        Saves accumulated correlations to `fname` as a numpy ``.npz`` file
+
+        Parameters
+        ----------
+        fname : str or os.PathLike
+            Filepath to which accumulated correlations should be saved
+        """
+
+        arrays = dict(n_obs=self.n_obs)
+        if self.mean is not None:
+            arrays.update(mean=self.mean, comoment=self.comoment)
+
+        np.savez(fname, **arrays)
+
+    @classmethod
+    def load(cls, fname):
+        """
+        Loads accumulated correlations saved with :meth:`save`
+
+        Parameters
+        ----------
+        fname : str or os.PathLike
+            Filepath to saved correlations
+
+        Returns
+        -------
+        acc : OnlineCorrelation
+            Loaded accumulator
+        """
+
+        with np.load(fname) as data:
+            return cls(data['n_obs'],
+                       data['mean'] if 'mean' in data else None,
+                       data['comoment'] if 'comoment' in data else None)
 
 
 def _gen_rotation(seed=None):
@@ -539,9 +3273,248 @@ def _gen_rotation(seed=None):
     return rotate_l, rotate_r
 
 
+def _vasa_assign(order, sdist):
+    """
+    Assigns rows to columns based on their sorted distances a la Vasa et al.
+
+    Parameters
+    ----------
+    order : (N, N) numpy.ndarray
+        Columns of the distance matrix sorted by distance for each row
+    sdist : (N, N) numpy.ndarray
+        Distances of the distance matrix sorted for each row
+
+    Returns
+    -------
+    col : (N,) numpy.ndarray
+        Column assigned to each row
+    """
+
+    n_nodes = len(order)
+    col = np.full(n_nodes, -1, dtype=np.int64)
+    taken = np.zeros(n_nodes, dtype=np.bool_)
+    # index into `order` of the closest unassigned column for each row
+    ptr = np.zeros(n_nodes, dtype=np.int64)
+    # linked lists of unassigned rows whose closest column is each column
+    head = np.full(n_nodes, -1, dtype=np.int64)
+    nxt = np.full(n_nodes, -1, dtype=np.int64)
+
+    # heap of rows by (negative) distance to their closest unassigned column.
+    # entries become stale once their row or column is assigned and are
+    # skipped rather than removed
+    heap = [(-sdist[r, 0], r, order[r, 0]) for r in range(n_nodes)]
+    heapq.heapify(heap)
+    for r in range(n_nodes):
+        nxt[r], head[order[r, 0]] = head[order[r, 0]], r
+
+    while len(heap) > 0:
+        _, r, c = heapq.heappop(heap)
+        if col[r] >= 0 or order[r, ptr[r]] != c:
+            continue
+        col[r], taken[c] = c, True
+
+        # rows that were closest to `c` move on to their next closest column
+        w = head[c]
+        while w >= 0:
+            nw = nxt[w]
+            if col[w] < 0:
+                p = ptr[w]
+                while taken[order[w, p]]:
+                    p += 1
+                ptr[w] = p
+                nxt[w], head[order[w, p]] = head[order[w, p]], w
+                heapq.heappush(heap, (-sdist[w, p], w, order[w, p]))
+            w = nw
+
+    return col
+
+
+if use_numba:
+    _vasa_assign = njit(_vasa_assign)
+
+
+def _sparse_hungarian(coor, rot, tree):
+    """
+    Matches `coor` to their rotated counterparts among their nearest neighbors
+
+    Parameters
+    ----------
+    coor : (N, 3) numpy.ndarray
+        Coordinates to be rotated
+    rot : (3, 3) numpy.ndarray
+        Rotation, as returned by :func:`_gen_rotation`
+    tree : scipy.spatial.cKDTree
+        Tree of `coor`
+
+    Returns
+    -------
+    col : (N,) numpy.ndarray
+        Rotated coordinate assigned to each of `coor`
+    cost : (N,) numpy.ndarray
+        Distance between each of `coor` and its assigned rotated coordinate
+    """
+
+    # restrict the Hungarian algorithm to the nearest neighbors of each
+    # rotated coordinate, so the distance matrix is sparse. if there's no
+    # one-to-one assignment using only those neighbors, consider more of them
+    n_nodes = len(coor)
+    k = min(_SPIN_NEIGHBORS, n_nodes)
+    while k < n_nodes:
+        dist, nbrs = tree.query(coor @ rot.T, k)
+        # the matching may never finish if distances differ only by rounding
+        # error, so match on distances quantized to integers (which are
+        # represented exactly). these are offset by one so that coordinates
+        # with zero distance aren't dropped from the sparse matrix; since
+        # every assignment includes each coordinate once this doesn't change
+        # which assignment has the lowest cost
+        weights = np.rint(dist / (dist.max() or 1) * _SPIN_RESOLUTION) + 1
+        graph = sparse.csr_matrix((weights.ravel(), nbrs.ravel(),
+                                   np.arange(0, n_nodes * k + 1, k)),
+                                  shape=(n_nodes, n_nodes))
+        try:
+            row, col = csgraph.min_weight_full_bipartite_matching(graph)
+        except ValueError:
+            k = min(2 * k, n_nodes)
+            continue
+        return col, np.linalg.norm(coor - coor[col] @ rot, axis=1)
+
+    # considering every neighbor is the same as the dense problem
+    dist = spatial.distance_matrix(coor, coor @ rot)
+    row, col = optimize.linear_sum_assignment(dist)
+
+    return col, dist[row, col]
+
+
+def _assign_spins(coords, hemiid, rotations, method, trees):
+    """
+    Matches `coords` to their rotated counterparts for each of `rotations`
+
+    Parameters
+    ----------
+    coords : (N, 3) numpy.ndarray
+        Coordinates to be rotated
+    hemiid : (N,) numpy.ndarray
+        Hemisphere designation of `coords`
+    rotations : list of tuple
+        Rotations, as returned by :func:`_gen_rotation`
+    method : {'original', 'vasa', 'hungarian', 'sparse_hungarian'}
+        Method by which to match non- and rotated coordinates
+    trees : list of scipy.spatial.cKDTree
+        Trees of coordinates in each hemisphere. Only used when `method` is
+        'original' or 'sparse_hungarian'
+
+    Returns
+    -------
+    resampled : (R, N) numpy.ndarray
+        Resampling array for each of `rotations`
+    cost : (R, N) numpy.ndarray
+        Cost of re-assigning each coordinate for each of `rotations`
+    """
+
+    inds = np.arange(len(coords), dtype=int)
+    resampled = np.zeros((len(rotations), len(coords)), dtype='int32')
+    cost = np.zeros((len(rotations), len(coords)))
+
+    # rotate each hemisphere separately
+    for h, rots in enumerate(zip(*rotations)):
+        hinds = (hemiid == h)
+        coor = coords[hinds]
+        if len(coor) == 0:
+            continue
+
+        # if nodes can be assigned multiple targets, we can simply use the
+        # absolute minimum of the distances (no optimization required) which
+        # is _much_ lighter on memory. since rotations preserve distances,
+        # querying `coor` against the rotated coordinates is the same as
+        # querying the inversely rotated `coor` against the original ones, so
+        # a single tree serves all rotations and they can be queried at once
+        # huge thanks to https://stackoverflow.com/a/47779290 for this
+        # memory-efficient method
+        if method == 'original':
+            dist, col = trees[h].query(coor @ np.transpose(rots, (0, 2, 1)), 1)
+            resampled[:, hinds] = inds[hinds][col]
+            cost[:, hinds] = dist
+            continue
+
+        for n, rot in enumerate(rots):
+            if method == 'sparse_hungarian':
+                col, cost[n, hinds] = _sparse_hungarian(coor, rot, trees[h])
+                resampled[n, hinds] = inds[hinds][col]
+                continue
+
+            # if we need an "exact" mapping (i.e., each node needs to be
+            # assigned EXACTLY once) then we have to calculate the full
+            # distance matrix which is a nightmare with respect to memory for
+            # anything that isn't parcellated data.
+            # that is, don't do this with vertex coordinates!
+            dist = spatial.distance_matrix(coor, coor @ rot)
+            if method == 'vasa':
+                # min of max a la Vasa et al., 2018: repeatedly find the parcel
+                # whose closest unassigned neighbor is farthest away overall
+                # and assign it to that neighbor. sorting the distances once
+                # means each parcel only has to skip past neighbors that have
+                # been assigned, rather than re-scanning the whole matrix
+                order = np.argsort(dist, axis=1, kind='stable')
+                col = _vasa_assign(order,
+                                   np.take_along_axis(dist, order, axis=1))
+                cost[n, hinds] = dist[np.arange(len(coor)), col]
+            # optimization of total cost using Hungarian algorithm. this may
+            # result in certain parcels having higher cost than with
+            # `method='vasa'` but should always result in the total cost being
+            # lower #tradeoffs
+            elif method == 'hungarian':
+                row, col = optimize.linear_sum_assignment(dist)
+                cost[n, hinds] = dist[row, col]
+
+            resampled[n, hinds] = inds[hinds][col]
+
+    return resampled, cost
+
+
+def _spin_digest(resampled):
+    """
+    Returns digest identifying the (int32) resampling array `resampled`
+    """
+
+    return hashlib.blake2b(resampled.tobytes(), digest_size=16).digest()
+
+
+def _spin_trees(coords, hemiid, method):
+    """
+    Returns trees of `coords` in each hemisphere, if required by `method`
+    """
+
+    if method not in ('original', 'sparse_hungarian'):
+        return [None, None]
+
+    return [spatial.cKDTree(coords[hemiid == h]) for h in range(2)]
+
+
+def _spin_chunk(coords, hemiid, method, rotations):
+    """
+    Matches `coords` to their rotated counterparts for each of `rotations`
+
+    Builds any trees required by `method` itself so that only `coords` (which,
+    unlike trees, can be memory-mapped) are sent to worker processes
+
+    Parameters
+    ----------
+    coords, hemiid, rotations, method
+        See :func:`_assign_spins`
+
+    Returns
+    -------
+    resampled, cost : (R, N) numpy.ndarray
+        See :func:`_assign_spins`
+    """
+
+    return _assign_spins(coords, hemiid, rotations, method,
+                         _spin_trees(coords, hemiid, method))
+
+
 def gen_spinsamples(coords, hemiid, n_rotate=1000, check_duplicates=True,
                     method='original', exact=False, seed=None, verbose=False,
-                    return_cost=False):
+                    return_cost=False, checkpoint=None, n_jobs=None):
     """
     Returns a resampling array for `coords` obtained from rotations / spins
 
@@ -573,12 +3546,16 @@ def gen_spinsamples(coords, hemiid, n_rotate=1000, check_duplicates=True,
         Whether to check for and attempt to avoid duplicate resamplings. A
         warnings will be raised if duplicates cannot be avoided. Setting to
         True may increase the runtime of this function! Default: True
-    method : {'original', 'vasa', 'hungarian'}, optional
+    method : {'original', 'vasa', 'hungarian', 'sparse_hungarian'}, optional
         Method by which to match non- and rotated coordinates. Specifying
         'original' will use the method described in [ST1]_. Specfying 'vasa'
         will use the method described in [ST4]_. Specfying 'hungarian' will use
         the Hungarian algorithm to minimize the global cost of reassignment
-        (will dramatically increase runtime). Default: 'original'
+        (will dramatically increase runtime). Specifying 'sparse_hungarian'
+        will approximate this by only considering reassigning coordinates to
+        their nearest rotated neighbors, which requires much less memory for
+        high-resolution parcellations but may yield a higher global cost than
+        'hungarian'. Default: 'original'
     seed : {int, np.random.RandomState instance, None}, optional
         Seed for random number generation. Default: None
     verbose : bool, optional
@@ -586,6 +3563,17 @@ def gen_spinsamples(coords, hemiid, n_rotate=1000, check_duplicates=True,
     return_cost : bool, optional
         Whether to return cost array (specified as Euclidean distance) for each
         coordinate for each rotation Default: True
+    checkpoint : str or os.PathLike, optional
+        Filepath where progress should be periodically saved. If the function
+        is interrupted, calling it again with the same inputs and `checkpoint`
+        will resume from the last save and yield results identical to those of
+        an uninterrupted call. The checkpoint is removed once all rotations
+        have been generated. Default: None
+    n_jobs : int, optional
+        Number of processes used to match `coords` to their rotated
+        counterparts. Rotations are still generated (in order) from `seed` in
+        the current process, so the results do not depend on `n_jobs`.
+        Default: None
 
     Returns
     -------
@@ -635,6 +3623,17 @@ def gen_spinsamples(coords, hemiid, n_rotate=1000, check_duplicates=True,
     (especially for `method='hungarian'`). Refer to [ST1]_ for information on
     why the default (i.e., ``exact`` set to False) suffices in most cases.
 
+    Since `method='hungarian'` requires the full distance matrix between the
+    original and rotated coordinates, it becomes impractical beyond a few
+    thousand parcels. Specifying `method='sparse_hungarian'` instead considers
+    only the 16 nearest rotated neighbors of each coordinate (doubling this
+    number until a one-to-one assignment is possible) and finds the assignment
+    with the lowest cost among those. This is an approximation: the total cost
+    of each resulting spin is never lower than that of the spin found with
+    `method='hungarian'` from the same rotation, and is higher when the optimal
+    assignment reassigns a coordinate to a rotated neighbor beyond those that
+    were considered.
+
     For the original MATLAB implementation of this function refer to [ST5]_.
 
     References
@@ -660,7 +3659,7 @@ def gen_spinsamples(coords, hemiid, n_rotate=1000, check_duplicates=True,
     .. [ST5] https://github.com/spin-test/spin-test
     """
 
-    methods = ['original', 'vasa', 'hungarian']
+    methods = ['original', 'vasa', 'hungarian', 'sparse_hungarian']
     if method not in methods:
         raise ValueError('Provided method "{}" invalid. Must be one of {}.'
                          .format(method, methods))
@@ -674,10 +3673,14 @@ def gen_spinsamples(coords, hemiid, n_rotate=1000, check_duplicates=True,
         elif exact and method == 'original':
             method = 'hungarian'
 
-    seed = check_random_state(seed)
-
     coords = np.asanyarray(coords)
     hemiid = np.squeeze(np.asanyarray(hemiid, dtype='int8'))
+    if checkpoint is not None:
+        checkpoint = utils._Checkpoint(checkpoint, 'gen_spinsamples', coords,
+                                       hemiid, n_rotate, check_duplicates,
+                                       method, seed)
+
+    seed = check_random_state(seed)
 
     # check supplied coordinate shape
     if coords.shape[-1] != 3 or coords.squeeze().ndim != 2:
@@ -702,9 +3705,48 @@ def gen_spinsamples(coords, hemiid, n_rotate=1000, check_duplicates=True,
     cost = np.zeros((len(coords), n_rotate))
     inds = np.arange(len(coords), dtype=int)
 
+    # with the original method all rotations are matched against the same
+    # (unrotated) coordinates, so build one tree per hemisphere up front and
+    # match rotations in batches; other methods match rotations one at a time
+    # (though sparse Hungarian spins also use the trees to find neighbors)
+    trees, batch_size = _spin_trees(coords, hemiid, method), 1
+    if method == 'original':
+        batch_size = max(1, _MAX_MEMORY // (64 * len(coords)))
+    # in parallel, draw enough rotations at once to keep every process busy.
+    # which rotations are used doesn't depend on how many are drawn at once
+    n_workers = 1 if n_jobs is None else effective_n_jobs(n_jobs)
+    batch_size *= n_workers
+
+    # resume from the last checkpoint, if any
+    msg, warned, done = '', False, 0
+    state = None if checkpoint is None else checkpoint.load()
+    if state is not None:
+        done, warned = int(state['done']), bool(state['warned'])
+        spinsamples[:, :done] = state['spinsamples']
+        cost[:, :done] = state['cost']
+        utils._set_random_state(seed, state)
+        for _ in range(int(state.get('used', 0))):
+            _gen_rotation(seed=seed)
+
+    # spins generated so far, indexed by a digest of their resampling array,
+    # so that checking for duplicates doesn't require comparing against them
+    # all. the digest is only used to narrow the comparison: any spins sharing
+    # a digest with the candidate are still compared exactly
+    seen = {}
+    if check_duplicates:
+        for n in range(done):
+            resampled = spinsamples[:, n].astype('int32')
+            seen.setdefault(_spin_digest(resampled), []).append(n)
+
+    # rotations are drawn in batches ahead of when they are needed. keep track
+    # of the random state before the current batch was drawn (`start`) and the
+    # number of rotations used from it (`used`) so that checkpoints and the
+    # final state of `seed` are the same as if they were drawn one at a time
+    start, used = utils._get_random_state(seed), 0
+    batch, batch_cost = np.zeros((0, len(coords))), None
+
     # generate rotations and resampling array!
-    msg, warned = '', False
-    for n in range(n_rotate):
+    for n in range(done, n_rotate):
         count, duplicated = 0, True
 
         if verbose:
@@ -713,55 +3755,32 @@ def gen_spinsamples(coords, hemiid, n_rotate=1000, check_duplicates=True,
 
         while duplicated and count < 500:
             count, duplicated = count + 1, False
-            resampled = np.zeros(len(coords), dtype='int32')
-
-            # rotate each hemisphere separately
-            for h, rot in enumerate(_gen_rotation(seed=seed)):
-                hinds = (hemiid == h)
-                coor = coords[hinds]
-                if len(coor) == 0:
-                    continue
-
-                # if we need an "exact" mapping (i.e., each node needs to be
-                # assigned EXACTLY once) then we have to calculate the full
-                # distance matrix which is a nightmare with respect to memory
-                # for anything that isn't parcellated data.
-                # that is, don't do this with vertex coordinates!
-                if method == 'vasa':
-                    dist = spatial.distance_matrix(coor, coor @ rot)
-                    # min of max a la Vasa et al., 2018
-                    col = np.zeros(len(coor), dtype='int32')
-                    for r in range(len(dist)):
-                        # find parcel whose closest neighbor is farthest away
-                        # overall; assign to that
-                        row = dist.min(axis=1).argmax()
-                        col[row] = dist[row].argmin()
-                        cost[inds[hinds][row], n] = dist[row, col[row]]
-                        # set to -inf and inf so they can't be assigned again
-                        dist[row] = -np.inf
-                        dist[:, col[row]] = np.inf
-                # optimization of total cost using Hungarian algorithm. this
-                # may result in certain parcels having higher cost than with
-                # `method='vasa'` but should always result in the total cost
-                # being lower #tradeoffs
-                elif method == 'hungarian':
-                    dist = spatial.distance_matrix(coor, coor @ rot)
-                    row, col = optimize.linear_sum_assignment(dist)
-                    cost[hinds, n] = dist[row, col]
-                # if nodes can be assigned multiple targets, we can simply use
-                # the absolute minimum of the distances (no optimization
-                # required) which is _much_ lighter on memory
-                # huge thanks to https://stackoverflow.com/a/47779290 for this
-                # memory-efficient method
-                elif method == 'original':
-                    dist, col = spatial.cKDTree(coor @ rot).query(coor, 1)
-                    cost[hinds, n] = dist
-
-                resampled[hinds] = inds[hinds][col]
+
+            if used == len(batch):
+                start, used = utils._get_random_state(seed), 0
+                rotations = [_gen_rotation(seed=seed)
+                             for _ in range(min(batch_size, n_rotate - n))]
+                if n_jobs is None:
+                    batch, batch_cost = _assign_spins(coords, hemiid,
+                                                      rotations, method, trees)
+                else:
+                    splits = np.array_split(np.arange(len(rotations)),
+                                            min(n_workers, len(rotations)))
+                    chunks = Parallel(n_jobs=n_jobs)(
+                        delayed(_spin_chunk)(coords, hemiid, method,
+                                             [rotations[i] for i in split])
+                        for split in splits
+                    )
+                    batch = np.vstack([c[0] for c in chunks])
+                    batch_cost = np.vstack([c[1] for c in chunks])
+            resampled, cost[:, n] = batch[used], batch_cost[used]
+            used += 1
 
             # if we want to check for duplicates ensure that we don't have any
             if check_duplicates:
-                if np.any(np.all(resampled[:, None] == spinsamples[:, :n], 0)):
+                digest = _spin_digest(resampled)
+                if any(np.all(resampled == spinsamples[:, i])
+                       for i in seen.get(digest, [])):
                     duplicated = True
                 # if our "spin" is identical to the input then that's no good
                 elif np.all(resampled == inds):
@@ -776,6 +3795,22 @@ def gen_spinsamples(coords, hemiid, n_rotate=1000, check_duplicates=True,
             warned = True
 
         spinsamples[:, n] = resampled
+        if check_duplicates:
+            seen.setdefault(digest, []).append(n)
+
+        if checkpoint is not None:
+            checkpoint.save(done=n + 1, warned=warned, used=used,
+                            columns=dict(spinsamples=spinsamples[:, :n + 1],
+                                         cost=cost[:, :n + 1]), **start)
+
+    if checkpoint is not None:
+        checkpoint.remove()
+
+    # discard any rotations that were drawn but not used
+    if used < len(batch):
+        utils._set_random_state(seed, start)
+        for _ in range(used):
+            _gen_rotation(seed=seed)
 
     if verbose:
         print(' ' * len(msg) + '\b' * len(msg), end='', flush=True)
@@ -42,3 +42,19 @@ def test_zrand_partitions():
     # zrand and lower stdev zrand
     assert np.nanmean(all_same) > np.nanmean(all_diff)
     assert np.nanstd(all_same) < np.nanstd(all_diff)
+
+
+def test_get_modularity_sig():
+    adj = np.corrcoef(rs.normal(size=(20, 30)))
+    comm = np.repeat([1, 2], 10)
+
+    sig = modularity.get_modularity_sig(adj, comm, n_perm=200, seed=1)
+    assert sig.shape == (2,) and sig.dtype == bool
+
+    # parallel results should not depend on the number of processes
+    null1 = modularity._null_modularity(adj, comm, n_perm=200, seed=1,
+                                        n_jobs=1)
+    null2 = modularity._null_modularity(adj, comm, n_perm=200, seed=1,
+                                        n_jobs=2)
+    assert null1.shape == (2, 200)
+    assert np.array_equal(null1, null2)
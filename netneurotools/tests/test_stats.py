@@ -6,8 +6,9 @@ For testing netneurotools.stats functionality
 import itertools
 import numpy as np
 import pytest
+from scipy import stats as sstats
 
-from netneurotools import datasets, stats
+from netneurotools import datasets, stats, utils
 
 
 @pytest.mark.xfail
@@ -20,6 +21,74 @@ def test_permtest_1samp():
     # t1, p1 = stats.permtest_1samp(rvn1, 1, axis=0)
 
 
+@pytest.mark.parametrize('batch_size', [None, 1, 7, 1000])
+def test_permtest_1samp_batched(batch_size):
+    rs = np.random.RandomState(7654567)
+    rvs = rs.normal(loc=5, scale=10, size=(50, 2))
+
+    # batching should not change results for a given seed
+    t, p = stats.permtest_1samp(rvs, [5.0, 0.0], batch_size=batch_size)
+    assert np.allclose(t, [-0.985602, 4.94795031])
+    assert np.allclose(p, [0.48551449, 0.000999])
+
+    t, p = stats.permtest_1samp(rvs.T, [5.0, 0.0], axis=1,
+                                batch_size=batch_size)
+    assert np.allclose(p, [0.51548452, 0.000999])
+
+    with pytest.raises(ValueError):
+        stats.permtest_1samp(rvs, 5.0, batch_size=0)
+
+
+@pytest.mark.parametrize('batch_size', [None, 1, 7, 1000])
+def test_permtest_1samp_shared_flips(batch_size):
+    rs = np.random.RandomState(1234)
+    rvs = rs.normal(loc=0.2, size=(20, 30))
+
+    # shared flips are equivalent to a single product of sign vectors
+    signs = np.random.RandomState(0).choice([-1, 1], size=(1000, len(rvs)))
+    null = np.abs(signs @ rvs) / len(rvs)
+    true = np.abs(rvs.mean(axis=0))
+    expected = (np.sum(null >= true - 1e-12, axis=0) + 1) / 1001
+
+    t, p = stats.permtest_1samp(rvs, 0, shared_flips=True,
+                                batch_size=batch_size)
+    assert np.allclose(t, rvs.mean(axis=0))
+    assert np.allclose(p, expected)
+
+
+def test_permtest_exact(tmp_path):
+    rs = np.random.RandomState(1234)
+    a, b = rs.normal(loc=0.5, size=(2, 9, 4))
+
+    # brute-force enumeration of all possible sign flips
+    signs = np.array(list(itertools.product([-1, 1], repeat=len(a))))
+    for func, args, diff in ((stats.permtest_1samp, (a, 0), a),
+                             (stats.permtest_rel, (a, b), b - a)):
+        null = np.abs(signs @ diff) / len(diff)
+        expected = np.mean(null >= np.abs(diff.mean(axis=0)) - 1e-12, axis=0)
+
+        # explicitly requested or automatically used when n_perm is too large
+        for n_perm in ('exact', 1000):
+            stat, pval = func(*args, n_perm=n_perm)
+            assert np.allclose(stat, diff.mean(axis=0))
+            assert np.allclose(pval, expected)
+
+    with pytest.raises(ValueError):
+        stats.permtest_1samp(a, 0, n_perm='notexact')
+
+    # enumeration is limited to a tractable number of sign flips
+    with pytest.raises(ValueError):
+        stats.permtest_1samp(rs.normal(size=32), 0, n_perm='exact')
+
+    # options that have no effect when enumerating all flips are flagged
+    for kwargs in ({'n_exceed': 5}, {'tail_approx': True}, {'n_jobs': 2},
+                   {'checkpoint': tmp_path / 'checkpoint.npz'}):
+        for func, args in ((stats.permtest_1samp, (a, 0)),
+                           (stats.permtest_rel, (a, b))):
+            with pytest.warns(UserWarning, match='enumerated'):
+                func(*args, **kwargs)
+
+
 def test_permtest_rel():
     dr, pr = -0.0005, 0.4175824175824176
     dpr = ([dr, -dr], [pr, pr])
@@ -35,14 +104,16 @@ def test_permtest_rel():
     d, p = stats.permtest_rel(rvs1_2D.T, rvs2_2D.T, axis=0, seed=1234)
     assert np.allclose([d, p], dpr)
 
-    # but the p-value will differ here because of _how_ we're drawing the
-    # random permutations... it would be nice if this was consistent, but as
-    # yet i don't have a great idea on how to make that happen without assuming
-    # a whole lot about the data
-    pr = 0.51248751
-    tpr = ([dr, -dr], [pr, pr])
+    # exchanges are drawn along `axis`, so the p-values are also consistent
+    # when the arrays are transposed
     d, p = stats.permtest_rel(rvs1_2D, rvs2_2D, axis=1, seed=1234)
-    assert np.allclose([d, p], tpr)
+    assert np.allclose([d, p], dpr)
+
+    # batching should not change results for a given seed
+    for batch_size in (1, 7):
+        d, p = stats.permtest_rel(rvs1_2D.T, rvs2_2D.T, axis=0, seed=1234,
+                                  batch_size=batch_size)
+        assert np.allclose([d, p], dpr)
 
 
 def test_permtest_pearsonr():
@@ -66,6 +137,372 @@ def test_permtest_pearsonr():
     assert np.allclose(r, np.array([0.50004037, 0.89927523]))
     assert np.allclose(p, np.array([0.000999, 0.000999]))
 
+    # permutations reproducing the original correlation (e.g., due to ties)
+    # are counted even though they are computed differently, as are those
+    # "exceeding" correlations that are zero up to floating point error
+    for seed, size in ((10, 5), (50, 6)):
+        rs = np.random.RandomState(seed)
+        a, b = rs.randint(0, 3, size=(2, size)).astype(float)
+        for kwargs in ({}, {'n_exceed': 5}, {'correction': 'maxT'}):
+            r, p = stats.permtest_pearsonr(a, b, n_perm=200, seed=seed,
+                                           **kwargs)
+            assert np.isclose(p, 1)
+
+
+def test_permtest_pearsonr_resamples():
+    rs = np.random.RandomState(1234)
+    x, y = rs.normal(size=(2, 30, 3))
+    y += x * 0.5
+
+    # resampling with replacement (e.g., from spins) should give the same null
+    # as explicitly correlating resampled data with `efficient_pearsonr`
+    resamples = rs.randint(len(x), size=(len(x), 50))
+    for a, b in ((x, y), (x[:, 0], y), (x, y[:, 0])):
+        true, _ = stats.efficient_pearsonr(a, b)
+        null = np.array([stats.efficient_pearsonr(a[r], b)[0]
+                         for r in resamples.T])
+        expected = (1 + np.sum(np.abs(null) >= np.abs(true), axis=0)) / 51
+        for batch_size in (None, 1, 7):
+            r, p = stats.permtest_pearsonr(a, b, n_perm=50,
+                                           resamples=resamples,
+                                           batch_size=batch_size)
+            assert np.allclose(r, true)
+            assert np.allclose(p, expected)
+
+
+def test_permtest_spearmanr():
+    rs = np.random.RandomState(1234)
+    x, y = rs.randint(10, size=(2, 30, 3)).astype(float)  # lots of ties
+    y += x * 0.2
+
+    # permutations of the data are permutations of the ranks
+    r, p = stats.permtest_pearsonr(x, y, n_perm=50, method='spearman')
+    assert np.allclose(r, stats.efficient_spearmanr(x, y)[0])
+    assert np.allclose(p, stats.permtest_pearsonr(sstats.rankdata(x, axis=0),
+                                                  sstats.rankdata(y, axis=0),
+                                                  n_perm=50)[1])
+
+    # but resampled data must be re-ranked
+    resamples = rs.randint(len(x), size=(len(x), 50))
+    for a, b in ((x, y), (x[:, 0], y), (x, y[:, 0])):
+        true, _ = stats.efficient_spearmanr(a, b)
+        null = np.array([stats.efficient_spearmanr(a[r], b)[0]
+                         for r in resamples.T])
+        expected = (1 + np.sum(np.abs(null) >= np.abs(true) - 1e-12,
+                               axis=0)) / 51
+        for batch_size in (None, 7):
+            r, p = stats.permtest_pearsonr(a, b, n_perm=50,
+                                           resamples=resamples,
+                                           batch_size=batch_size,
+                                           method='spearman')
+            assert np.allclose(r, true)
+            assert np.allclose(p, expected)
+
+    # with few, heavily tied observations many permutations reproduce the
+    # original correlation; these must be counted even though scipy computes
+    # them differently
+    for seed in (1, 3, 5, 8):
+        rs = np.random.RandomState(seed)
+        a, b = rs.randint(0, 3, size=(2, 6)).astype(float)
+        resamples = rs.randint(6, size=(6, 50))
+        true = sstats.spearmanr(a, b)[0]
+        perms = np.random.RandomState(seed)
+        for kwargs, idx in (({'resamples': resamples}, resamples.T),
+                            ({'seed': seed}, [perms.permutation(6)
+                                              for n in range(50)])):
+            null = np.array([sstats.spearmanr(a[i], b)[0] for i in idx])
+            expected = (1 + np.sum(np.abs(null) >= np.abs(true) - 1e-12)) / 51
+            r, p = stats.permtest_pearsonr(a, b, n_perm=50, method='spearman',
+                                           **kwargs)
+            assert np.isclose(p, expected)
+
+    with pytest.raises(ValueError):
+        stats.permtest_pearsonr(x, y, method='kendall')
+
+
+def test_permtest_partial_pearsonr():
+    rs = np.random.RandomState(1234)
+    conf = rs.normal(size=(30, 2))
+    x = conf @ [1, 2] + rs.normal(size=30)
+    y = conf @ rs.normal(size=(2, 3)) + rs.normal(size=(30, 3))
+    y += 0.3 * x[:, None]
+
+    # brute-force Freedman-Lane: permute residuals of the reduced model, add
+    # them back to the fitted values, and refit
+    design = utils.add_constant(conf)
+    hat = design @ np.linalg.pinv(design)
+    resid = x - hat @ x
+
+    def partial(a, b):
+        return stats.efficient_pearsonr(a - hat @ a, b - hat @ b)[0]
+
+    true = partial(x, y)
+    perms = np.random.RandomState(0)
+    null = np.array([partial(hat @ x + resid[perms.permutation(len(x))], y)
+                     for n in range(100)])
+    expected = (1 + np.sum(np.abs(null) >= np.abs(true) - 1e-12,
+                           axis=0)) / 101
+    for batch_size in (None, 7):
+        r, p = stats.permtest_partial_pearsonr(x, y, conf, n_perm=100,
+                                               batch_size=batch_size)
+        assert np.allclose(r, true)
+        assert np.allclose(p, expected)
+
+    # with few, heavily tied observations many permutations reproduce the
+    # original partial correlation (which may be zero up to floating point
+    # error); these must be counted even though they are computed differently
+    for seed in (1, 8, 37, 53):
+        rs = np.random.RandomState(seed)
+        conf = rs.randint(0, 2, size=(6, 1)).astype(float)
+        x, y = rs.randint(0, 3, size=(2, 6)).astype(float)
+        design = utils.add_constant(conf)
+        hat = design @ np.linalg.pinv(design)
+        resid = x - hat @ x
+        true = np.corrcoef(resid, y - hat @ y)[0, 1]
+        perms = np.random.RandomState(seed)
+        null = np.array([np.corrcoef(xp - hat @ xp, y - hat @ y)[0, 1]
+                         for xp in (hat @ x + resid[perms.permutation(6)]
+                                    for n in range(50))])
+        expected = (1 + np.sum(np.abs(null) >= np.abs(true) - 1e-12)) / 51
+        r, p = stats.permtest_partial_pearsonr(x, y, conf, n_perm=50,
+                                               seed=seed)
+        assert np.isclose(p, expected)
+
+    with pytest.raises(ValueError):
+        stats.permtest_partial_pearsonr(x, y, conf[:-1])
+
+
+def test_permtest_sequential():
+    rs = np.random.RandomState(1234)
+    x, y = rs.normal(size=(2, 40, 6))
+    y[:, :2] += x[:, :2]
+    resamples = np.column_stack([rs.permutation(len(x)) for n in range(500)])
+
+    # manually compute Besag & Clifford sequential p-values
+    true, _ = stats.efficient_pearsonr(x, y)
+    null = np.array([stats.efficient_pearsonr(x[r], y)[0]
+                     for r in resamples.T])
+    hits = np.cumsum(np.abs(null) >= np.abs(true), axis=0)
+    expected = (hits[-1] + 1) / 501
+    stopped = hits[-1] >= 10
+    expected[stopped] = 10 / (np.argmax(hits[:, stopped] >= 10, axis=0) + 1)
+
+    for batch_size in (None, 1, 7, 500):
+        r, p = stats.permtest_pearsonr(x, y, n_perm=500, resamples=resamples,
+                                       batch_size=batch_size, n_exceed=10)
+        assert np.allclose(p, expected)
+    assert np.all(p[:2] < 0.01)
+
+    # non-significant features stop early for all permutation tests
+    y[:, :2] += 1
+    for func, args in ((stats.permtest_1samp, (y, 0)),
+                       (stats.permtest_rel, (y, np.zeros_like(y)))):
+        stat, p = func(*args, n_perm=500, n_exceed=10)
+        assert np.allclose(p[:2], 1 / 501)
+        assert np.all(p[2:] >= 10 / 500)
+
+    with pytest.raises(ValueError):
+        stats.permtest_1samp(y, 0, n_exceed=0)
+
+
+def test_permtest_tail_approx():
+    rs = np.random.RandomState(1234)
+    x, y = rs.normal(size=(2, 50, 4))
+    y = x * [1, 0.6, 0, 0] + y
+
+    r, p = stats.permtest_pearsonr(x[:, 0], y, n_perm=500)
+    rt, pt, fit = stats.permtest_pearsonr(x[:, 0], y, n_perm=500,
+                                          tail_approx=True)
+    assert np.allclose(r, rt) and fit.dtype == bool
+
+    # strong correlations have extrapolated p-values below the usual minimum
+    assert np.all(fit[:1]) and np.all(pt[:1] < 1 / 501) and np.all(pt > 0)
+    # other p-values are not changed
+    assert np.allclose(p[~fit], pt[~fit])
+
+    stat, pval, fit = stats.permtest_1samp(y[:, 0], 0, n_perm=500,
+                                           tail_approx=True)
+    assert np.isscalar(pval) and fit.ndim == 0
+
+    with pytest.raises(ValueError):
+        stats.permtest_1samp(y, 0, n_exceed=10, tail_approx=True)
+
+
+def test_permtest_tail_approx_reference():
+    rs = np.random.RandomState(1234)
+    x, y = rs.normal(size=(2, 40))
+    y = 0.5 * x + y
+
+    # extrapolated p-values should not be (much) smaller than those obtained
+    # from a far larger number of permutations
+    r, ref = stats.permtest_pearsonr(x, y, n_perm=200000)
+    for seed in range(10):
+        rt, pt, fit = stats.permtest_pearsonr(x, y, n_perm=500, seed=seed,
+                                              tail_approx=True)
+        assert fit and ref / 2 < pt < 1 / 501
+
+
+def test_permtest_maxT():
+    rs = np.random.RandomState(1234)
+    x, y = rs.normal(size=(2, 30, 10))
+    y[:, :2] += x[:, :2]
+    resamples = np.column_stack([rs.permutation(len(x)) for n in range(200)])
+
+    # compare to the maximum null distribution computed manually
+    true, _ = stats.efficient_pearsonr(x, y)
+    maxnull = np.max([np.abs(stats.efficient_pearsonr(x[r], y)[0])
+                      for r in resamples.T], axis=1)
+    expected = (1 + np.sum(maxnull[:, None] >= np.abs(true), axis=0)) / 201
+    for batch_size in (None, 1, 7):
+        r, p = stats.permtest_pearsonr(x, y, n_perm=200, resamples=resamples,
+                                       batch_size=batch_size,
+                                       correction='maxT')
+        assert np.allclose(p, expected)
+
+    # corrected p-values are never smaller than uncorrected ones
+    for func, args in ((stats.permtest_1samp, (y, 0)),
+                       (stats.permtest_rel, (y, x))):
+        stat, puncorr = func(*args, n_perm=200)
+        stat, pcorr = func(*args, n_perm=200, correction='maxT')
+        assert np.all(pcorr >= puncorr - 0.05)
+
+    # exact enumeration of sign flips
+    signs = np.array(list(itertools.product([-1, 1], repeat=8)))
+    null = np.max(np.abs(signs @ y[:8]) / 8, axis=1)
+    expected = np.mean(null[:, None] >= np.abs(y[:8].mean(0)) - 1e-12, axis=0)
+    stat, p = stats.permtest_1samp(y[:8], 0, n_perm='exact',
+                                   correction='maxT')
+    assert np.allclose(p, expected)
+
+    with pytest.raises(ValueError):
+        stats.permtest_1samp(y, 0, correction='bonferroni')
+    with pytest.raises(ValueError):
+        stats.permtest_1samp(y, 0, correction='maxT', n_exceed=10)
+
+
+def test_permtest_n_jobs():
+    rs = np.random.RandomState(1234)
+    x, y = rs.normal(size=(2, 30, 10))
+    y[:, :2] += x[:, :2]
+
+    # results should not depend on the number of processes (or batches)
+    for func, args in ((stats.permtest_1samp, (y, 0)),
+                       (stats.permtest_rel, (y, x)),
+                       (stats.permtest_pearsonr, (x, y))):
+        for kwargs in ({}, {'correction': 'maxT'}):
+            stat, p1 = func(*args, n_perm=250, n_jobs=1, **kwargs)
+            stat, p2 = func(*args, n_perm=250, n_jobs=2, batch_size=7,
+                            **kwargs)
+            assert np.array_equal(p1, p2)
+            stat, p3 = func(*args, n_perm=250, seed=1, n_jobs=1, **kwargs)
+            assert not np.array_equal(p1, p3)
+
+    # resampling arrays are consumed in order so no randomness is involved
+    resamples = np.column_stack([rs.permutation(len(x)) for n in range(250)])
+    r, pserial = stats.permtest_pearsonr(x, y, n_perm=250, resamples=resamples)
+    r, pparallel = stats.permtest_pearsonr(x, y, n_perm=250,
+                                           resamples=resamples, n_jobs=2)
+    assert np.array_equal(pserial, pparallel)
+
+    with pytest.raises(ValueError):
+        stats.permtest_1samp(y, 0, n_exceed=10, n_jobs=2)
+
+
+def test_permutation_result(tmp_path):
+    rs = np.random.RandomState(1234)
+    x, y = rs.normal(size=(2, 30, 10))
+    y[:, :2] += x[:, :2]
+
+    for kwargs in ({}, {'correction': 'maxT'}, {'tail_approx': True}):
+        expected = stats.permtest_pearsonr(x, y, n_perm=450, n_jobs=1,
+                                           **kwargs)
+        shards = [stats.permtest_pearsonr(x, y, n_perm=450, shard=(n, 3),
+                                          **kwargs) for n in range(3)]
+        assert all(isinstance(s, stats.PermutationResult) for s in shards)
+        assert not shards[0].complete
+
+        # results survive saving + loading
+        shards[1].save(tmp_path / 'shard.npz')
+        shards[1] = stats.PermutationResult.load(tmp_path / 'shard.npz')
+
+        # merging is associative
+        merged = shards[0].merge(shards[1]).merge(shards[2])
+        assert merged.complete
+        for out in (merged.finalize(),
+                    shards[2].merge(shards[0].merge(shards[1])).finalize()):
+            assert len(out) == len(expected)
+            for actual, desired in zip(out, expected):
+                assert np.array_equal(actual, desired)
+
+        with pytest.raises(ValueError):
+            shards[0].finalize()
+        with pytest.raises(ValueError):
+            merged.merge(shards[0])
+
+    other = stats.permtest_pearsonr(x, -y, n_perm=450, shard=(1, 3))
+    with pytest.raises(ValueError):
+        stats.permtest_pearsonr(x, y, n_perm=450, shard=(0, 3)).merge(other)
+
+    # shards must be generated from the same seed (which must be given
+    # explicitly, since shards are usually generated in separate processes)
+    first = stats.permtest_pearsonr(x, y, n_perm=450, shard=(0, 3), seed=1)
+    assert first.seed == 1
+    for seed in (2, None, np.random.RandomState(1)):
+        other = stats.permtest_pearsonr(x, y, n_perm=450, shard=(1, 3),
+                                        seed=seed)
+        with pytest.raises(ValueError):
+            first.merge(other)
+    with pytest.raises(ValueError):
+        stats.permtest_1samp(y, 0, shard=(3, 3))
+    with pytest.raises(ValueError):
+        stats.permtest_1samp(y, 0, n_exceed=10, shard=(0, 3))
+
+
+def _interrupt_checkpoints(monkeypatch, n_saves):
+    """ Makes computations with a checkpoint stop after `n_saves` saves """
+
+    save, count = utils._Checkpoint.save, itertools.count(1)
+
+    def interrupted_save(self, *args, **kwargs):
+        save(self, *args, **kwargs)
+        if next(count) == n_saves:
+            raise KeyboardInterrupt
+
+    monkeypatch.setattr(utils, '_CHECKPOINT_INTERVAL', 0)
+    monkeypatch.setattr(utils._Checkpoint, 'save', interrupted_save)
+
+
+@pytest.mark.parametrize('kwargs', [
+    {}, {'n_exceed': 5}, {'correction': 'maxT'}, {'tail_approx': True},
+    {'n_jobs': 1}, {'shard': (1, 2)}
+])
+def test_permtest_checkpoint(tmp_path, monkeypatch, kwargs):
+    rs = np.random.RandomState(1234)
+    x, y = rs.normal(size=(2, 30, 10))
+    kwargs = dict(kwargs, n_perm=1000, batch_size=50)
+    checkpoint = tmp_path / 'checkpoint.npz'
+
+    for func, args in ((stats.permtest_1samp, (y, 0)),
+                       (stats.permtest_pearsonr, (x, y))):
+        expected = func(*args, **kwargs)
+        with monkeypatch.context() as mp:
+            _interrupt_checkpoints(mp, 1)
+            with pytest.raises(KeyboardInterrupt):
+                func(*args, checkpoint=checkpoint, **kwargs)
+        assert checkpoint.exists()
+
+        # progress can't be resumed with different batches
+        with pytest.raises(ValueError):
+            func(*args, checkpoint=checkpoint, **dict(kwargs, batch_size=40))
+
+        # resuming should yield identical results + remove the checkpoint
+        out = func(*args, checkpoint=checkpoint, **kwargs)
+        assert not checkpoint.exists()
+        if 'shard' in kwargs:
+            expected, out = [expected.exceed], [out.exceed]
+        for actual, desired in zip(out, expected):
+            assert np.array_equal(actual, desired)
+
 
 @pytest.mark.parametrize('x, y, expected', [
     # basic one-dimensional input
@@ -91,6 +528,321 @@ def test_efficient_pearsonr_errors():
     assert all(np.isnan(a) for a in stats.efficient_pearsonr([], []))
 
 
+def test_efficient_pearsonr_omit():
+    rs = np.random.RandomState(1234)
+    a, b = rs.normal(size=(2, 50, 10))
+    b += a
+    a[rs.rand(*a.shape) < 0.1] = np.nan
+    b[rs.rand(*b.shape) < 0.1] = np.nan
+
+    # should match pairwise-complete correlations of each column
+    corr, pval = stats.efficient_pearsonr(a, b, nan_policy='omit')
+    for n, (x, y) in enumerate(zip(a.T, b.T)):
+        keep = ~(np.isnan(x) | np.isnan(y))
+        expected = sstats.pearsonr(x[keep], y[keep])
+        assert np.allclose((corr[n], pval[n]), expected)
+
+    # columns with no variance do not contribute any samples
+    a[:, 0] = 1
+    corr, pval = stats.efficient_pearsonr(a, b, nan_policy='omit')
+    assert corr[0] == 0 and np.isnan(pval[0])
+
+    # integer inputs are fine, too
+    corr, pval = stats.efficient_pearsonr(np.arange(10), np.arange(10) ** 2,
+                                          nan_policy='omit')
+    assert np.allclose((corr, pval), sstats.pearsonr(np.arange(10),
+                                                     np.arange(10) ** 2))
+    a = np.arange(20).reshape(10, 2)
+    for b in (a ** 2, np.where(a % 7 == 0, np.nan, a ** 2)):
+        corr, pval = stats.efficient_pearsonr(a, b, nan_policy='omit')
+        expected = stats.efficient_pearsonr(a.astype(float), b,
+                                            nan_policy='omit')
+        assert np.allclose((corr, pval), expected)
+
+
+def test_efficient_pearsonr_float32():
+    rs = np.random.RandomState(1234)
+    a, b = rs.normal(size=(2, 50, 10))
+    b += a
+    a32, b32 = a.astype('float32'), b.astype('float32')
+    expected = stats.efficient_pearsonr(a, b)
+
+    for kwargs in ({}, {'nan_policy': 'omit'}, {'chunk_size': 3}):
+        corr, pval = stats.efficient_pearsonr(a32, b32, **kwargs)
+        assert corr.dtype == np.float32 and pval.dtype == np.float64
+        assert np.allclose((corr, pval), expected, rtol=1e-5, atol=1e-6)
+
+    corr, pval = stats.PreparedPearson(a32).correlate(b32)
+    assert corr.dtype == np.float32
+    assert np.allclose((corr, pval), expected, rtol=1e-5, atol=1e-6)
+
+    # mixed precision is promoted
+    assert stats.efficient_pearsonr(a32, b)[0].dtype == np.float64
+
+    corr, pval = stats.permtest_pearsonr(a32, b32, n_perm=100)
+    assert corr.dtype == np.float32
+    assert np.allclose(pval, stats.permtest_pearsonr(a, b, n_perm=100)[1])
+
+
+def test_efficient_pearsonr_chunked(tmp_path):
+    rs = np.random.RandomState(1234)
+    a, b = rs.normal(size=(2, 50, 23))
+    b += a
+    np.save(tmp_path / 'a.npy', a)
+    a_mmap = np.load(tmp_path / 'a.npy', mmap_mode='r')
+
+    # chunks should not change results, including for memory-mapped inputs,
+    # broadcasting, and NaNs
+    a_nan = a.copy()
+    a_nan[rs.rand(*a.shape) < 0.05] = np.nan
+    for x, y, kwargs in ((a, b, {}),
+                         (a_mmap, b, {}),
+                         (a[:, 0], b, {}),
+                         (a, b[:, :1], {}),
+                         (a[:, 0], b[:, 0], {}),
+                         (a_nan, b, {'nan_policy': 'omit'})):
+        expected = stats.efficient_pearsonr(x, y, **kwargs)
+        for chunk_size in (1, 5, 100):
+            out = stats.efficient_pearsonr(x, y, chunk_size=chunk_size,
+                                           **kwargs)
+            assert np.shape(out[0]) == np.shape(expected[0])
+            assert np.allclose(out, expected)
+
+    with pytest.raises(ValueError):
+        stats.efficient_pearsonr(a, b, chunk_size=0)
+    with pytest.raises(ValueError):
+        stats.efficient_pearsonr(a[..., None], b[..., None], chunk_size=10)
+    with pytest.raises(ValueError):
+        stats.efficient_pearsonr(a, b[:, :2], chunk_size=10)
+
+
+def test_efficient_pearsonr_no_pval(monkeypatch):
+    rs = np.random.RandomState(1234)
+    a, b = rs.normal(size=(50, 4)), rs.normal(size=(50, 4))
+    a[rs.rand(*a.shape) < 0.05] = np.nan
+    expected = {
+        nan_policy: stats.efficient_pearsonr(a, b, nan_policy=nan_policy)[0]
+        for nan_policy in ('propagate', 'omit')
+    }
+
+    # p-values shouldn't be computed at all if they aren't requested
+    def pval(*args, **kwargs):
+        raise AssertionError('p-values computed')
+
+    monkeypatch.setattr(stats, '_pearsonr_pval', pval)
+    for nan_policy, kwargs in itertools.product(
+        ('propagate', 'omit'),
+        ({}, {'chunk_size': 2}, {'pairwise': True})
+    ):
+        corr = stats.efficient_pearsonr(a, b, nan_policy=nan_policy,
+                                        return_pval=False, **kwargs)
+        if kwargs.get('pairwise'):
+            corr = np.diag(corr)
+        assert np.allclose(corr, expected[nan_policy], equal_nan=True)
+
+
+def test_efficient_pearsonr_pairwise(tmp_path):
+    rs = np.random.RandomState(1234)
+    a, b = rs.normal(size=(50, 4)), rs.normal(size=(50, 9))
+    b[:, :4] += a
+    a[rs.rand(*a.shape) < 0.05] = np.nan
+    b[rs.rand(*b.shape) < 0.05] = np.nan
+    np.save(tmp_path / 'b.npy', b)
+    b_mmap = np.load(tmp_path / 'b.npy', mmap_mode='r')
+
+    # should match correlating every pair of columns separately
+    for nan_policy in ('propagate', 'omit'):
+        expected = np.array([[stats.efficient_pearsonr(x, y,
+                                                       nan_policy=nan_policy)
+                              for y in b.T] for x in a.T])
+        for y in (b, b_mmap):
+            for chunk_size in (None, 1, 3):
+                corr, pval = stats.efficient_pearsonr(a, y, pairwise=True,
+                                                      nan_policy=nan_policy,
+                                                      chunk_size=chunk_size)
+                assert corr.shape == (4, 9)
+                assert np.allclose(corr, expected[..., 0], equal_nan=True)
+                assert np.allclose(pval, expected[..., 1], equal_nan=True)
+
+    corr = stats.efficient_pearsonr(a[:, 0], b, pairwise=True,
+                                    nan_policy='omit', return_pval=False)
+    assert corr.shape == (9,)
+
+    # single precision inputs are still accumulated in double precision
+    x = rs.normal(size=(100000, 3)).astype('float32')
+    y = (x + rs.normal(size=(100000, 3))).astype('float32')
+    expected = np.corrcoef(x.T.astype(float), y.T.astype(float))[:3, 3:]
+    corr = stats.efficient_pearsonr(x, y, pairwise=True, return_pval=False)
+    assert corr.dtype == np.float32
+    assert np.allclose(corr, expected, rtol=0, atol=1e-6)
+
+    with pytest.raises(ValueError):
+        stats.efficient_pearsonr(a, b, pairwise=True, nan_policy='raise')
+    with pytest.raises(ValueError):
+        stats.efficient_pearsonr(a, b[:-1], pairwise=True)
+    with pytest.raises(ValueError):
+        stats.efficient_pearsonr(a[..., None], b, pairwise=True)
+
+
+def test_prepared_pearson():
+    rs = np.random.RandomState(1234)
+    x, y = rs.normal(size=(2, 20, 3))
+
+    for a, b in ((x, y), (x[:, 0], y), (x, y[:, 0]), (x[:, 0], y[:, 0])):
+        prep = stats.PreparedPearson(a)
+        assert prep.n_obs == len(a)
+        assert np.allclose(prep.correlate(b), stats.efficient_pearsonr(a, b))
+
+    # NaNs are handled as in `efficient_pearsonr`
+    y[0, 0] = np.nan
+    for nan_policy in ('propagate', 'omit'):
+        prep = stats.PreparedPearson(x, nan_policy=nan_policy)
+        assert np.allclose(prep.correlate(y),
+                           stats.efficient_pearsonr(x, y,
+                                                    nan_policy=nan_policy),
+                           equal_nan=True)
+
+    with pytest.raises(ValueError):
+        stats.PreparedPearson(x, nan_policy='raise').correlate(y)
+    with pytest.raises(ValueError):
+        stats.PreparedPearson(x).correlate(y[:-1])
+    with pytest.raises(ValueError):
+        stats.PreparedPearson(x).correlate(y[:, :2])
+
+
+def test_online_correlation(tmp_path):
+    rs = np.random.RandomState(1234)
+    ts = rs.normal(size=(200, 6)) + rs.normal(size=(200, 1)) + 100
+
+    # accumulating chunks (of any size) should match correlating all at once
+    expected = np.corrcoef(ts.T)
+    acc = stats.OnlineCorrelation()
+    for chunk in np.array_split(ts, [1, 10, 11, 150]):
+        acc.update(chunk)
+    assert acc.n_obs == len(ts)
+    assert np.allclose(acc.mean, ts.mean(axis=0))
+    assert np.allclose(acc.corrcoef(), expected)
+
+    # as should merging separately accumulated chunks
+    first = stats.OnlineCorrelation().update(ts[:120])
+    second = stats.OnlineCorrelation().update(ts[120:])
+    merged = first.merge(second)
+    assert first.n_obs == 120 and merged.n_obs == len(ts)
+    assert np.allclose(merged.corrcoef(), expected)
+    assert np.allclose(first.merge(stats.OnlineCorrelation()).corrcoef(),
+                       np.corrcoef(ts[:120].T))
+
+    acc.save(tmp_path / 'acc.npz')
+    loaded = stats.OnlineCorrelation.load(tmp_path / 'acc.npz')
+    assert loaded.n_obs == acc.n_obs
+    assert np.allclose(loaded.corrcoef(), expected)
+
+    with pytest.raises(ValueError):
+        acc.update(ts[:, :3])
+    with pytest.raises(ValueError):
+        stats.OnlineCorrelation().corrcoef()
+
+
+def test_efficient_spearmanr():
+    rs = np.random.RandomState(1234)
+    x, y = rs.randint(10, size=(2, 30, 3)).astype(float)  # lots of ties
+    y += x * 0.5
+
+    corr, pval = stats.efficient_spearmanr(x, y)
+    for n in range(x.shape[-1]):
+        assert np.allclose((corr[n], pval[n]),
+                           sstats.spearmanr(x[:, n], y[:, n]))
+    assert np.allclose(stats.efficient_spearmanr(x[:, 0], y[:, 0]),
+                       (corr[0], pval[0]))
+    assert np.allclose(stats.efficient_spearmanr(x[:, 0], y)[0],
+                       [sstats.spearmanr(x[:, 0], col)[0] for col in y.T])
+
+    # NaNs are omitted before ranking
+    x[0, 0], y[1, 0] = np.nan, np.nan
+    corr, pval = stats.efficient_spearmanr(x, y, nan_policy='omit')
+    assert np.allclose((corr[0], pval[0]),
+                       sstats.spearmanr(x[2:, 0], y[2:, 0]))
+    assert np.allclose((corr[1:], pval[1:]),
+                       stats.efficient_spearmanr(x[:, 1:], y[:, 1:]))
+    corr, pval = stats.efficient_spearmanr(x, y)
+    assert np.isnan(corr[0]) and not np.any(np.isnan(corr[1:]))
+
+    with pytest.raises(ValueError):
+        stats.efficient_spearmanr(x, y, nan_policy='raise')
+    with pytest.raises(ValueError):
+        stats.efficient_spearmanr(x, y[:-1])
+
+
+def test_residualize():
+    rs = np.random.RandomState(1234)
+    X, Xc = rs.normal(size=(50, 3)), rs.normal(size=(30, 3))
+    Y = X @ rs.normal(size=(3, 8)) + rs.normal(size=(50, 8)) + 5
+    Yc = rs.normal(size=(30, 8))
+
+    # residuals should be uncorrelated with (and, without an intercept,
+    # orthogonal to) the regressors
+    Yr = stats.residualize(X, Y, normalize=False, add_intercept=False)
+    assert np.allclose(X.T @ Yr, 0)
+    Yr = stats.residualize(X, Y)
+    assert np.allclose(Yr.mean(axis=0), 0) and np.allclose(Yr.std(axis=0), 1)
+    assert np.allclose(stats.efficient_pearsonr(X[:, [0]], Yr)[0], 0)
+
+    # fitted residualizers can be re-fit to new features and applied to new
+    # subjects
+    res = stats.Residualizer()
+    assert np.allclose(np.column_stack([res.fit_transform(X, Y[:, :4]),
+                                        res.fit_transform(X, Y[:, 4:])]), Yr)
+    res.fit(Xc, Yc)
+    expected = stats.residualize(X, Y, Xc=Xc, Yc=Yc)
+    assert np.allclose(res.transform(X, Y), expected)
+    assert np.allclose(np.vstack([res.transform(X[:20], Y[:20]),
+                                  res.transform(X[20:], Y[20:])]),
+                       expected)
+
+    # modifying the coefficient matrix in place invalidates its factorization
+    res, Xm = stats.Residualizer(add_intercept=False), X.copy()
+    res.fit(Xm, Y)
+    Xm[:] = rs.normal(size=Xm.shape)
+    res.fit(Xm, Y)
+    assert np.allclose(res.betas, np.linalg.lstsq(Xm, Y, rcond=None)[0])
+
+    with pytest.raises(ValueError):
+        stats.Residualizer().transform(X, Y)
+    with pytest.raises(ValueError):
+        stats.residualize(X, Y, Xc=Xc)
+
+
+def test_get_mad_outliers(tmp_path):
+    rs = np.random.RandomState(1234)
+    data = rs.normal(size=(40, 30))
+    data[:3] += 10
+    data[rs.rand(*data.shape) < 0.05] = np.nan
+    np.save(tmp_path / 'data.npy', data)
+    data_mmap = np.load(tmp_path / 'data.npy', mmap_mode='r')
+
+    expected = stats.get_mad_outliers(data)
+    assert np.all(expected[:3]) and not np.any(expected[3:])
+    for chunk_size in (1, 7, 100):
+        assert np.array_equal(stats.get_mad_outliers(data_mmap,
+                                                     chunk_size=chunk_size),
+                              expected)
+    assert np.array_equal(stats.get_mad_outliers(data, approx_median=True),
+                          expected)
+
+    # approximate medians are within (range / number of bins) of exact ones
+    data[:, 0] = np.nan
+    data[:, 1] = 1
+    approx = stats._approx_nanmedian(data)
+    assert np.isnan(approx[0]) and approx[1] == 1
+    exact = np.nanmedian(data[:, 1:], axis=0)
+    tol = (np.nanmax(data[:, 1:], axis=0)
+           - np.nanmin(data[:, 1:], axis=0)) / 1024
+    assert np.all(np.abs(approx[1:] - exact) <= tol + 1e-12)
+
+    with pytest.raises(ValueError):
+        stats.get_mad_outliers(data, chunk_size=0)
+
+
 def test_gen_rotation():
     # make a few rotations (some same / different)
     rout1, lout1 = stats._gen_rotation(seed=1234)
@@ -126,7 +878,43 @@ def _get_sphere_coords(s, t, r=1):
     return x, y, z
 
 
-def test_gen_spinsamples():
+def test_vasa_assign():
+    rs = np.random.RandomState(1234)
+    for dist in (rs.rand(50, 50), rs.randint(5, size=(50, 50)).astype(float)):
+        # brute-force assignment, re-scanning the whole matrix for every node
+        expected, temp = np.zeros(len(dist), dtype=int), dist.copy()
+        for _ in range(len(dist)):
+            row = temp.min(axis=1).argmax()
+            expected[row] = temp[row].argmin()
+            temp[row], temp[:, expected[row]] = -np.inf, np.inf
+
+        order = np.argsort(dist, axis=1, kind='stable')
+        col = stats._vasa_assign(order, np.take_along_axis(dist, order, 1))
+        assert np.all(col == expected)
+
+
+@pytest.mark.skipif(not stats.use_numba, reason='numba is not installed')
+def test_vasa_assign_numba(monkeypatch):
+    rs = np.random.RandomState(1234)
+    for dist in (rs.rand(200, 200), rs.randint(5, size=(200, 200)) * 1.0):
+        # compiled assignment should match the pure Python implementation
+        order = np.argsort(dist, axis=1, kind='stable')
+        sdist = np.take_along_axis(dist, order, 1)
+        col = stats._vasa_assign(order, sdist)
+        assert np.all(col == stats._vasa_assign.py_func(order, sdist))
+    assert len(stats._vasa_assign.signatures) > 0
+
+    # ... including when used to generate spins
+    coords = rs.normal(size=(100, 3))
+    hemi = np.repeat([0, 1], 50)
+    spins = stats.gen_spinsamples(coords, hemi, n_rotate=10, method='vasa',
+                                  seed=1234)
+    monkeypatch.setattr(stats, '_vasa_assign', stats._vasa_assign.py_func)
+    assert np.all(spins == stats.gen_spinsamples(coords, hemi, n_rotate=10,
+                                                 method='vasa', seed=1234))
+
+
+def test_gen_spinsamples(tmp_path, monkeypatch):
     # grab a few points from a spherical surface and duplicate it for the
     # "other hemisphere"
     coords = [_get_sphere_coords(s, t, r=1) for s, t in
@@ -140,7 +928,7 @@ def test_gen_spinsamples():
     assert spins.shape == spins.shape == (len(coords), 10)
 
     # confirm that `method` parameter functions as desired
-    for method in ['vasa', 'hungarian']:
+    for method in ['vasa', 'hungarian', 'sparse_hungarian']:
         spin_exact, cost_exact = stats.gen_spinsamples(coords, hemi,
                                                        n_rotate=10, seed=1234,
                                                        method=method,
@@ -149,6 +937,33 @@ def test_gen_spinsamples():
         for s in spin_exact.T:
             assert len(np.unique(s)) == len(s)
 
+    # sparse Hungarian spins can't have a lower total cost than dense ones
+    # (the rotations are the same), and are identical in cost when enough
+    # neighbors are considered
+    dense, sparse = [
+        stats.gen_spinsamples(coords, hemi, n_rotate=10, seed=1234,
+                              method=method, return_cost=True)[1].sum(axis=0)
+        for method in ('hungarian', 'sparse_hungarian')
+    ]
+    assert np.all(sparse >= dense - 1e-8)
+    with monkeypatch.context() as mp:
+        mp.setattr(stats, '_SPIN_NEIGHBORS', 40)
+        sparse = stats.gen_spinsamples(coords, hemi, n_rotate=10, seed=1234,
+                                       method='sparse_hungarian',
+                                       return_cost=True)[1].sum(axis=0)
+    assert np.allclose(sparse, dense)
+
+    # ... but the restriction to nearby neighbors makes them approximate
+    rs = np.random.RandomState(1234)
+    sphere = rs.normal(size=(100, 3))
+    sphere /= np.linalg.norm(sphere, axis=1, keepdims=True)
+    dense, sparse = [
+        stats.gen_spinsamples(sphere, np.zeros(100), n_rotate=10, seed=1234,
+                              method=method, return_cost=True)[1].sum(axis=0)
+        for method in ('hungarian', 'sparse_hungarian')
+    ]
+    assert np.all(sparse >= dense - 1e-8) and np.any(sparse > dense + 1e-2)
+
     # check that one hemisphere works
     mask = hemi == 0
     spins, cost = stats.gen_spinsamples(coords[mask], hemi[mask], n_rotate=10,
@@ -162,6 +977,73 @@ def test_gen_spinsamples():
         i = [0, 1, -2, -1]  # only grab a few coordinates
         stats.gen_spinsamples(coords[i], hemi[i], n_rotate=36, seed=1234)
 
+    # all 15 unique spins of these coordinates are found even if every spin
+    # shares the same digest (i.e., the digest only narrows the comparison)
+    i = [0, 1, -2, -1]
+    spins = stats.gen_spinsamples(coords[i], hemi[i], n_rotate=15, seed=1234)
+    assert np.unique(spins, axis=1).shape[1] == 15
+    with monkeypatch.context() as mp:
+        mp.setattr(stats, '_spin_digest', lambda resampled: b'')
+        spin_digest = stats.gen_spinsamples(coords[i], hemi[i], n_rotate=15,
+                                            seed=1234)
+    assert np.all(spin_digest == spins)
+
+    # ... including those generated before resuming from a checkpoint
+    checkpoint = tmp_path / 'checkpoint.npz'
+    with monkeypatch.context() as mp:
+        _interrupt_checkpoints(mp, 8)
+        with pytest.raises(KeyboardInterrupt):
+            stats.gen_spinsamples(coords[i], hemi[i], n_rotate=15, seed=1234,
+                                  checkpoint=checkpoint)
+    spin_ckpt = stats.gen_spinsamples(coords[i], hemi[i], n_rotate=15,
+                                      seed=1234, checkpoint=checkpoint)
+    assert np.all(spin_ckpt == spins)
+
+    # resuming from a checkpoint yields the same spins
+    checkpoint = tmp_path / 'checkpoint.npz'
+    spins, cost = stats.gen_spinsamples(coords, hemi, n_rotate=10, seed=1234,
+                                        return_cost=True)
+    with monkeypatch.context() as mp:
+        _interrupt_checkpoints(mp, 4)
+        with pytest.raises(KeyboardInterrupt):
+            stats.gen_spinsamples(coords, hemi, n_rotate=10, seed=1234,
+                                  checkpoint=checkpoint)
+    with pytest.raises(ValueError):
+        stats.gen_spinsamples(coords, hemi, n_rotate=10, seed=1,
+                              checkpoint=checkpoint)
+    spin_ckpt, cost_ckpt = stats.gen_spinsamples(coords, hemi, n_rotate=10,
+                                                 seed=1234, return_cost=True,
+                                                 checkpoint=checkpoint)
+    assert np.all(spin_ckpt == spins) and np.all(cost_ckpt == cost)
+    assert not list(tmp_path.iterdir())
+
+    # results should not depend on the number of processes (if any)
+    for method in ['original', 'hungarian']:
+        spin1, cost1 = stats.gen_spinsamples(coords, hemi, n_rotate=150,
+                                             seed=1234, method=method,
+                                             return_cost=True)
+        for n_jobs in [1, 2]:
+            spin2, cost2 = stats.gen_spinsamples(coords, hemi, n_rotate=150,
+                                                 seed=1234, method=method,
+                                                 return_cost=True,
+                                                 n_jobs=n_jobs)
+            assert np.all(spin1 == spin2) and np.all(cost1 == cost2)
+        assert np.unique(spin1, axis=1).shape[1] == 150
+    with pytest.warns(UserWarning):
+        stats.gen_spinsamples(coords[i], hemi[i], n_rotate=36, seed=1234,
+                              n_jobs=2)
+
+    # ... or on whether they were resumed from a checkpoint
+    with monkeypatch.context() as mp:
+        _interrupt_checkpoints(mp, 120)
+        with pytest.raises(KeyboardInterrupt):
+            stats.gen_spinsamples(coords, hemi, n_rotate=150, seed=1234,
+                                  method='hungarian', checkpoint=checkpoint)
+    spin_ckpt = stats.gen_spinsamples(coords, hemi, n_rotate=150, seed=1234,
+                                      method='hungarian', n_jobs=2,
+                                      checkpoint=checkpoint)
+    assert np.all(spin_ckpt == spin1)
+
     # non-3D coords
     with pytest.raises(ValueError):
         stats.gen_spinsamples(coords[:, :2], hemi)
@@ -24,6 +24,41 @@ def test_add_triu():
     assert np.all(utils.get_triu(arr, k=0) == np.array([0, 1, 2, 4, 5, 8]))
 
 
+def test_checkpoint(tmp_path, monkeypatch):
+    monkeypatch.setattr(utils, '_CHECKPOINT_INTERVAL', 0)
+    path = tmp_path / 'checkpoint.npz'
+    spins = np.arange(40).reshape(4, 10)
+    spun = np.random.RandomState(1234).rand(4, 10)
+
+    checkpoint = utils._Checkpoint(path, 'test', spins)
+    assert checkpoint.load() is None
+    for n in range(1, 4):
+        checkpoint.save(done=n, columns=dict(spins=spins, spun=spun[:, :n]))
+
+    # resuming restores all columns but writes neither the unchanged array
+    # nor the previously saved columns again
+    written, save = [], np.save
+    monkeypatch.setattr(np, 'save', lambda file, arr: (written.append(arr),
+                                                       save(file, arr)))
+    checkpoint = utils._Checkpoint(path, 'test', spins)
+    state = checkpoint.load()
+    assert state['done'] == 3 and np.all(state['spins'] == spins)
+    assert np.all(state['spun'] == spun[:, :3])
+    for n in range(4, 11):
+        checkpoint.save(done=n, columns=dict(spins=state['spins'],
+                                             spun=spun[:, :n]))
+    assert len(written) == 7
+    assert all(np.all(arr == spun[:, [n]]) for n, arr in enumerate(written, 3))
+
+    state = utils._Checkpoint(path, 'test', spins).load()
+    assert state['done'] == 10 and np.all(state['spun'] == spun)
+    with pytest.raises(ValueError):
+        utils._Checkpoint(path, 'other').load()
+
+    checkpoint.remove()
+    assert not list(tmp_path.iterdir())
+
+
 @pytest.mark.parametrize('scale, expected', [
     ('scale033', 83),
     ('scale060', 129),
@@ -4,13 +4,21 @@ Miscellaneous functions of various utility
 """
 
 import glob
+import hashlib
 import os
 import subprocess
+import time
 
+from joblib import Parallel, delayed
 import nibabel as nib
 import numpy as np
 from scipy import ndimage
-from sklearn.utils.validation import check_array
+from sklearn.utils.validation import check_array, check_random_state
+
+# minimum number of seconds between saves of a checkpoint
+_CHECKPOINT_INTERVAL = 60
+# number of permutations per independent random stream when run in parallel
+_PERM_CHUNK = 100
 
 
 def add_constant(data):
@@ -250,3 +258,258 @@ def get_centroids(img, labels=None, image_space=False):
         centroids = nib.affines.apply_affine(img.affine, centroids)
 
     return centroids
+
+
+def _float_dtype(*dtypes):
+    """
+    Returns floating point dtype in which data of `dtypes` should be processed
+
+    Floating point inputs retain their (promoted) precision such that, e.g.,
+    single precision data is not needlessly converted to double precision;
+    all other inputs (e.g., integers) are processed in double precision.
+    """
+
+    dtype = np.result_type(*dtypes)
+    if not np.issubdtype(dtype, np.floating):
+        dtype = np.dtype(np.float64)
+
+    return dtype
+
+
+def _checkpoint_key(*args):
+    """
+    Returns a hash identifying a computation from its inputs `args`
+
+    Random states (including those nested in lists, tuples, or dictionaries)
+    are ignored, since resuming a computation restores their state from the
+    checkpoint
+    """
+
+    key = hashlib.blake2b(digest_size=16)
+    for arg in args:
+        if isinstance(arg, np.random.RandomState):
+            arg = 'RandomState'
+        elif isinstance(arg, dict):
+            arg = ('dict', _checkpoint_key(*sum(sorted(arg.items()), ())))
+        elif isinstance(arg, (list, tuple)):
+            arg = (type(arg).__name__, _checkpoint_key(*arg))
+        if isinstance(arg, np.ndarray):
+            arg = np.ascontiguousarray(arg)
+            key.update(repr((arg.dtype.str, arg.shape)).encode())
+            key.update(memoryview(arg).cast('B'))
+        else:
+            key.update(repr(arg).encode())
+
+    return key.hexdigest()
+
+
+def _get_random_state(rs):
+    """
+    Returns state of random state `rs` as a dictionary of arrays
+    """
+
+    _, keys, pos, has_gauss, gauss = rs.get_state()
+
+    return dict(rng_keys=keys, rng_pos=pos, rng_has_gauss=has_gauss,
+                rng_gauss=gauss)
+
+
+def _set_random_state(rs, state):
+    """
+    Restores random state `rs` from `state` returned by `_get_random_state`
+    """
+
+    rs.set_state(('MT19937', state['rng_keys'], int(state['rng_pos']),
+                  int(state['rng_has_gauss']), float(state['rng_gauss'])))
+
+
+class _Checkpoint:
+    """
+    Periodically saves the state of a long-running computation to disk
+
+    Parameters
+    ----------
+    path : str or os.PathLike
+        Filepath where the checkpoint should be saved
+    args
+        Inputs to the computation. If an existing checkpoint at `path` was
+        generated by a computation with different inputs an error is raised
+        when it is loaded
+    """
+
+    def __init__(self, path, *args):
+        self.path = os.fspath(path)
+        self.key = _checkpoint_key(*args)
+        self._last = time.monotonic()
+        # number of chunks + columns saved so far for each array in `columns`
+        self._chunks, self._columns = {}, {}
+
+    def extend(self, *args):
+        """
+        Adds `args` to the inputs identifying the computation
+
+        For inputs that are only determined once the computation has started
+        (e.g., the effective batch size). Must be called before :meth:`load`
+        """
+
+        self.key = _checkpoint_key(self.key, *args)
+
+    def _chunk_path(self, name, index):
+        """
+        Returns filepath of the `index`-th chunk of columns of array `name`
+        """
+
+        return '{}.{}.{}.npy'.format(self.path, name, index)
+
+    def load(self):
+        """
+        Returns saved state as a dictionary, or None if there is no checkpoint
+        """
+
+        if not os.path.exists(self.path):
+            return None
+
+        with np.load(self.path) as data:
+            if str(data['key']) != self.key:
+                raise ValueError('Checkpoint {} was generated with different '
+                                 'inputs. Please remove it or specify a '
+                                 'different checkpoint.'.format(self.path))
+            names, chunks = data['column_names'], data['column_chunks']
+            state = {k: data[k] for k in data.files
+                     if k not in ('key', 'column_names', 'column_chunks')}
+
+        # arrays saved as columns are stored in chunks; merge them
+        for name, n_chunks in zip(names.tolist(), chunks.tolist()):
+            state[name] = np.concatenate([
+                np.load(self._chunk_path(name, n)) for n in range(n_chunks)
+            ], axis=-1)
+            self._chunks[name] = n_chunks
+            self._columns[name] = state[name].shape[-1]
+
+        return state
+
+    def save(self, force=False, columns=None, **state):
+        """
+        Saves `state` if at least `_CHECKPOINT_INTERVAL` seconds have elapsed
+        since the last save (or if `force` is True)
+
+        Arrays in `columns` are only ever extended along their last axis (or
+        not at all), so only the columns added since they were last saved are
+        written (each time to a new file) and are merged when loaded
+        """
+
+        if not force and time.monotonic() - self._last < _CHECKPOINT_INTERVAL:
+            return
+
+        # write to a temporary file first so the checkpoint is never corrupted.
+        # new chunks are written before the checkpoint that refers to them
+        for name, arr in (columns or {}).items():
+            if arr is None or arr.shape[-1] == self._columns.get(name, 0):
+                continue
+            index = self._chunks.get(name, 0)
+            temp = self._chunk_path(name, index) + '.tmp'
+            with open(temp, 'wb') as dest:
+                np.save(dest, arr[..., self._columns.get(name, 0):])
+            os.replace(temp, self._chunk_path(name, index))
+            self._chunks[name], self._columns[name] = index + 1, arr.shape[-1]
+
+        state = {k: v for k, v in state.items() if v is not None}
+        temp = self.path + '.tmp'
+        with open(temp, 'wb') as dest:
+            np.savez(dest, key=self.key,
+                     column_names=np.array(list(self._chunks), dtype=str),
+                     column_chunks=np.array(list(self._chunks.values()),
+                                            dtype=int),
+                     **state)
+        os.replace(temp, self.path)
+        self._last = time.monotonic()
+
+    def remove(self):
+        """
+        Removes the checkpoint (i.e., once the computation has finished)
+        """
+
+        for name in self._chunks:
+            pattern = '{}.{}.*.npy'.format(glob.escape(self.path), name)
+            for chunk in glob.glob(pattern):
+                os.remove(chunk)
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def _spawn_random_states(seed, n_streams):
+    """
+    Returns `n_streams` independent random states spawned from `seed`
+
+    Parameters
+    ----------
+    seed : {int, np.random.RandomState instance, None}
+        Seed for random number generation. If a RandomState instance, a single
+        integer is drawn from it to seed the spawned streams
+    n_streams : int
+        Number of random states to generate
+
+    Returns
+    -------
+    states : list of np.random.RandomState
+        Random states with statistically independent streams
+    """
+
+    if isinstance(seed, np.random.RandomState):
+        seed = seed.randint(np.iinfo(np.int32).max)
+    children = np.random.SeedSequence(seed).spawn(n_streams)
+
+    return [np.random.RandomState(np.random.MT19937(ss)) for ss in children]
+
+
+def _chunk_bounds(n_perm):
+    """
+    Returns boundaries of the fixed-size chunks into which `n_perm` is split
+    """
+
+    return list(range(0, max(n_perm, 1), _PERM_CHUNK)) + [n_perm]
+
+
+def _parallel_permutations(func, n_perm, seed=None, n_jobs=None,
+                           chunks=None):
+    """
+    Runs `func` on chunks of `n_perm` permutations, optionally in parallel
+
+    Parameters
+    ----------
+    func : callable
+        Function accepting arguments `(rs, start, stop)` and returning some
+        summary of permutations `start` through `stop` generated from the
+        random state `rs`
+    n_perm : int
+        Total number of permutations
+    seed : {int, np.random.RandomState instance, None}, optional
+        Seed for random number generation. Default: None
+    n_jobs : int, optional
+        Number of processes to use. If neither this nor `chunks` is specified
+        all permutations are run as a single chunk in the current process with
+        the random state given by `seed`. Otherwise, permutations are split
+        into chunks of fixed size that are each assigned an independent random
+        stream, such that the results do not depend on `n_jobs`. Default: None
+    chunks : array_like, optional
+        Indices of the chunks to run. If not specified all chunks are run.
+        Default: None
+
+    Returns
+    -------
+    results : list
+        Output of `func` for each chunk, in order
+    """
+
+    if n_jobs is None and chunks is None:
+        return [func(check_random_state(seed), 0, n_perm)]
+
+    # chunks are a fixed size so the streams do not depend on `n_jobs`
+    bounds = _chunk_bounds(n_perm)
+    states = _spawn_random_states(seed, len(bounds) - 1)
+    if chunks is None:
+        chunks = range(len(states))
+
+    return Parallel(n_jobs=1 if n_jobs is None else n_jobs)(
+        delayed(func)(states[k], bounds[k], bounds[k + 1]) for k in chunks
+    )